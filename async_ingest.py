@@ -0,0 +1,262 @@
+"""
+asyncio ingest: scene video and gaze are consumed as two independent streams.
+
+Each stream feeds its own bounded drop-oldest buffer. Frames are decoded and
+run through detection in a single-thread executor, while gaze is mapped on
+the event loop as soon as it arrives, so the gaze rate never depends on how
+long decoding and detection take.
+
+AsyncPipeline has the same start/stop/stop_event/results surface as
+pipeline.Pipeline and runs the event loop on its own thread.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import threading
+
+import latency
+import pipeline
+import screen_processing
+
+SceneFrame = collections.namedtuple('SceneFrame', 'bgr_pixels timestamp_unix_seconds timestamp_unix_ns')
+
+
+def put_drop_oldest(queue, item):
+    """Puts into a bounded asyncio.Queue without waiting. Returns True if the oldest item was dropped."""
+    dropped = queue.full()
+    if dropped:
+        queue.get_nowait()
+        queue.task_done()
+    queue.put_nowait(item)
+    return dropped
+
+
+def as_scene_frame(frame):
+    """Converts a frame of the async API (decoded lazily) to the bgr_pixels form the detectors use."""
+    if hasattr(frame, "bgr_pixels"):
+        return frame
+    ts = latency.device_timestamp_ns(frame)
+    return SceneFrame(frame.bgr_buffer(), ts / 1e9, ts)
+
+
+async def discover_device_streams(search_seconds=5):
+    """
+    Finds a Neon with the async realtime API.
+    Returns (device, video stream, gaze stream), or None if no device was found.
+    """
+    from pupil_labs.realtime_api import Device, Network, receive_gaze_data, receive_video_frames
+
+    print("Attempting to discover Pupil Labs Neon device...")
+    async with Network() as network:
+        device_info = await network.wait_for_new_device(timeout_seconds=search_seconds)
+    if device_info is None:
+        return None
+    device = Device.from_discovered_device(device_info)
+    status = await device.get_status()
+    gaze_sensor = status.direct_gaze_sensor()
+    world_sensor = status.direct_world_sensor()
+    if not gaze_sensor.connected or not world_sensor.connected:
+        await device.close()
+        print("Error: Neon gaze or scene camera sensor is not connected.")
+        return None
+    print(f"Connected to device: {status.phone.device_name} (async ingest)")
+    return (device,
+            receive_video_frames(world_sensor.url, run_loop=True),
+            receive_gaze_data(gaze_sensor.url, run_loop=True))
+
+
+async def blocking_device_stream(receive, stop_event, timeout_seconds=0.5):
+    """
+    Async stream over a blocking receive_* method of a simple-API device
+    (e.g. recording.ReplayDevice), polled on a worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    # A dedicated thread per stream, so one blocking stream never waits behind the other
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        while not stop_event.is_set():
+            item = await loop.run_in_executor(executor, lambda: receive(timeout_seconds=timeout_seconds))
+            if item is not None:
+                yield item
+            elif getattr(receive.__self__, "finished", False):
+                return
+
+
+class AsyncPipeline:
+    """
+    Video -> detect and gaze -> map/send, as concurrent asyncio tasks.
+    device: optional simple-API device; without one the device is discovered
+    with the async realtime API once the loop starts.
+    frame_buffer / gaze_buffer: sizes of the drop-oldest stream buffers.
+    homography_state, corner_filter, max_gaze_delay_ns: as for pipeline.Pipeline.
+    """
+    def __init__(self, gaze_sender, detector=screen_processing.detect_screen_corners, scene_gate=None,
+                 tracer=None, device=None, frame_buffer=1, gaze_buffer=1024, homography_state=None,
+                 corner_filter=None, max_gaze_delay_ns=50_000_000):
+        self.stop_event = threading.Event()
+        self.results = pipeline.LatestValueQueue(maxsize=1)
+        self.homography_state = homography_state or pipeline.HomographyHistory()
+        self.scene_gate = scene_gate
+        self.tracer = tracer
+        self.device = device
+        self.frame_buffer = frame_buffer
+        self.gaze_buffer = gaze_buffer
+        # The threaded workers' per-item logic is reused; their threads are never started
+        self.detection = pipeline.DetectionWorker(None, self.homography_state, self.results, self.stop_event,
+                                                  detector=detector, scene_gate=scene_gate, tracer=tracer,
+                                                  corner_filter=corner_filter,
+                                                  on_frame_done=getattr(device, "frame_processed", None))
+        self.gaze = pipeline.GazeWorker(device, self.homography_state, gaze_sender, self.stop_event, tracer=tracer,
+                                        max_delay_ns=max_gaze_delay_ns)
+        self.frames_dropped = 0
+        self.gaze_dropped = 0
+        self._thread = threading.Thread(target=self._run_loop, name="AsyncIngest", daemon=True)
+
+    @property
+    def running(self):
+        return not self.stop_event.is_set()
+
+    def start(self):
+        self._thread.start()
+        print("Async pipeline started: video, detection and gaze tasks")
+
+    def stop(self, timeout=2.0):
+        self.stop_event.set()
+        self.results.close()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        print(f"Async pipeline stopped. Dropped frames: {self.frames_dropped}, dropped gaze: {self.gaze_dropped}")
+        if self.scene_gate is not None:
+            print(f"Scene-change gate: {self.scene_gate.hits} frames reused, "
+                  f"{self.scene_gate.misses} processed ({self.scene_gate.hit_rate:.0%} saved)")
+        if self.tracer is not None:
+            self.tracer.report()
+
+    def _run_loop(self):
+        try:
+            asyncio.run(self.run())
+        except Exception as e:
+            print(f"An error occurred in async ingest: {e}")
+        finally:
+            self.stop_event.set()
+
+    async def run(self):
+        async_device = None
+        if self.device is not None:
+            video_stream = blocking_device_stream(self.device.receive_scene_video_frame, self.stop_event)
+            gaze_stream = blocking_device_stream(self.device.receive_gaze_datum, self.stop_event)
+        else:
+            found = await discover_device_streams()
+            if found is None:
+                print("Error: Could not find Pupil Labs Neon device. Exiting.")
+                return
+            async_device, video_stream, gaze_stream = found
+            await self._estimate_clock_offset(async_device)
+
+        frame_queue = asyncio.Queue(self.frame_buffer)
+        gaze_queue = asyncio.Queue(self.gaze_buffer)
+        # One detection thread: the detector is stateful and frames are processed in order
+        executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="Detection")
+        tasks = [asyncio.create_task(self._pump_video(video_stream, frame_queue)),
+                 asyncio.create_task(self._pump_gaze(gaze_stream, gaze_queue)),
+                 asyncio.create_task(self._detect(frame_queue, executor)),
+                 asyncio.create_task(self._map_gaze(gaze_queue))]
+        stop_wait = asyncio.get_running_loop().run_in_executor(None, self.stop_event.wait)
+        streams_done = asyncio.gather(*tasks[:2])
+        drained = None
+        try:
+            # Returns when stop() is called or both streams have ended; raises if a task failed
+            await self._wait(streams_done, tasks, stop_wait)
+            if not stop_wait.done():
+                print("Device stream ended.")
+                # Process what is still buffered before stopping
+                drained = asyncio.gather(frame_queue.join(), gaze_queue.join())
+                await self._wait(drained, tasks, stop_wait)
+                self.gaze.flush_all()
+        finally:
+            self.stop_event.set()  # Also releases stop_wait
+            leftovers = [future for future in (*tasks, streams_done, drained) if future is not None]
+            for future in leftovers:
+                future.cancel()
+            await asyncio.gather(*leftovers, stop_wait, return_exceptions=True)
+            executor.shutdown(wait=True)
+            if async_device is not None:
+                await async_device.close()
+
+    async def _wait(self, future, tasks, stop_wait):
+        """
+        Waits until `future` is done or stop() is called. If one of the tasks
+        fails first, stops the pipeline and raises its error, like a failing
+        worker thread does.
+        """
+        while True:
+            for task in tasks:
+                if task.done() and not task.cancelled() and task.exception() is not None:
+                    self.stop_event.set()
+                    raise task.exception()
+            if future.done() or stop_wait.done():
+                return
+            running = [task for task in tasks if not task.done()]
+            await asyncio.wait([future, stop_wait, *running], return_when=asyncio.FIRST_COMPLETED)
+
+    async def _estimate_clock_offset(self, device):
+        if self.tracer is None:
+            return
+        from pupil_labs.realtime_api.time_echo import TimeOffsetEstimator
+
+        try:
+            # The async Device has no estimate_time_offset(); query the time echo service directly
+            status = await device.get_status()
+            if status.phone.time_echo_port is None:
+                print("Device does not support time echo; latencies assume synchronized clocks.")
+                return
+            estimate = await TimeOffsetEstimator(status.phone.ip, status.phone.time_echo_port).estimate()
+            self.tracer.clock_offset_ns = int(estimate.time_offset_ms.mean * 1e6)
+            print(f"Estimated device clock offset: {self.tracer.clock_offset_ns / 1e6:.2f} ms")
+        except Exception as e:
+            print(f"Could not estimate device clock offset ({e}); latencies assume synchronized clocks.")
+
+    async def _pump_video(self, stream, frame_queue):
+        async for frame in stream:
+            pipeline.FRAMES_RECEIVED.inc()
+            if put_drop_oldest(frame_queue, (frame, latency.LatencyTracer.now_ns())):
+                self.frames_dropped += 1
+                pipeline.FRAMES_DROPPED.inc()
+
+    async def _pump_gaze(self, stream, gaze_queue):
+        async for gaze in stream:
+            if put_drop_oldest(gaze_queue, (gaze, latency.LatencyTracer.now_ns())):
+                self.gaze_dropped += 1
+                pipeline.GAZE_OVERFLOWED.inc()
+
+    async def _detect(self, frame_queue, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            frame, received_ns = await frame_queue.get()
+            # Decoding and detection both run off the loop
+            await loop.run_in_executor(executor,
+                                       lambda: self.detection.process(as_scene_frame(frame), received_ns))
+            frame_queue.task_done()
+            self.gaze.flush()  # Gaze held back for this frame can go now
+
+    async def _map_gaze(self, gaze_queue):
+        while True:
+            # Map each sample as it arrives, together with any that queued up meanwhile
+            if self.gaze.pending:
+                # Not wait_for: on Python < 3.12 it can swallow a cancellation that races with the get
+                getter = asyncio.ensure_future(gaze_queue.get())
+                try:
+                    await asyncio.wait([getter], timeout=self.gaze.max_delay_ns / 1e9)
+                finally:
+                    getter.cancel()
+                if not getter.done() or getter.cancelled():
+                    self.gaze.flush()  # Samples held back for a bracketing frame that did not come
+                    continue
+                item = getter.result()
+            else:
+                item = await gaze_queue.get()
+            items = [item]
+            while not gaze_queue.empty():
+                items.append(gaze_queue.get_nowait())
+            self.gaze.process([gaze for gaze, _ in items], received_ns=[ns for _, ns in items])
+            for _ in items:
+                gaze_queue.task_done()
@@ -6,9 +6,21 @@ using UnityEngine;
 
 public class GazeReceiver : MonoBehaviour
 {
+    // v2 wire format (see gaze_sender_network.py): 20-byte header followed by `count` samples
+    const int HeaderSize = 20;
+    const int FullSampleSize = 28;
+    const int CompactSampleSize = 14;
+    const byte FlagCompact = 0x01;
+    const byte SampleFlagWorn = 0x01;
+    const byte SampleFlagClipped = 0x02;
+    const float CompactScale = 8.0f;
+
     UdpClient client;
     Thread receiveThread;
     volatile bool running;
+    uint? expectedSequence;
+    public long LostPackets { get; private set; }
+    public long ClippedSamples { get; private set; }  // Compact samples clamped to the fixed-point range
     public Action<double, float, float> OnGazeReceived;  // delegate or event to handle data
 
     void Start()
@@ -28,7 +40,11 @@ public class GazeReceiver : MonoBehaviour
             try
             {
                 byte[] data = client.Receive(ref anyIP);
-                if (data.Length >= 24)
+                if (data.Length >= HeaderSize && data[0] == (byte)'G' && data[1] == (byte)'Z' && data[2] == 2)
+                {
+                    ParseV2(data);
+                }
+                else if (data.Length >= 24)
                 {
                     // Parse binary data (little-endian double, float, float, float, float)
                     double ts = BitConverter.ToDouble(data, 0);
@@ -48,6 +64,54 @@ public class GazeReceiver : MonoBehaviour
         }
     }
 
+    void ParseV2(byte[] data)
+    {
+        byte flags = data[3];
+        uint sequence = BitConverter.ToUInt32(data, 4);
+        int count = BitConverter.ToUInt16(data, 8);
+        long baseTimestampNs = BitConverter.ToInt64(data, 12);
+        bool compact = (flags & FlagCompact) != 0;
+        int sampleSize = compact ? CompactSampleSize : FullSampleSize;
+        if (data.Length != HeaderSize + count * sampleSize)
+            return; // Truncated or malformed packet
+
+        if (expectedSequence.HasValue)
+        {
+            int gap = unchecked((int)(sequence - expectedSequence.Value));
+            if (gap < 0)
+                return; // Late packet, newer samples were already delivered
+            LostPackets += gap;
+        }
+        expectedSequence = unchecked(sequence + 1);
+
+        for (int i = 0; i < count; i++)
+        {
+            int offset = HeaderSize + i * sampleSize;
+            double ts;
+            float screenX, screenY;
+            byte sampleFlags;
+            if (compact)
+            {
+                ts = baseTimestampNs + (long)BitConverter.ToUInt32(data, offset) * 1000L;
+                screenX = BitConverter.ToInt16(data, offset + 8) / CompactScale;
+                screenY = BitConverter.ToInt16(data, offset + 10) / CompactScale;
+                sampleFlags = data[offset + 12];
+            }
+            else
+            {
+                ts = BitConverter.ToInt64(data, offset);
+                screenX = BitConverter.ToSingle(data, offset + 16);
+                screenY = BitConverter.ToSingle(data, offset + 20);
+                sampleFlags = data[offset + 24];
+            }
+            if ((sampleFlags & SampleFlagClipped) != 0)
+                ClippedSamples++;
+            if ((sampleFlags & SampleFlagWorn) == 0)
+                continue; // Glasses not worn: the gaze point is meaningless
+            OnGazeReceived?.Invoke(screenX, screenY, ts);
+        }
+    }
+
     void OnDestroy()
     {
         running = false;
@@ -0,0 +1,337 @@
+"""
+Offline batch mapping of recorded gaze onto the screen.
+
+Scene frames are split into chunks of frame indices, screen detection runs
+on a process pool (each worker decodes its own chunk and runs one
+IncrementalScreenDetector on it) and the chunks' homographies are
+reassembled in order. Each gaze sample is mapped with the homography of the
+frame nearest to it in time and streamed to the output, so memory stays
+bounded by the number of chunks in flight, not by the recording length.
+
+Inputs:
+  - a scene video plus its frame timestamps (e.g. Pupil Cloud's
+    world_timestamps.csv) and a gaze CSV (e.g. gaze.csv), or
+  - a recording directory written by recording.py.
+
+Usage:
+  python batch_mapper.py scene.mp4 --frame-timestamps world_timestamps.csv --gaze gaze.csv -o mapped.csv
+  python batch_mapper.py REC_DIR -o mapped.bin
+"""
+import argparse
+import collections
+import concurrent.futures
+import csv
+import os
+import time
+
+import cv2
+import numpy as np
+
+import homography
+import recording
+import screen_processing
+
+# Binary output records (.bin); the CSV output has the same columns
+OUTPUT_DTYPE = np.dtype([('timestamp_ns', '<i8'), ('frame_index', '<i4'), ('gaze_x', '<f4'), ('gaze_y', '<f4'),
+                         ('screen_x', '<f4'), ('screen_y', '<f4'), ('worn', 'u1'), ('valid', 'u1')])
+GAZE_BLOCK_SIZE = 8192
+# Frames per task: enough to amortise the seek to the previous keyframe of a video
+DEFAULT_CHUNK_SIZE = 256
+# Samples further than this from every frame are invalid, like beyond the live HomographyHistory's hold
+MAX_HOLD_NS = 70_000_000
+
+# Column names of Pupil Cloud CSV exports
+TIMESTAMP_COLUMN = "timestamp [ns]"
+GAZE_X_COLUMN = "gaze x [px]"
+GAZE_Y_COLUMN = "gaze y [px]"
+WORN_COLUMN = "worn"
+
+
+# --- Worker side ---
+_worker_params = None
+_worker_recordings = {}  # Recording directory -> frames memmap, opened once per worker
+
+
+def _init_worker(params):
+    global _worker_params
+    _worker_params = params
+    cv2.setNumThreads(1)  # The pool already uses every core
+
+
+def _open_video_at(path, start):
+    """
+    Opens the video positioned on frame `start`. Seeking is not frame-accurate
+    for every codec and container (e.g. H.264 or variable frame rate MP4), so
+    if the capture does not report the requested position the frames before
+    it are decoded and skipped instead.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video {path}")
+    if start == 0:
+        return capture
+    if capture.set(cv2.CAP_PROP_POS_FRAMES, start) and int(capture.get(cv2.CAP_PROP_POS_FRAMES)) == start:
+        return capture
+    capture.release()
+    capture = cv2.VideoCapture(path)
+    for _ in range(start):
+        if not capture.grab():
+            break
+    return capture
+
+
+def _read_chunk(path, start, stop):
+    """Yields frames start..stop-1 of a recording directory (from its memmap) or a video file."""
+    if os.path.isdir(path):
+        if path not in _worker_recordings:
+            _worker_recordings[path] = recording.load_frames(path)[0]
+        yield from _worker_recordings[path][start:stop]
+        return
+    capture = _open_video_at(path, start)
+    try:
+        for _ in range(start, stop):
+            ok, frame = capture.read()
+            if not ok:
+                break  # Fewer frames than timestamps
+            yield frame
+    finally:
+        capture.release()
+
+
+def _detect_chunk(chunk, scale):
+    """
+    chunk: (recording directory or video path, start, stop).
+    Returns (N, 3, 3) homographies for the frames decoded, NaN where no screen was found.
+    """
+    detector = screen_processing.IncrementalScreenDetector(
+        scale=scale, context=screen_processing.DetectorContext(**(_worker_params or {})))
+    H_matrices = []
+    for frame in _read_chunk(*chunk):
+        corners = detector(frame)
+        H_matrices.append(np.full((3, 3), np.nan) if corners is None else homography.solve_homography_4pt(corners))
+    return np.array(H_matrices, dtype=np.float64).reshape(-1, 3, 3)
+
+
+# --- Inputs ---
+def read_timestamp_csv(path, column=TIMESTAMP_COLUMN):
+    with open(path, newline="") as f:
+        return np.array([int(row[column]) for row in csv.DictReader(f)], dtype=np.int64)
+
+
+def parse_worn(value):
+    """CSV worn value: a number ("1", "0", "0.0", ...) or true/false; empty means not worn."""
+    value = value.strip().lower()
+    if value in ("true", "false"):
+        return value == "true"
+    return bool(value) and float(value) != 0
+
+
+def iter_gaze_csv(path):
+    """Yields gaze blocks as recording.GAZE_DTYPE arrays."""
+    block = np.empty(GAZE_BLOCK_SIZE, dtype=recording.GAZE_DTYPE)
+    n = 0
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            block[n] = (int(row[TIMESTAMP_COLUMN]), float(row[GAZE_X_COLUMN]), float(row[GAZE_Y_COLUMN]),
+                        parse_worn(row.get(WORN_COLUMN, "1")))
+            n += 1
+            if n == GAZE_BLOCK_SIZE:
+                yield block.copy()
+                n = 0
+    if n:
+        yield block[:n].copy()
+
+
+def iter_gaze_array(gaze):
+    for start in range(0, len(gaze), GAZE_BLOCK_SIZE):
+        yield np.asarray(gaze[start:start + GAZE_BLOCK_SIZE])
+
+
+def iter_chunks(path, frame_count, chunk_size):
+    """Yields (path, start, stop) tasks; workers decode the frames themselves, so no pixels are pickled."""
+    for start in range(0, frame_count, chunk_size):
+        yield path, start, min(start + chunk_size, frame_count)
+
+
+# --- Output ---
+class CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(OUTPUT_DTYPE.names)
+
+    def write(self, records):
+        self.writer.writerows(records.tolist())
+
+    def close(self):
+        self.file.close()
+
+
+class BinaryWriter:
+    """Raw OUTPUT_DTYPE records, readable with np.fromfile(path, batch_mapper.OUTPUT_DTYPE)."""
+    def __init__(self, path):
+        self.file = open(path, "wb")
+
+    def write(self, records):
+        self.file.write(records.tobytes())
+
+    def close(self):
+        self.file.close()
+
+
+class GazeStream:
+    """Hands out gaze samples in timestamp order, up to a given timestamp."""
+    def __init__(self, blocks):
+        self.blocks = iter(blocks)
+        self.pending = np.empty(0, dtype=recording.GAZE_DTYPE)
+
+    def take_until(self, end_ns):
+        """Returns every remaining sample with a timestamp < end_ns."""
+        parts = []
+        while True:
+            split = int(np.searchsorted(self.pending['timestamp_ns'], end_ns))
+            parts.append(self.pending[:split])
+            self.pending = self.pending[split:]
+            if len(self.pending):
+                break
+            block = next(self.blocks, None)
+            if block is None:
+                break
+            self.pending = block
+        return np.concatenate(parts)
+
+
+def map_chunk_gaze(gaze, H_matrices, frame_timestamps, first_frame, max_hold_ns=MAX_HOLD_NS):
+    """
+    Maps gaze with the homography of the nearest frame of this chunk.
+    Samples more than max_hold_ns away from that frame are marked invalid.
+    """
+    records = np.zeros(len(gaze), dtype=OUTPUT_DTYPE)
+    if not len(gaze):
+        return records
+    ts = gaze['timestamp_ns']
+    nearest = np.searchsorted(frame_timestamps, ts).clip(1, max(1, len(frame_timestamps) - 1))
+    if len(frame_timestamps) > 1:
+        nearest -= (ts - frame_timestamps[nearest - 1]) <= (frame_timestamps[nearest] - ts)
+    else:
+        nearest[:] = 0
+
+    H = H_matrices[nearest]
+    points = np.stack([gaze['x'], gaze['y'], np.ones(len(gaze))], axis=1)
+    mapped = np.einsum('nij,nj->ni', H, points)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        screen_xy = mapped[:, :2] / mapped[:, 2:]
+
+    records['timestamp_ns'] = ts
+    records['frame_index'] = first_frame + nearest
+    records['gaze_x'], records['gaze_y'] = gaze['x'], gaze['y']
+    records['screen_x'], records['screen_y'] = screen_xy[:, 0], screen_xy[:, 1]
+    records['worn'] = gaze['worn']
+    records['valid'] = np.isfinite(screen_xy).all(axis=1) & (np.abs(ts - frame_timestamps[nearest]) <= max_hold_ns)
+    return records
+
+
+def run(chunks, frame_timestamps, gaze_blocks, writer, workers=None, params=None, scale=0.5,
+        max_hold_ns=MAX_HOLD_NS):
+    """
+    Detects the screen in every chunk on a process pool and writes the mapped gaze.
+    chunks: iterable of (recording directory or video path, start, stop) tuples, in order.
+    At most 2 * workers chunks are in flight, which bounds memory.
+    """
+    workers = workers or os.cpu_count() or 1
+    gaze = GazeStream(gaze_blocks)
+    pending = collections.deque()
+    first_frame = 0
+    frames_done = gaze_done = found = 0
+    start_time = time.monotonic()
+    next_report = start_time + 10.0
+
+    def write_next():
+        nonlocal first_frame, frames_done, gaze_done, found
+        H_matrices = pending.popleft().result()  # Oldest chunk first: results come back in order
+        n = len(H_matrices)
+        chunk_ts = frame_timestamps[first_frame:first_frame + n]
+        H_matrices = H_matrices[:len(chunk_ts)]  # Frames beyond the last timestamp cannot be matched
+        if len(chunk_ts):
+            # Samples up to midway to the next chunk's first frame belong to this chunk
+            is_last = first_frame + n >= len(frame_timestamps)
+            end_ns = np.iinfo(np.int64).max if is_last else (chunk_ts[-1] + frame_timestamps[first_frame + n]) // 2
+            records = map_chunk_gaze(gaze.take_until(end_ns), H_matrices, chunk_ts, first_frame, max_hold_ns)
+        else:
+            records = np.zeros(0, dtype=OUTPUT_DTYPE)
+        writer.write(records)
+        first_frame += n
+        frames_done += n
+        gaze_done += len(records)
+        found += int(np.isfinite(H_matrices[:, 0, 0]).sum())
+
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(params,)) as pool:
+        for chunk in chunks:
+            pending.append(pool.submit(_detect_chunk, chunk, scale))
+            if len(pending) >= 2 * workers:
+                write_next()
+                if time.monotonic() >= next_report:
+                    next_report += 10.0
+                    print(f"  {frames_done} frames, {gaze_done} gaze samples "
+                          f"({frames_done / (time.monotonic() - start_time):.1f} frames/s)")
+        while pending:
+            write_next()
+
+    elapsed = time.monotonic() - start_time
+    print(f"Mapped {gaze_done} gaze samples over {frames_done} frames in {elapsed:.1f} s "
+          f"({frames_done / max(elapsed, 1e-9):.1f} frames/s, screen found in {found} frames)")
+    return frames_done, gaze_done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Map recorded gaze onto the screen using all cores.")
+    parser.add_argument("input", help="Scene video file, or a recording directory from recording.py.")
+    parser.add_argument("-o", "--output", required=True, help="Output file: .csv, otherwise raw binary records.")
+    parser.add_argument("--frame-timestamps", dest="frame_timestamps",
+                        help=f"CSV with a '{TIMESTAMP_COLUMN}' column per video frame (video input only).")
+    parser.add_argument("--gaze", help=f"Gaze CSV with '{TIMESTAMP_COLUMN}', '{GAZE_X_COLUMN}', '{GAZE_Y_COLUMN}' "
+                                       f"and optionally '{WORN_COLUMN}' columns (default: the recording's gaze).")
+    parser.add_argument("--params", help="JSON file with the detection parameters (see DetectorContext.load_params).")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: all cores).")
+    parser.add_argument("--chunk-size", dest="chunk_size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"Frames per task (default {DEFAULT_CHUNK_SIZE}).")
+    parser.add_argument("--scale", type=float, default=0.5, help="Detection pyramid scale (default 0.5).")
+    args = parser.parse_args(argv)
+
+    params = None
+    if args.params:
+        context = screen_processing.DetectorContext()
+        context.load_params(args.params)
+        params = context.get_params()
+
+    if os.path.isdir(args.input):
+        frames, frame_timestamps, recorded_gaze = recording.load_recording(args.input)
+        chunks = iter_chunks(args.input, len(frames), args.chunk_size)
+        gaze_blocks = iter_gaze_csv(args.gaze) if args.gaze else iter_gaze_array(recorded_gaze)
+    else:
+        if not args.frame_timestamps or not args.gaze:
+            parser.error("video input needs --frame-timestamps and --gaze")
+        frame_timestamps = read_timestamp_csv(args.frame_timestamps)
+        capture = cv2.VideoCapture(args.input)
+        if not capture.isOpened():
+            parser.error(f"could not open video {args.input}")
+        video_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        capture.release()
+        if video_frames > len(frame_timestamps):
+            print(f"Warning: the video has {video_frames} frames but only {len(frame_timestamps)} frame timestamps; "
+                  f"the extra frames are skipped.")
+        # Frames without a timestamp cannot be matched, so only the timestamped ones are decoded
+        chunks = iter_chunks(args.input, len(frame_timestamps), args.chunk_size)
+        gaze_blocks = iter_gaze_csv(args.gaze)
+
+    writer = CsvWriter(args.output) if args.output.lower().endswith(".csv") else BinaryWriter(args.output)
+    try:
+        frames_done, _ = run(chunks, frame_timestamps, gaze_blocks, writer, args.workers, params, args.scale)
+    finally:
+        writer.close()
+    if frames_done != len(frame_timestamps):
+        print(f"Warning: {frames_done} frames decoded but {len(frame_timestamps)} frame timestamps given.")
+
+
+if __name__ == "__main__":
+    main()
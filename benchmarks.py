@@ -0,0 +1,261 @@
+"""
+Microbenchmarks for screen detection, gaze mapping and packet encoding.
+
+Detection runs on synthetic scenes: a 16:9 screen warped by a random
+perspective onto a background with a configurable number of distractor
+shapes. Scenes are rendered supersampled and area-downscaled, so the known
+corner positions are sub-pixel accurate ground truth.
+
+Usage:
+  python benchmarks.py [--quick] [--filter NAME] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import platform
+import socket
+import struct
+import time
+
+import cv2
+import numpy as np
+
+import gaze_mapping
+import gaze_sender_network
+import homography
+import screen_processing
+
+RESOLUTIONS = ((800, 600), (1600, 1200), (1920, 1080))  # Neon's scene camera is 1600x1200
+CLUTTER_LEVELS = (0, 20, 80)  # Distractor shapes per scene
+DETECTION_SCALES = (1.0, 0.5)
+GAZE_BATCH_SIZE = 200  # One second of 200 Hz gaze
+# Samples per GazeWorker flush: one, about one frame of 200 Hz gaze, a backlog, a full drain
+GAZE_MAPPING_BATCH_SIZES = (1, 8, 64, 256)
+
+
+def make_synthetic_scene(width, height, clutter=0, rng=None, supersample=4):
+    """
+    Renders a BGR scene with a bright 16:9 screen under a random perspective.
+    Returns (image, corners) with corners ordered TL, TR, BR, BL in pixel
+    coordinates (pixel centres at integers).
+    """
+    rng = rng or np.random.default_rng()
+    ss = supersample
+    # Screen covering roughly 30-60% of the image width, jittered corners
+    screen_w = width * rng.uniform(0.3, 0.6)
+    screen_h = screen_w / screen_processing.TARGET_ASPECT_RATIO
+    cx, cy = width * rng.uniform(0.35, 0.65), height * rng.uniform(0.35, 0.65)
+    corners = np.array([[cx - screen_w / 2, cy - screen_h / 2], [cx + screen_w / 2, cy - screen_h / 2],
+                        [cx + screen_w / 2, cy + screen_h / 2], [cx - screen_w / 2, cy + screen_h / 2]])
+    corners += rng.uniform(-0.05, 0.05, size=(4, 2)) * (screen_w, screen_h)
+
+    big = np.empty((height * ss, width * ss), dtype=np.uint8)
+    # Smooth background gradient
+    ramp = np.linspace(30, 70, width * ss, dtype=np.float32)
+    big[:] = ramp.astype(np.uint8)
+    for _ in range(clutter):
+        # Small distractors that never reach the screen's minimum area
+        x, y = rng.uniform(0, width * ss), rng.uniform(0, height * ss)
+        size = rng.uniform(0.01, 0.06) * width * ss
+        shade = int(rng.integers(0, 256))
+        if rng.random() < 0.5:
+            cv2.circle(big, (int(x), int(y)), int(size / 2), shade, -1)
+        else:
+            pts = (np.array([x, y]) + rng.uniform(-size, size, size=(4, 2))).astype(np.int32)
+            cv2.fillConvexPoly(big, pts, shade)
+    cv2.fillPoly(big, [np.round((corners + 0.5) * ss - 0.5).astype(np.int32)], 230)
+    image = cv2.resize(big, (width, height), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR), corners.astype(np.float32)
+
+
+def time_calls(fn, repeat, warmup=3):
+    """Calls fn() warmup + repeat times; returns the per-call durations in seconds."""
+    for _ in range(warmup):
+        fn()
+    durations = np.empty(repeat, dtype=np.float64)
+    for i in range(repeat):
+        start = time.perf_counter_ns()
+        fn()
+        durations[i] = time.perf_counter_ns() - start
+    return durations / 1e9
+
+
+def latency_stats(durations, items_per_call=1):
+    """Latency percentiles in microseconds and throughput in items per second."""
+    p50, p95, p99 = np.percentile(durations, [50, 95, 99]) * 1e6
+    return {"calls": len(durations), "mean_us": round(float(durations.mean() * 1e6), 3),
+            "p50_us": round(float(p50), 3), "p95_us": round(float(p95), 3), "p99_us": round(float(p99), 3),
+            "throughput_per_s": round(float(items_per_call / durations.mean()), 1)}
+
+
+def bench_detection(repeat, scenes_per_case=5, seed=0):
+    results = {}
+    for width, height in RESOLUTIONS:
+        for clutter in CLUTTER_LEVELS:
+            rng = np.random.default_rng(seed)
+            scenes = [make_synthetic_scene(width, height, clutter, rng) for _ in range(scenes_per_case)]
+            for scale in DETECTION_SCALES:
+                context = screen_processing.DetectorContext()
+                durations = []
+                errors = []
+                misses = 0
+                for image, truth in scenes:
+                    durations.append(time_calls(
+                        lambda: screen_processing.detect_screen_corners(image, scale=scale, context=context),
+                        max(1, repeat // scenes_per_case)))
+                    found = screen_processing.detect_screen_corners(image, scale=scale, context=context)
+                    if found is None:
+                        misses += 1
+                    else:
+                        errors.append(np.linalg.norm(found - truth, axis=1))
+                stats = latency_stats(np.concatenate(durations))
+                stats["detection_rate"] = round(1.0 - misses / len(scenes), 3)
+                if errors:
+                    errors = np.concatenate(errors)
+                    stats["corner_error_mean_px"] = round(float(errors.mean()), 3)
+                    stats["corner_error_max_px"] = round(float(errors.max()), 3)
+                results[f"detect/{width}x{height}/clutter{clutter}/scale{scale}"] = stats
+    return results
+
+
+def bench_order_points(repeat, seed=0):
+    rng = np.random.default_rng(seed)
+    quad = rng.uniform(0, 1000, size=(4, 2)).astype(np.float32)
+    quads = rng.uniform(0, 1000, size=(8, 4, 2)).astype(np.float32)  # max_candidates per frame
+    return {
+        "order_points/single": latency_stats(time_calls(lambda: screen_processing.order_points(quad), repeat)),
+        "order_points/batch/n8": latency_stats(
+            time_calls(lambda: screen_processing.order_points_batch(quads), repeat), items_per_call=len(quads)),
+    }
+
+
+def bench_gaze_transform(repeat, seed=0):
+    """
+    map_gaze_points_batch, as called by GazeWorker: one homography per sample,
+    batch sizes from a single sample up to a full gaze drain. The per-sample
+    cv2.perspectiveTransform loop is only there as a reference point.
+    """
+    rng = np.random.default_rng(seed)
+    _, corners = make_synthetic_scene(1600, 1200, rng=rng, supersample=1)
+    results = {}
+    for n in GAZE_MAPPING_BATCH_SIZES:
+        # Slightly different quads, like homographies interpolated between two frames
+        jittered = corners + rng.normal(0, 1.0, size=(n, 4, 2)).astype(np.float32)
+        H_matrices = homography.solve_homography_4pt_batch(jittered)
+        gaze_xy = rng.uniform(0, 1200, size=(n, 2)).astype(np.float32)
+        results[f"gaze_transform/batch/n{n}"] = latency_stats(
+            time_calls(lambda: gaze_mapping.map_gaze_points_batch(H_matrices, gaze_xy), repeat), n)
+
+    def scalar_reference():
+        for H_matrix, point in zip(H_matrices, gaze_xy):
+            cv2.perspectiveTransform(point.reshape(1, 1, 2), H_matrix)
+
+    results[f"gaze_transform/scalar_reference/n{n}"] = latency_stats(
+        time_calls(scalar_reference, max(1, repeat // 10)), n)
+    return results
+
+
+def bench_packets(repeat, seed=0):
+    rng = np.random.default_rng(seed)
+    n = GAZE_BATCH_SIZE
+    timestamps_ns = time.time_ns() + np.arange(n, dtype=np.int64) * 5_000_000
+    gaze_xy = rng.uniform(0, 1600, size=(n, 2)).astype(np.float32)
+    screen_xy = rng.uniform(0, 1920, size=(n, 2)).astype(np.float32)
+
+    def legacy():
+        for ts, (gx, gy), (px, py) in zip(timestamps_ns.tolist(), gaze_xy.tolist(), screen_xy.tolist()):
+            struct.pack(gaze_sender_network.LEGACY_FORMAT, ts, gx, gy, px, py)
+
+    results = {
+        f"packets/encode_legacy/n{n}": latency_stats(time_calls(legacy, repeat), n),
+        f"packets/encode_v2/n{n}": latency_stats(time_calls(
+            lambda: gaze_sender_network.encode_v2_packet(0, timestamps_ns, gaze_xy, screen_xy), repeat), n),
+        f"packets/encode_v2_compact/n{n}": latency_stats(time_calls(
+            lambda: gaze_sender_network.encode_v2_packet(0, timestamps_ns, gaze_xy, screen_xy, compact=True),
+            repeat), n),
+    }
+
+    # End to end through GazeDataSender into a local sink socket
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    sink.setblocking(False)
+    port = sink.getsockname()[1]
+
+    def drain():
+        try:
+            while True:
+                sink.recv(65536)
+        except BlockingIOError:
+            pass
+
+    for protocol, compact in (("legacy", False), ("v2", False), ("v2", True)):
+        sender = gaze_sender_network.GazeDataSender("127.0.0.1", port, protocol=protocol, compact=compact)
+
+        def send():
+            sender.send_gaze_batch(timestamps_ns, gaze_xy, screen_xy)
+            drain()
+
+        name = protocol + ("_compact" if compact else "")
+        results[f"packets/send_{name}/n{n}"] = latency_stats(time_calls(send, max(1, repeat // 10)), n)
+        sender.close()
+    sink.close()
+    return results
+
+
+BENCHMARKS = {
+    "detect": bench_detection,
+    "order_points": bench_order_points,
+    "gaze_transform": bench_gaze_transform,
+    "packets": bench_packets,
+}
+
+
+def compare(results, baseline_path):
+    """Prints the relative change of p50 latency against a previous results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    print(f"\nChange vs {baseline_path} (p50 latency, negative is faster):")
+    for name, stats in results.items():
+        if name in baseline and baseline[name]["p50_us"] > 0:
+            change = (stats["p50_us"] / baseline[name]["p50_us"] - 1.0) * 100.0
+            print(f"  {name:<45} {change:+7.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the microbenchmark suite.")
+    parser.add_argument("--quick", action="store_true", help="Fewer repetitions, for a fast smoke run.")
+    parser.add_argument("--filter", help="Only run benchmark groups whose name contains this string.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--compare", help="Previous --output file to compare p50 latencies against.")
+    args = parser.parse_args(argv)
+    repeat = 20 if args.quick else 200
+
+    results = {}
+    for group, bench in BENCHMARKS.items():
+        if args.filter and args.filter not in group:
+            continue
+        print(f"Running {group} benchmarks...")
+        results.update(bench(repeat))
+
+    for name, stats in results.items():
+        line = f"  {name:<45} p50={stats['p50_us']:10.1f} us  p99={stats['p99_us']:10.1f} us  " \
+               f"{stats['throughput_per_s']:12.1f}/s"
+        if "detection_rate" in stats:
+            line += f"  hit={stats['detection_rate']:.2f}"
+            if "corner_error_mean_px" in stats:
+                line += f"  err={stats['corner_error_mean_px']:.2f}px"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": {"time_unix": time.time(), "python": platform.python_version(),
+                                "numpy": np.__version__, "opencv": cv2.__version__,
+                                "machine": platform.machine(), "processor": platform.processor(),
+                                "repeat": repeat},
+                       "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
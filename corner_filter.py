@@ -0,0 +1,110 @@
+import numpy as np
+
+
+class CornerKalmanFilter:
+    """
+    Constant-velocity Kalman filter on the 8 screen corner coordinates.
+    Smooths the per-frame detections and coasts through short dropouts:
+      - a detection updates the filter; one that jumps further than
+        `gate_sigma` standard deviations from the prediction (the screen was
+        re-acquired somewhere else) restarts it on the new corners,
+      - a missed frame returns the predicted corners, for at most
+        `max_coast_ns` after the last detection; after that the track is
+        dropped and None is returned until the screen is detected again.
+    Every coordinate has the same motion and noise model and they are
+    independent, so a single 2x2 [position, velocity] covariance is shared by
+    all eight; `covariance` expands it to the full 16x16 state covariance.
+    Noise parameters are in scene camera pixels and seconds.
+    """
+    def __init__(self, measurement_std=2.0, acceleration_std=2000.0, initial_velocity_std=500.0,
+                 max_coast_ns=250_000_000, gate_sigma=6.0):
+        self.measurement_var = measurement_std ** 2
+        self.acceleration_var = acceleration_std ** 2
+        self.initial_velocity_var = initial_velocity_std ** 2
+        self.max_coast_ns = max_coast_ns
+        self.gate_sigma = gate_sigma
+        self.state = None  # (8, 2): position and velocity of each coordinate
+        self.P = None  # (2, 2) shared covariance
+        self.timestamp_ns = None
+        self.last_detection_ns = None
+        # Counters: detections filtered, frames coasted, restarts on a jump
+        self.updates = 0
+        self.coasted = 0
+        self.resets = 0
+
+    def reset(self):
+        self.state = None
+        self.P = None
+        self.timestamp_ns = None
+        self.last_detection_ns = None
+
+    @property
+    def tracking(self):
+        return self.state is not None
+
+    @property
+    def corners(self):
+        """Current (4, 2) corner estimate, or None."""
+        return None if self.state is None else self.state[:, 0].reshape(4, 2).astype(np.float32)
+
+    @property
+    def position_std(self):
+        """Standard deviation of each corner coordinate in pixels, or None when not tracking."""
+        return None if self.P is None else float(np.sqrt(self.P[0, 0]))
+
+    @property
+    def covariance(self):
+        """Full (16, 16) covariance of the state [8 positions, 8 velocities], or None."""
+        return None if self.P is None else np.kron(self.P, np.eye(8))
+
+    def _start(self, corners, timestamp_ns):
+        self.state = np.zeros((8, 2))
+        self.state[:, 0] = np.asarray(corners, dtype=np.float64).reshape(8)
+        self.P = np.diag([self.measurement_var, self.initial_velocity_var])
+        self.timestamp_ns = self.last_detection_ns = timestamp_ns
+
+    def _predict(self, timestamp_ns):
+        dt = (timestamp_ns - self.timestamp_ns) / 1e9
+        if dt <= 0:
+            return
+        F = np.array([[1.0, dt], [0.0, 1.0]])
+        Q = self.acceleration_var * np.array([[dt ** 4 / 4, dt ** 3 / 2], [dt ** 3 / 2, dt ** 2]])
+        self.state = self.state @ F.T
+        self.P = F @ self.P @ F.T + Q
+        self.timestamp_ns = timestamp_ns
+
+    def update(self, corners, timestamp_ns):
+        """
+        Feeds the detection of the frame at timestamp_ns (None if the screen was
+        not found). Returns the filtered (4, 2) corners, or None.
+        """
+        if self.state is not None:
+            self._predict(timestamp_ns)
+
+        if corners is None:
+            if self.state is None:
+                return None
+            if timestamp_ns - self.last_detection_ns > self.max_coast_ns:
+                self.reset()
+                return None
+            self.coasted += 1
+            return self.corners
+
+        if self.state is None:
+            self._start(corners, timestamp_ns)
+            self.updates += 1
+            return self.corners
+
+        innovation = np.asarray(corners, dtype=np.float64).reshape(8) - self.state[:, 0]
+        S = self.P[0, 0] + self.measurement_var
+        if np.max(np.hypot(innovation[0::2], innovation[1::2])) > self.gate_sigma * np.sqrt(S):
+            self.resets += 1
+            self._start(corners, timestamp_ns)
+            return self.corners
+
+        K = self.P[:, 0] / S
+        self.state += np.outer(innovation, K)
+        self.P = self.P - np.outer(K, self.P[0, :])
+        self.last_detection_ns = timestamp_ns
+        self.updates += 1
+        return self.corners
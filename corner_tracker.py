@@ -0,0 +1,107 @@
+import cv2
+import numpy as np
+
+
+class CornerTracker:
+    """
+    Tracks the four screen corners frame-to-frame with pyramidal Lucas-Kanade
+    optical flow on small patches around each corner, and only falls back to
+    the full detector:
+      - every `redetect_interval` frames,
+      - when the flow loses a corner or the forward-backward check fails,
+      - when the tracked quad is no longer a plausible screen.
+    Instances are callable, so they can be used wherever detect_screen_corners is.
+    """
+    def __init__(self, detector, redetect_interval=15, patch_radius=48, win_size=15,
+                 max_level=2, fb_threshold=0.7, max_area_change=0.2):
+        self.detector = detector
+        self.redetect_interval = redetect_interval
+        self.patch_radius = patch_radius
+        self.win_size = win_size
+        self.max_level = max_level
+        self.fb_threshold = fb_threshold  # Max forward-backward error in pixels
+        self.max_area_change = max_area_change  # Max relative quad area change per frame
+        self.criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+
+        self.corners = None
+        self.prev_image = None
+        self.frames_since_detection = 0
+        self.last_fb_error = None
+        # Counters to see how often the heavy detector runs
+        self.detections = 0
+        self.tracked_frames = 0
+        self.track_failures = 0
+
+    def reset(self):
+        self.corners = None
+        self.prev_image = None
+        self.frames_since_detection = 0
+
+    def track(self, image):
+        corners = None
+        if self.corners is not None and self.frames_since_detection < self.redetect_interval:
+            corners = self._track_lk(image)
+            if corners is None:
+                self.track_failures += 1
+
+        if corners is None:
+            corners = self.detector(image)
+            self.detections += 1
+            self.frames_since_detection = 0
+        else:
+            self.tracked_frames += 1
+            self.frames_since_detection += 1
+            if hasattr(self.detector, "seed"):
+                self.detector.seed(corners)  # Keep the detector's search region on the tracked quad
+
+        self.corners = corners
+        self.prev_image = image if corners is not None else None
+        return corners
+
+    __call__ = track
+
+    def _flow(self, prev_patch, cur_patch, pts):
+        return cv2.calcOpticalFlowPyrLK(prev_patch, cur_patch, pts, None,
+                                        winSize=(self.win_size, self.win_size),
+                                        maxLevel=self.max_level, criteria=self.criteria)
+
+    def _track_lk(self, image):
+        """Returns the tracked corners, or None if the track can't be trusted."""
+        img_h, img_w = image.shape[:2]
+        r = self.patch_radius
+        tracked = np.empty((4, 2), dtype=np.float32)
+        max_fb_error = 0.0
+
+        for i, (cx, cy) in enumerate(self.corners):
+            x0, y0 = max(0, int(cx) - r), max(0, int(cy) - r)
+            x1, y1 = min(img_w, int(cx) + r + 1), min(img_h, int(cy) + r + 1)
+            if x1 - x0 < self.win_size or y1 - y0 < self.win_size:
+                return None  # Corner left the frame
+
+            prev_patch = cv2.cvtColor(self.prev_image[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+            cur_patch = cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+            p0 = np.array([[[cx - x0, cy - y0]]], dtype=np.float32)
+
+            p1, status, _ = self._flow(prev_patch, cur_patch, p0)
+            if not status[0, 0]:
+                return None
+            p0_back, status_back, _ = self._flow(cur_patch, prev_patch, p1)
+            if not status_back[0, 0]:
+                return None
+
+            fb_error = float(np.linalg.norm(p0_back - p0))
+            if fb_error > self.fb_threshold:
+                return None
+            max_fb_error = max(max_fb_error, fb_error)
+            tracked[i] = p1[0, 0] + (x0, y0)
+
+        # The tracked quad must still look like the screen we were following
+        if not cv2.isContourConvex(tracked.reshape(-1, 1, 2)):
+            return None
+        prev_area = cv2.contourArea(self.corners.reshape(-1, 1, 2))
+        area = cv2.contourArea(tracked.reshape(-1, 1, 2))
+        if prev_area <= 0 or abs(area / prev_area - 1.0) > self.max_area_change:
+            return None
+
+        self.last_fb_error = max_fb_error
+        return tracked
@@ -1,108 +1,255 @@
-import cv2
-import numpy as np
+import argparse
+import json
+import logging
+import signal
+
 from pupil_labs.realtime_api.simple import discover_one_device
 
 # Import new modules
 import screen_processing
 import gaze_sender_network
 import ui_manager
+import pipeline
+import corner_filter
+import corner_tracker
+import scene_change
+import metrics
+import latency
+import recording
+import async_ingest
+import gaze_broker
 
-def main():
-    print("Attempting to discover Pupil Labs Neon device...")
-    device = discover_one_device(max_search_duration_seconds=5)
-    if device is None:
-        print("Error: Could not find Pupil Labs Neon device. Exiting.")
-        return
-    print(f"Connected to device: {getattr(device, 'full_name', 'Pupil Labs Neon Device')}")
+# Keys accepted in the --config file; command line options take precedence
+CONFIG_KEYS = ("headless", "params", "udp_ip", "udp_port", "protocol", "preview_fps", "preview_scale",
+               "metrics_port", "log_level", "latency_report_interval", "latency_dump", "replay", "replay_speed",
+               "replay_lockstep", "record", "async_ingest", "subscribe", "shm", "scene_gate", "gaze_delay_ms",
+               "detection_scale")
 
-    # Initialize components from new modules
-    gaze_sender = gaze_sender_network.GazeDataSender()
-    window_name = "Live Video Feed + Gaze Sender"
-    opencv_ui = ui_manager.UIManager(window_name)
 
-    # Setup trackbars using UIManager and screen_processing callbacks/initial values
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Map Neon gaze onto the detected screen and send it over UDP.")
+    parser.add_argument("--headless", action="store_true", default=None,
+                        help="Run as a service without the OpenCV preview window and trackbars.")
+    parser.add_argument("--config", help="JSON config file with any of: " + ", ".join(CONFIG_KEYS))
+    parser.add_argument("--params", help="JSON file with the detection parameters (see DetectorContext.load_params).")
+    parser.add_argument("--udp-ip", dest="udp_ip", help="Destination IP of the gaze stream (default 127.0.0.1).")
+    parser.add_argument("--udp-port", dest="udp_port", type=int, help="Destination port of the gaze stream (default 5005).")
+    parser.add_argument("--protocol", choices=("legacy", "v2", "v2-compact"),
+                        help="Gaze wire format (default legacy, one 24-byte datagram per sample).")
+    parser.add_argument("--preview-fps", dest="preview_fps", type=float,
+                        help="Maximum preview refresh rate (default 15).")
+    parser.add_argument("--preview-scale", dest="preview_scale", type=float,
+                        help="Downscale factor of the preview image (default 0.5).")
+    parser.add_argument("--detection-scale", dest="detection_scale", type=float,
+                        help="Pyramid scale of the screen search, e.g. 0.5 or 0.25; corners are refined at full "
+                             "resolution. 1 searches the full image (default 0.5).")
+    parser.add_argument("--metrics-port", dest="metrics_port", type=int,
+                        help="Serve Prometheus metrics on http://127.0.0.1:<port>/metrics (default off).")
+    parser.add_argument("--log-level", dest="log_level", choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                        help="Logging level (default INFO; DEBUG shows rate-limited per-packet logs).")
+    parser.add_argument("--latency-report-interval", dest="latency_report_interval", type=float,
+                        help="Seconds between per-stage latency reports, 0 disables tracing (default 10).")
+    parser.add_argument("--latency-dump", dest="latency_dump",
+                        help="Append each latency report as a JSON line to this file.")
+    parser.add_argument("--replay", help="Replay a recording directory (see recording.py) instead of a live device.")
+    parser.add_argument("--replay-speed", dest="replay_speed", type=float,
+                        help="Replay speed, 1 is real time and 0 as fast as possible (default 1).")
+    parser.add_argument("--replay-lockstep", dest="replay_lockstep", action="store_true", default=None,
+                        help="Release each replayed frame only after the previous one was processed, and gaze "
+                             "only up to it; with --replay-speed 0 the output is deterministic.")
+    parser.add_argument("--record", help="Record the live scene video and gaze to this directory while running.")
+    parser.add_argument("--subscribe", action="append",
+                        help="Fan the gaze stream out to this subscriber (repeatable), e.g. udp://127.0.0.1:5005, "
+                             "multicast://239.0.0.1:5005?rate=30, tcp://0.0.0.0:5006; see gaze_broker.py. "
+                             "Replaces --udp-ip/--udp-port/--protocol.")
+    parser.add_argument("--shm", help="Also write mapped gaze to the shared-memory ring with this name, "
+                                      "for consumers on the same host (see SharedMemoryGazeReader).")
+    parser.add_argument("--gaze-delay-ms", dest="gaze_delay_ms", type=float,
+                        help="Max time gaze waits for the next scene frame so it can be mapped with the "
+                             "interpolated screen position (default 50).")
+    parser.add_argument("--scene-gate", dest="scene_gate", action="store_true", default=None,
+                        help="Reuse the last detection while the area around the screen corners is unchanged "
+                             "(saves CPU on static scenes, see scene_change.py).")
+    parser.add_argument("--async-ingest", dest="async_ingest", action="store_true", default=None,
+                        help="Receive video and gaze as concurrent asyncio streams (see async_ingest.py).")
+    args = parser.parse_args(argv)
+
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+        unknown = set(config) - set(CONFIG_KEYS)
+        if unknown:
+            parser.error(f"Unknown keys in {args.config}: {sorted(unknown)}")
+        for key, value in config.items():
+            if getattr(args, key) is None:
+                setattr(args, key, value)
+    args.headless = bool(args.headless)
+    args.async_ingest = bool(args.async_ingest)
+    args.scene_gate = bool(args.scene_gate)
+    args.replay_lockstep = bool(args.replay_lockstep)
+    if args.async_ingest and args.record:
+        parser.error("--record needs the blocking device API and cannot be combined with --async-ingest")
+    if args.protocol is None: args.protocol = "legacy"
+    if args.preview_fps is None: args.preview_fps = 15.0
+    if args.preview_scale is None: args.preview_scale = 0.5
+    if args.log_level is None: args.log_level = "INFO"
+    if args.latency_report_interval is None: args.latency_report_interval = 10.0
+    if args.replay_speed is None: args.replay_speed = 1.0
+    if args.gaze_delay_ms is None: args.gaze_delay_ms = 50.0
+    if args.detection_scale is None: args.detection_scale = 0.5
+    if not 0 < args.detection_scale <= 1:
+        parser.error("--detection-scale must be in (0, 1]")
+    return args
+
+
+def run_with_ui(pipeline_runner, detector_context, preview_fps, preview_scale, detection_scale=1.0):
+    """
+    Shows the preview with trackbars until 'q' is pressed or the pipeline stops.
+    Rendering happens on the PreviewRenderer thread; this thread just waits.
+    """
+    # Setup trackbars using the detector context's callbacks/initial values
     initial_trackbar_params = {
-        "Canny Thr1": screen_processing.canny_thr_1,
-        "Canny Thr2": screen_processing.canny_thr_2,
-        "Blur Kernel (0-4 -> 1-9)": screen_processing.blur_kernel_trackbar,
-        "Approx Poly Eps (1-50->.01-.5)": screen_processing.approx_poly_epsilon_trackbar,
-        "AR Tolerance (1-30->.01-.3)": screen_processing.aspect_ratio_tolerance_trackbar,
-        "Min Area % (1-50->.1-5%)": screen_processing.min_area_percent_trackbar
+        "Canny Thr1": detector_context.canny_thr_1,
+        "Canny Thr2": detector_context.canny_thr_2,
+        "Blur Kernel (0-4 -> 1-9)": detector_context.blur_kernel_trackbar,
+        "Approx Poly Eps (1-50->.01-.5)": detector_context.approx_poly_epsilon_trackbar,
+        "AR Tolerance (1-30->.01-.3)": detector_context.aspect_ratio_tolerance_trackbar,
+        "Min Area % (1-50->.1-5%)": detector_context.min_area_percent_trackbar
     }
     trackbar_callbacks = {
-        "Canny Thr1": screen_processing.on_canny_thr1_change,
-        "Canny Thr2": screen_processing.on_canny_thr2_change,
-        "Blur Kernel (0-4 -> 1-9)": screen_processing.on_blur_kernel_change,
-        "Approx Poly Eps (1-50->.01-.5)": screen_processing.on_approx_poly_epsilon_change,
-        "AR Tolerance (1-30->.01-.3)": screen_processing.on_aspect_ratio_tolerance_change,
-        "Min Area % (1-50->.1-5%)": screen_processing.on_min_area_percent_change
+        "Canny Thr1": detector_context.on_canny_thr1_change,
+        "Canny Thr2": detector_context.on_canny_thr2_change,
+        "Blur Kernel (0-4 -> 1-9)": detector_context.on_blur_kernel_change,
+        "Approx Poly Eps (1-50->.01-.5)": detector_context.on_approx_poly_epsilon_change,
+        "AR Tolerance (1-30->.01-.3)": detector_context.on_aspect_ratio_tolerance_change,
+        "Min Area % (1-50->.1-5%)": detector_context.on_min_area_percent_change
     }
-    opencv_ui.setup_trackbars(initial_trackbar_params, trackbar_callbacks)
-    opencv_ui.show_instructions()
+    preview = ui_manager.PreviewRenderer(pipeline_runner.results, "Live Video Feed + Gaze Sender",
+                                         initial_trackbar_params, trackbar_callbacks,
+                                         preview_fps=preview_fps, downscale=preview_scale,
+                                         on_quit=pipeline_runner.stop_event.set,
+                                         detector_context=detector_context, detection_scale=detection_scale)
+    preview.start()
+    try:
+        while not pipeline_runner.stop_event.wait(0.5):
+            pass
+    finally:
+        preview.stop()
+
+
+def run_headless(pipeline_runner):
+    """
+    Runs without any window until SIGINT/SIGTERM or until the pipeline stops.
+    The workers are paced by frame and gaze arrival, so this thread just waits.
+    """
+    def request_shutdown(signum, _frame):
+        print(f"Received {signal.Signals(signum).name}, shutting down...")
+        pipeline_runner.stop_event.set()
+
+    signal.signal(signal.SIGINT, request_shutdown)
+    signal.signal(signal.SIGTERM, request_shutdown)
+    print("Running headless. Send SIGINT/SIGTERM to stop.")
+    # Wait in short slices so the signal handlers get a chance to run
+    while not pipeline_runner.stop_event.wait(0.5):
+        pass
+
+
+def estimate_clock_offset_ns(device):
+    """Device clock minus host clock, so latencies measured from device timestamps are not skewed."""
+    if isinstance(device, recording.ReplayDevice):
+        return device.clock_offset_ns
+    try:
+        estimate = device.estimate_time_offset()
+        offset_ns = int(estimate.time_offset_ms.mean * 1e6)
+        print(f"Estimated device clock offset: {offset_ns / 1e6:.2f} ms")
+        return offset_ns
+    except Exception as e:
+        print(f"Could not estimate device clock offset ({e}); latencies assume synchronized clocks.")
+        return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = metrics.MetricsServer(args.metrics_port)
+        metrics_server.start()
+
+    # The detection context owns the tunable parameters and the detector's work buffers
+    detector_context = screen_processing.DetectorContext()
+    if args.params:
+        detector_context.load_params(args.params)
+
+    if args.replay:
+        device = recording.ReplayDevice(args.replay, speed=args.replay_speed, lockstep=args.replay_lockstep)
+    elif args.async_ingest:
+        device = None  # Discovered with the async API once the pipeline's loop runs
+    else:
+        print("Attempting to discover Pupil Labs Neon device...")
+        device = discover_one_device(max_search_duration_seconds=5)
+        if device is None:
+            print("Error: Could not find Pupil Labs Neon device. Exiting.")
+            return
+        if args.record:
+            device = recording.RecordingDevice(device, args.record)
+    if device is not None:
+        print(f"Connected to device: {getattr(device, 'full_name', 'Pupil Labs Neon Device')}")
+
+    # Initialize components from new modules
+    if args.subscribe:
+        gaze_sender = gaze_broker.GazeBroker(args.subscribe)
+    else:
+        gaze_sender = gaze_sender_network.GazeDataSender(udp_ip=args.udp_ip or "127.0.0.1",
+                                                         udp_port=args.udp_port or 5005,
+                                                         protocol="legacy" if args.protocol == "legacy" else "v2",
+                                                         compact=args.protocol == "v2-compact")
+    if args.shm:
+        gaze_sender = gaze_sender_network.SenderGroup(
+            [gaze_sender, gaze_sender_network.SharedMemoryGazeWriter(args.shm)])
 
-    H_matrix = None 
+    # Search only around the previous quad once the screen has been found,
+    # on a downscaled image with sub-pixel corner refinement
+    screen_detector = screen_processing.IncrementalScreenDetector(scale=args.detection_scale,
+                                                                  context=detector_context)
+    # Between full detections, track the four corners with optical flow
+    screen_detector = corner_tracker.CornerTracker(screen_detector)
+    # Smooth the corners over time and bridge short detection misses
+    screen_corner_filter = corner_filter.CornerKalmanFilter()
+    # Optionally skip detection while the screen corners have not moved
+    scene_gate = scene_change.SceneChangeGate() if args.scene_gate else None
+    tracer = None
+    if args.latency_report_interval > 0:
+        tracer = latency.LatencyTracer(report_interval=args.latency_report_interval, dump_path=args.latency_dump,
+                                       clock_offset_ns=estimate_clock_offset_ns(device) if device else 0)
+    if args.async_ingest:
+        pipeline_runner = async_ingest.AsyncPipeline(gaze_sender, detector=screen_detector, scene_gate=scene_gate,
+                                                     tracer=tracer, device=device, corner_filter=screen_corner_filter,
+                                                     max_gaze_delay_ns=int(args.gaze_delay_ms * 1e6))
+    else:
+        pipeline_runner = pipeline.Pipeline(device, gaze_sender, detector=screen_detector, scene_gate=scene_gate,
+                                            tracer=tracer, corner_filter=screen_corner_filter,
+                                            max_gaze_delay_ns=int(args.gaze_delay_ms * 1e6))
+    pipeline_runner.start()
 
     try:
-        while True:
-            frame = device.receive_scene_video_frame()
-            if frame is None:
-                if opencv_ui.get_keypress(30) == ord('q'):
-                    break
-                continue
-
-            scene_img = frame.bgr_pixels
-            display_img = scene_img.copy()
-            
-            # Use screen_processing module for detection
-            detected_corners = screen_processing.detect_screen_corners(scene_img)
-            current_H_valid = False
-
-            if detected_corners is not None:
-                screen_coordinates_actual = np.array([[0,0],[1920,0],[1920,1080],[0,1080]], dtype=np.float32)
-                H_matrix, mask = cv2.findHomography(detected_corners, screen_coordinates_actual, cv2.RANSAC, 5.0)
-                if H_matrix is not None:
-                    current_H_valid = True
-            else:
-                H_matrix = None # Ensure H_matrix is None if no corners detected
-
-            # Use UIManager to draw detection info
-            display_img = opencv_ui.draw_detection_info(display_img, detected_corners, current_H_valid)
-
-            if current_H_valid and H_matrix is not None:
-                gaze = device.receive_gaze_datum()
-                if gaze is not None and gaze.worn:
-                    gx_orig, gy_orig = gaze.x, gaze.y # Pupil Labs coordinates (normalized 0-1)
-                    
-                    # Transform gaze to screen coordinates
-                    # Denominator for perspective transformation
-                    denom = H_matrix[2,0]*gx_orig + H_matrix[2,1]*gy_orig + H_matrix[2,2]
-                    if denom != 0: # Avoid division by zero
-                        px = (H_matrix[0,0]*gx_orig + H_matrix[0,1]*gy_orig + H_matrix[0,2]) / denom
-                        py = (H_matrix[1,0]*gx_orig + H_matrix[1,1]*gy_orig + H_matrix[1,2]) / denom
-                        ts = gaze.timestamp_unix_ns
-                        
-                        # Use GazeDataSender to send data
-                        gaze_sender.send_gaze_data(ts, gx_orig, gy_orig, px, py)
-                        # print(f"Sent: px={px:.2f}, py={py:.2f}") # Moved to sender or keep for main debug
-                    else:
-                        # print("Denominator is zero, cannot transform gaze.") # Optional debug
-                        pass
-            
-            opencv_ui.display_image(display_img)
-            key = opencv_ui.get_keypress(30)
-            if key == ord('q'):
-                print("Quitting...")
-                break
-    
+        if args.headless:
+            run_headless(pipeline_runner)
+        else:
+            run_with_ui(pipeline_runner, detector_context, args.preview_fps, args.preview_scale,
+                        detection_scale=args.detection_scale)
     except Exception as e:
         print(f"An error occurred in main loop: {e}")
     finally:
         print("Closing device, sender, and UI.")
+        pipeline_runner.stop()
         if device:
             device.close()
         gaze_sender.close()
-        opencv_ui.destroy_windows()
+        if metrics_server:
+            metrics_server.stop()
         print("Cleanup complete. Exiting.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,315 @@
+"""
+asyncio fan-out of the mapped gaze stream to many subscribers.
+
+GazeBroker has the GazeDataSender interface (send_gaze_data / send_gaze_batch
+/ close), so the pipeline hands it each batch once. Batches are copied into
+every subscriber's drop-oldest buffer and each subscriber sends from its own
+task at its own rate cap, so a slow or stalled consumer only loses its own
+oldest samples and never delays the others or the pipeline.
+
+Subscribers are given as specs:
+  udp://HOST:PORT          UDP unicast
+  multicast://GROUP:PORT   UDP multicast (query option ttl, default 1)
+  tcp://HOST:PORT          listen for TCP clients; each gets a framed stream of
+                           4-byte little-endian length + packet
+Query options for all: protocol=legacy|v2|v2-compact (default v2; TCP is
+always v2), rate=max sends per second (default unlimited), buffer=max
+buffered samples (default 1024).
+e.g. udp://127.0.0.1:5005?protocol=legacy  multicast://239.0.0.1:5005?rate=30  tcp://0.0.0.0:5006
+"""
+import asyncio
+import collections
+import logging
+import socket
+import struct
+import threading
+import urllib.parse
+
+import numpy as np
+
+import gaze_sender_network
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TCP_FRAME_HEADER = '<I'  # Length prefix of each packet on TCP streams
+DEFAULT_BUFFER = 1024
+
+
+def to_samples(timestamps_ns, gaze_xy, screen_xy, worn=None):
+    """Packs a batch into a gaze_sender_network.SAMPLE_DTYPE array."""
+    samples = np.zeros(len(timestamps_ns), dtype=gaze_sender_network.SAMPLE_DTYPE)
+    samples['timestamp_ns'] = timestamps_ns
+    samples['gaze_x'], samples['gaze_y'] = gaze_xy[:, 0], gaze_xy[:, 1]
+    samples['screen_x'], samples['screen_y'] = screen_xy[:, 0], screen_xy[:, 1]
+    samples['flags'] = gaze_sender_network.SAMPLE_FLAG_WORN if worn is None else \
+        np.where(worn, gaze_sender_network.SAMPLE_FLAG_WORN, 0)
+    return samples
+
+
+class Subscriber:
+    """
+    One consumer of the stream: a drop-oldest sample buffer drained by its own task.
+    rate: maximum sends per second (None: send as soon as samples arrive).
+    With the v2 protocols each send carries every buffered sample; the legacy
+    protocol has one sample per datagram, so a rate-capped legacy subscriber
+    gets the newest sample of each interval.
+    """
+    disconnect_on_error = False  # Whether a send error ends the subscription
+
+    def __init__(self, name, protocol="v2", rate=None, buffer=DEFAULT_BUFFER):
+        if protocol not in ("legacy", "v2", "v2-compact"):
+            raise ValueError(f"Unknown gaze protocol: {protocol}")
+        self.name = name
+        self.protocol = protocol
+        self.rate = rate
+        self.buffer = buffer
+        sample_dtype = gaze_sender_network.COMPACT_SAMPLE_DTYPE if protocol == "v2-compact" \
+            else gaze_sender_network.SAMPLE_DTYPE
+        self.max_samples_per_packet = (gaze_sender_network.MAX_DATAGRAM_PAYLOAD
+                                       - gaze_sender_network.HEADER_SIZE) // sample_dtype.itemsize
+        self._batches = collections.deque()
+        self._buffered = 0
+        self._ready = asyncio.Event()
+        self.sequence = 0
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self._error_log = metrics.RateLimitedLog(logger)
+        # Series of the senders' metrics labelled with this subscriber
+        self._sent_metric = gaze_sender_network.SAMPLES_SENT.labels(subscriber=name)
+        self._errors_metric = gaze_sender_network.SEND_ERRORS.labels(subscriber=name)
+
+    def push(self, samples):
+        """Buffers a batch, dropping the oldest samples beyond the buffer size. Runs on the loop."""
+        self._batches.append(samples)
+        self._buffered += len(samples)
+        while self._buffered > self.buffer:
+            excess = self._buffered - self.buffer
+            oldest = self._batches[0]
+            if len(oldest) <= excess:
+                self._batches.popleft()
+                self._buffered -= len(oldest)
+                self.dropped += len(oldest)
+            else:
+                self._batches[0] = oldest[excess:]
+                self._buffered -= excess
+                self.dropped += excess
+        self._ready.set()
+
+    def _take(self):
+        samples = self._batches[0] if len(self._batches) == 1 else np.concatenate(self._batches)
+        self._batches.clear()
+        self._buffered = 0
+        self._ready.clear()
+        return samples
+
+    def packets(self, samples):
+        """Encodes buffered samples into this subscriber's wire format. Returns (packets, samples sent)."""
+        if self.protocol == "legacy":
+            # The legacy format has no flags: not-worn samples are not sent
+            samples = samples[(samples['flags'] & gaze_sender_network.SAMPLE_FLAG_WORN) != 0]
+            rows = samples[-1:] if self.rate else samples
+            return [struct.pack(gaze_sender_network.LEGACY_FORMAT, int(r['timestamp_ns']), r['gaze_x'], r['gaze_y'],
+                                r['screen_x'], r['screen_y']) for r in rows], len(rows)
+        compact = self.protocol == "v2-compact"
+        result = []
+        for start in range(0, len(samples), self.max_samples_per_packet):
+            chunk = samples[start:start + self.max_samples_per_packet]
+            result.append(gaze_sender_network.encode_v2_packet(
+                self.sequence, chunk['timestamp_ns'],
+                np.stack([chunk['gaze_x'], chunk['gaze_y']], axis=1),
+                np.stack([chunk['screen_x'], chunk['screen_y']], axis=1),
+                (chunk['flags'] & gaze_sender_network.SAMPLE_FLAG_WORN).astype(bool), compact))
+            self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        return result, len(samples)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._ready.wait()
+            samples = self._take()
+            started = loop.time()
+            packets, count = self.packets(samples)
+            self.dropped += len(samples) - count
+            try:
+                await self.send(packets)
+                self.sent += count
+                self._sent_metric.inc(count)
+            except OSError as e:
+                self._count_error()
+                if self.disconnect_on_error:
+                    raise
+                self._error_log(logging.WARNING, "Error sending gaze to %s: %s", self.name, e)
+            if self.rate:
+                await asyncio.sleep(max(0.0, 1.0 / self.rate - (loop.time() - started)))
+
+    def _count_error(self):
+        self.errors += 1
+        self._errors_metric.inc()
+
+    async def send(self, packets):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class UdpSubscriber(Subscriber):
+    """UDP unicast, or multicast when `ttl` is given."""
+    def __init__(self, host, port, ttl=None, **kwargs):
+        super().__init__(f"{'multicast' if ttl else 'udp'}://{host}:{port}", **kwargs)
+        self.address = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if ttl:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        self.sock.setblocking(False)
+
+    async def send(self, packets):
+        for packet in packets:
+            try:
+                self.sock.sendto(packet, self.address)
+            except BlockingIOError:
+                self._count_error()  # Kernel send buffer full: drop the packet rather than wait
+
+    def close(self):
+        self.sock.close()
+
+
+class TcpSubscriber(Subscriber):
+    """One connected TCP client; packets are framed with a length prefix."""
+    disconnect_on_error = True
+
+    def __init__(self, writer, **kwargs):
+        peer = writer.get_extra_info("peername")
+        super().__init__(f"tcp://{peer[0]}:{peer[1]}" if peer else "tcp client", **kwargs)
+        self.writer = writer
+
+    async def send(self, packets):
+        self.writer.write(b"".join(struct.pack(TCP_FRAME_HEADER, len(p)) + p for p in packets))
+        await self.writer.drain()  # A slow client only stalls its own task; its buffer drops the oldest
+
+    def close(self):
+        self.writer.close()
+
+
+def parse_subscriber_spec(spec):
+    """Parses a udp://, multicast:// or tcp:// spec into (scheme, host, port, options)."""
+    url = urllib.parse.urlsplit(spec)
+    if url.scheme not in ("udp", "multicast", "tcp") or not url.hostname or url.port is None:
+        raise ValueError(f"Invalid subscriber spec: {spec}")
+    query = dict(urllib.parse.parse_qsl(url.query))
+    unknown = set(query) - {"protocol", "rate", "buffer", "ttl"}
+    if unknown:
+        raise ValueError(f"Unknown options in {spec}: {sorted(unknown)}")
+    options = {"protocol": query.get("protocol", "v2"),
+               "rate": float(query["rate"]) if "rate" in query else None,
+               "buffer": int(query.get("buffer", DEFAULT_BUFFER))}
+    if url.scheme == "multicast":
+        options["ttl"] = int(query.get("ttl", 1))
+    return url.scheme, url.hostname, url.port, options
+
+
+class GazeBroker:
+    """
+    Fans mapped gaze out to the subscribers described by `specs` (see module docstring).
+    Runs its own event loop on a background thread; the send_* methods only
+    hand the batch to the loop and never block.
+    """
+    def __init__(self, specs):
+        self.specs = [parse_subscriber_spec(spec) for spec in specs]
+        self.subscribers = []
+        self._servers = []
+        self._tasks = {}
+        self._setup_error = None
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="GazeBroker", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._setup_error is not None:
+            # e.g. a TCP port already in use or an invalid subscriber option
+            self._thread.join()
+            self._loop.close()
+            raise self._setup_error
+        print(f"GazeBroker initialized with {len(self.specs)} subscriber endpoint(s): "
+              + ", ".join(spec for spec in specs))
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._setup())
+        except Exception as e:
+            self._setup_error = e
+            self._loop.run_until_complete(self._shutdown())
+            return
+        finally:
+            self._started.set()
+        self._loop.run_forever()
+
+    async def _setup(self):
+        for scheme, host, port, options in self.specs:
+            if scheme == "tcp":
+                options = {**options, "protocol": "v2" if options["protocol"] == "legacy" else options["protocol"]}
+                server = await asyncio.start_server(
+                    lambda reader, writer, options=options: self._accept(reader, writer, options), host, port)
+                self._servers.append(server)
+                print(f"GazeBroker accepting TCP subscribers on {host}:{port}")
+            else:
+                self._add(UdpSubscriber(host, port, **options))
+
+    def _add(self, subscriber):
+        self.subscribers.append(subscriber)
+        task = self._loop.create_task(subscriber.run())
+        self._tasks[subscriber] = task
+        task.add_done_callback(lambda _: self._remove(subscriber))
+        return task
+
+    def _remove(self, subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+            self._tasks.pop(subscriber, None)
+            subscriber.close()
+            print(f"Subscriber {subscriber.name} removed: {subscriber.sent} samples sent, "
+                  f"{subscriber.dropped} dropped")
+
+    async def _accept(self, reader, writer, options):
+        subscriber = TcpSubscriber(writer, **options)
+        print(f"Subscriber {subscriber.name} connected")
+        task = self._add(subscriber)
+        try:
+            # Clients never send anything; EOF means they disconnected
+            await reader.read()
+        except ConnectionError:
+            pass
+        finally:
+            task.cancel()
+
+    def _publish(self, samples):
+        for subscriber in self.subscribers:
+            subscriber.push(samples)
+
+    def send_gaze_batch(self, timestamps_ns, gaze_xy, screen_xy, worn=None):
+        """Queues a batch for every subscriber; returns immediately."""
+        self._loop.call_soon_threadsafe(self._publish, to_samples(timestamps_ns, gaze_xy, screen_xy, worn))
+
+    def send_gaze_data(self, timestamp_unix_ns, gaze_x_original, gaze_y_original, gaze_x_transformed, gaze_y_transformed):
+        self.send_gaze_batch(np.array([timestamp_unix_ns], dtype=np.int64),
+                             np.array([[gaze_x_original, gaze_y_original]], dtype=np.float32),
+                             np.array([[gaze_x_transformed, gaze_y_transformed]], dtype=np.float32))
+
+    async def _shutdown(self):
+        for server in self._servers:
+            server.close()
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        """Stops all subscribers and the loop."""
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+        print("GazeBroker closed.")
@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+
+
+def drain_gaze_data(device, timeout_seconds=0.5, max_samples=256):
+    """
+    Blocks for the first gaze datum, then collects every datum already queued
+    on `device` without waiting. Returns a (possibly empty) list.
+    The realtime API's simple device only keeps the newest datum per sensor,
+    so on it this returns at most one; pipeline.GazeIntakeWorker polls the
+    device continuously into its own queue and drains real batches from it.
+    """
+    gaze = device.receive_gaze_datum(timeout_seconds=timeout_seconds)
+    if gaze is None:
+        return []
+    samples = [gaze]
+    while len(samples) < max_samples:
+        gaze = device.receive_gaze_datum(timeout_seconds=0)
+        if gaze is None:
+            break
+        samples.append(gaze)
+    return samples
+
+
+def gaze_to_arrays(samples):
+    """
+    Converts a list of gaze datums into arrays:
+    timestamps (N,) int64 ns, gaze points (N, 2) float32, worn flags (N,) bool.
+    """
+    timestamps_ns = np.fromiter((g.timestamp_unix_ns for g in samples), dtype=np.int64, count=len(samples))
+    gaze_xy = np.array([(g.x, g.y) for g in samples], dtype=np.float32).reshape(-1, 2)
+    worn = np.fromiter((g.worn for g in samples), dtype=bool, count=len(samples))
+    return timestamps_ns, gaze_xy, worn
+
+
+def map_gaze_points(H_matrix, gaze_xy):
+    """
+    Maps (N, 2) scene camera points to screen coordinates with one vectorized call.
+    """
+    gaze_xy = np.asarray(gaze_xy, dtype=np.float32).reshape(-1, 1, 2)
+    if gaze_xy.shape[0] == 0:
+        return np.empty((0, 2), dtype=np.float32)
+    return cv2.perspectiveTransform(gaze_xy, H_matrix).reshape(-1, 2)
+
+
+def map_gaze_points_batch(H_matrices, gaze_xy, eps=1e-9):
+    """
+    Maps (N, 2) scene camera points to screen coordinates, each with its own
+    homography from H_matrices (N, 3, 3).
+    Returns (screen points (N, 2) float32, valid (N,) bool). Points whose
+    homogeneous w is (near) zero have no finite image and are marked invalid.
+    """
+    gaze_xy = np.asarray(gaze_xy, dtype=np.float64).reshape(-1, 2)
+    points = np.concatenate([gaze_xy, np.ones((len(gaze_xy), 1))], axis=1)
+    mapped = np.einsum('nij,nj->ni', H_matrices, points)
+    w = mapped[:, 2]
+    valid = np.abs(w) >= eps
+    screen_xy = np.zeros((len(gaze_xy), 2), dtype=np.float32)
+    screen_xy[valid] = mapped[valid, :2] / w[valid, None]
+    return screen_xy, valid
@@ -0,0 +1,136 @@
+"""
+Platform-neutral receiver for the gaze stream sent by data_sender.
+
+Blocks on socket readiness with selectors, then drains every datagram queued
+in the kernel on each wakeup, so a 200 Hz stream never backs up behind a
+slow consumer. Consumers either read `latest` (the freshest sample) or get
+each wakeup's samples through the `on_batch` callback.
+
+Usage (console client):
+  python gaze_receiver.py [--ip 127.0.0.1] [--port 5005]
+"""
+import argparse
+import selectors
+import socket
+import time
+
+import numpy as np
+
+import gaze_sender_network
+
+RECEIVE_BUFFER_BYTES = 1 << 20  # Room for a few seconds of stream if the consumer stalls
+
+
+class GazeReceiver:
+    """
+    Receives legacy and v2 gaze datagrams on udp_ip:udp_port.
+    on_batch: optional callable getting a gaze_sender_network.SAMPLE_DTYPE
+    array with every sample received in one wakeup, in arrival order.
+    Late (out of order) v2 packets are dropped so `latest` never goes back in time.
+    """
+    def __init__(self, udp_ip="127.0.0.1", udp_port=5005, on_batch=None):
+        self.udp_ip = udp_ip
+        self.udp_port = udp_port
+        self.on_batch = on_batch
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_BYTES)
+        self.sock.bind((udp_ip, udp_port))
+        self.sock.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self.sequence_tracker = gaze_sender_network.SequenceTracker()
+        self.latest = None  # Freshest sample (a SAMPLE_DTYPE record), None until the first one
+        self.latest_time = None  # time.monotonic() at which `latest` arrived
+        self.samples_received = 0
+        self.malformed = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def poll(self, timeout=None):
+        """
+        Waits up to `timeout` seconds (None: forever) for data, then drains the socket.
+        Returns the number of samples received.
+        """
+        if not self.selector.select(timeout):
+            return 0
+        return self.drain()
+
+    def drain(self):
+        """Reads every queued datagram without blocking. Returns the number of samples received."""
+        batches = []
+        while True:
+            try:
+                data = self.sock.recv(65535)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                break  # e.g. ICMP errors reported on some platforms; the socket stays usable
+            try:
+                header, samples = gaze_sender_network.decode_packet(data)
+            except ValueError:
+                self.malformed += 1
+                continue
+            if header is not None and not self.sequence_tracker.update(header.sequence):
+                continue  # Late packet, newer samples were already delivered
+            if len(samples):
+                batches.append(samples)
+        if not batches:
+            return 0
+
+        samples = batches[0] if len(batches) == 1 else np.concatenate(batches)
+        self.latest = samples[-1]
+        self.latest_time = time.monotonic()
+        self.samples_received += len(samples)
+        if self.on_batch is not None:
+            self.on_batch(samples)
+        return len(samples)
+
+    def run(self, should_stop, timeout=0.1):
+        """Polls until should_stop() returns True (checked at least every `timeout` seconds)."""
+        while not should_stop():
+            self.poll(timeout)
+
+    def close(self):
+        self.selector.close()
+        self.sock.close()
+        if self.sequence_tracker.received:
+            print(f"v2 packets: {self.sequence_tracker.received} received, {self.sequence_tracker.lost} lost, "
+                  f"{self.sequence_tracker.reordered} out of order.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print the gaze stream sent by data_sender.")
+    parser.add_argument("--ip", default="127.0.0.1", help="Address to listen on (default 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=5005, help="UDP port to listen on (default 5005).")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between status lines (default 1).")
+    args = parser.parse_args(argv)
+
+    receiver = GazeReceiver(args.ip, args.port)
+    print(f"Listening for gaze data on UDP {args.ip}:{args.port}. Press Ctrl+C to quit.")
+    next_print = time.monotonic() + args.interval
+    last_count = 0
+    try:
+        while True:
+            receiver.poll(max(0.0, next_print - time.monotonic()))
+            now = time.monotonic()
+            if now >= next_print:
+                rate = (receiver.samples_received - last_count) / args.interval
+                last_count = receiver.samples_received
+                next_print = now + args.interval
+                if receiver.latest is None:
+                    print("No gaze received yet.")
+                else:
+                    s = receiver.latest
+                    age_ms = (time.time_ns() - int(s['timestamp_ns'])) / 1e6
+                    worn = "" if s['flags'] & gaze_sender_network.SAMPLE_FLAG_WORN else "  (not worn)"
+                    print(f"screen=({s['screen_x']:7.1f}, {s['screen_y']:7.1f})  {rate:6.1f} samples/s  "
+                          f"age {age_ms:7.1f} ms{worn}")
+    except KeyboardInterrupt:
+        print("\nCtrl+C detected. Exiting.")
+    finally:
+        receiver.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,439 @@
-\
+import collections
+import logging
+import os
 import socket
 import struct
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SAMPLES_SENT = metrics.registry.counter("gaze_samples_sent_total",
+                                        "Gaze samples sent (labelled per subscriber for the broker).")
+PACKETS_SENT = metrics.registry.counter("gaze_packets_sent_total", "Gaze datagrams sent over UDP.")
+SEND_ERRORS = metrics.registry.counter("gaze_send_errors_total",
+                                       "Failed gaze sends (labelled per subscriber for the broker).")
+COMPACT_CLIPPED = metrics.registry.counter("gaze_compact_clipped_total",
+                                           "Samples whose coordinates were clipped by the compact encoding.")
+RING_SAMPLES_WRITTEN = metrics.registry.counter("gaze_ring_samples_written_total",
+                                                "Gaze samples written to the shared-memory ring.")
+
+# --- Wire formats ---
+# Legacy: one sample per 24-byte datagram.
+# <dffff means: little-endian, double, float, float, float, float
+LEGACY_FORMAT = '<dffff'
+LEGACY_PACKET_SIZE = struct.calcsize(LEGACY_FORMAT)
+
+# v2: a header followed by `count` samples.
+# magic, version, flags, sequence number, sample count, reserved, base timestamp (ns)
+PROTOCOL_MAGIC = b'GZ'
+PROTOCOL_VERSION = 2
+HEADER_FORMAT = '<2sBBIHHq'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+FLAG_COMPACT = 0x01  # Header flag: samples use the compact fixed-point encoding
+SAMPLE_FLAG_WORN = 0x01  # Per-sample flag: the glasses were worn
+SAMPLE_FLAG_CLIPPED = 0x02  # Per-sample flag: compact coordinates were clipped to the fixed-point range
+
+# Full sample: absolute timestamp and float32 coordinates (28 bytes)
+SAMPLE_DTYPE = np.dtype([('timestamp_ns', '<i8'), ('gaze_x', '<f4'), ('gaze_y', '<f4'),
+                         ('screen_x', '<f4'), ('screen_y', '<f4'), ('flags', 'u1'), ('_pad', 'V3')])
+# Compact sample: microseconds since the header's base timestamp and
+# coordinates in 1/COMPACT_SCALE pixel fixed point (14 bytes)
+COMPACT_SAMPLE_DTYPE = np.dtype([('dt_us', '<u4'), ('gaze_x', '<i2'), ('gaze_y', '<i2'),
+                                 ('screen_x', '<i2'), ('screen_y', '<i2'), ('flags', 'u1'), ('_pad', 'V1')])
+COMPACT_SCALE = 8.0
+_COMPACT_MAX = np.iinfo(np.int16).max  # Coordinates beyond +-4095.9 px are clipped
+
+# Keeps datagrams below a typical Ethernet MTU
+MAX_DATAGRAM_PAYLOAD = 1400
+
+PacketHeader = collections.namedtuple('PacketHeader', 'version flags sequence count base_timestamp_ns')
+
+
+def encode_v2_packet(sequence, timestamps_ns, gaze_xy, screen_xy, worn=None, compact=False):
+    """Packs N samples (N <= 65535) into one v2 datagram."""
+    count = len(timestamps_ns)
+    timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)
+    base_timestamp_ns = int(timestamps_ns[0]) if count else 0
+    flags = np.where(np.ones(count, dtype=bool) if worn is None else np.asarray(worn, dtype=bool),
+                     SAMPLE_FLAG_WORN, 0)
+
+    if compact:
+        # Fixed point, rounded then clipped to int16; the four coordinates are written at once through a byte view
+        coords = np.empty((count, 4))
+        coords[:, :2] = gaze_xy
+        coords[:, 2:] = screen_xy
+        coords *= COMPACT_SCALE
+        np.rint(coords, out=coords)
+        clipped = ~(np.abs(coords) <= _COMPACT_MAX).all(axis=1)  # Also true for NaN
+        if clipped.any():
+            np.clip(coords, -_COMPACT_MAX, _COMPACT_MAX, out=coords)
+            coords[np.isnan(coords)] = 0
+            flags |= np.where(clipped, SAMPLE_FLAG_CLIPPED, 0)
+            COMPACT_CLIPPED.inc(int(clipped.sum()))
+        samples = np.zeros(count, dtype=COMPACT_SAMPLE_DTYPE)
+        samples['dt_us'] = (timestamps_ns - base_timestamp_ns) // 1000
+        samples.view(np.uint8).reshape(count, COMPACT_SAMPLE_DTYPE.itemsize)[:, 4:12] = \
+            coords.astype('<i2').view(np.uint8).reshape(count, 8)
+        samples['flags'] = flags
+    else:
+        samples = np.zeros(count, dtype=SAMPLE_DTYPE)
+        samples['timestamp_ns'] = timestamps_ns
+        samples['gaze_x'], samples['gaze_y'] = gaze_xy[:, 0], gaze_xy[:, 1]
+        samples['screen_x'], samples['screen_y'] = screen_xy[:, 0], screen_xy[:, 1]
+        samples['flags'] = flags
+
+    header = struct.pack(HEADER_FORMAT, PROTOCOL_MAGIC, PROTOCOL_VERSION, FLAG_COMPACT if compact else 0,
+                         sequence & 0xFFFFFFFF, count, 0, base_timestamp_ns)
+    return header + samples.tobytes()
+
+
+def decode_packet(data):
+    """
+    Decodes a legacy or v2 datagram.
+    Returns (header, samples): header is a PacketHeader (None for legacy packets)
+    and samples a SAMPLE_DTYPE array. Raises ValueError for malformed packets.
+    """
+    if len(data) == LEGACY_PACKET_SIZE:
+        ts, gx, gy, px, py = struct.unpack(LEGACY_FORMAT, data)
+        samples = np.zeros(1, dtype=SAMPLE_DTYPE)
+        samples[0] = (int(ts), gx, gy, px, py, SAMPLE_FLAG_WORN, b'\x00' * 3)
+        return None, samples
+
+    if len(data) < HEADER_SIZE or data[:2] != PROTOCOL_MAGIC:
+        raise ValueError(f"Unknown gaze packet ({len(data)} bytes)")
+    magic, version, flags, sequence, count, _, base_timestamp_ns = struct.unpack_from(HEADER_FORMAT, data)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported gaze protocol version {version}")
+    header = PacketHeader(version, flags, sequence, count, base_timestamp_ns)
+
+    sample_dtype = COMPACT_SAMPLE_DTYPE if flags & FLAG_COMPACT else SAMPLE_DTYPE
+    if len(data) != HEADER_SIZE + count * sample_dtype.itemsize:
+        raise ValueError(f"Truncated gaze packet: {count} samples in {len(data)} bytes")
+    raw = np.frombuffer(data, dtype=sample_dtype, count=count, offset=HEADER_SIZE)
+    if sample_dtype is SAMPLE_DTYPE:
+        return header, raw
+
+    samples = np.zeros(count, dtype=SAMPLE_DTYPE)
+    samples['timestamp_ns'] = base_timestamp_ns + raw['dt_us'].astype(np.int64) * 1000
+    for field in ('gaze_x', 'gaze_y', 'screen_x', 'screen_y'):
+        samples[field] = raw[field] / COMPACT_SCALE
+    samples['flags'] = raw['flags']
+    return header, samples
+
+
+class SequenceTracker:
+    """Counts lost and reordered v2 packets from their sequence numbers."""
+    def __init__(self):
+        self.expected = None
+        self.received = 0
+        self.lost = 0
+        self.reordered = 0
+
+    def update(self, sequence):
+        """Returns False for packets older than the newest one seen (late or duplicate)."""
+        self.received += 1
+        if self.expected is None:
+            self.expected = (sequence + 1) & 0xFFFFFFFF
+            return True
+        gap = (sequence - self.expected) & 0xFFFFFFFF
+        if gap >= 0x80000000:  # Behind the expected sequence number
+            self.reordered += 1
+            self.lost = max(0, self.lost - 1)  # It was counted as lost when skipped
+            return False
+        self.lost += gap
+        self.expected = (sequence + 1) & 0xFFFFFFFF
+        return True
+
 
 class GazeDataSender:
-    def __init__(self, udp_ip="127.0.0.1", udp_port=5005):
+    """
+    Sends mapped gaze over UDP.
+    protocol: "legacy" sends one 24-byte <dffff datagram per sample,
+    "v2" batches samples behind a header with a sequence number.
+    compact: with v2, use the fixed-point sample encoding (14 instead of 28 bytes).
+    """
+    def __init__(self, udp_ip="127.0.0.1", udp_port=5005, protocol="legacy", compact=False):
+        if protocol not in ("legacy", "v2"):
+            raise ValueError(f"Unknown gaze protocol: {protocol}")
         self.udp_ip = udp_ip
         self.udp_port = udp_port
+        self.protocol = protocol
+        self.compact = compact
+        sample_size = (COMPACT_SAMPLE_DTYPE if compact else SAMPLE_DTYPE).itemsize
+        self.max_samples_per_packet = (MAX_DATAGRAM_PAYLOAD - HEADER_SIZE) // sample_size
+        self.sequence = 0
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        print(f"GazeDataSender initialized. Will send to {self.udp_ip}:{self.udp_port}")
+        # Per-packet events are logged at most every few seconds
+        self._sent_log = metrics.RateLimitedLog(logger)
+        self._error_log = metrics.RateLimitedLog(logger)
+        mode = protocol + (" compact" if protocol == "v2" and compact else "")
+        print(f"GazeDataSender initialized. Will send to {self.udp_ip}:{self.udp_port} ({mode} protocol)")
 
     def send_gaze_data(self, timestamp_unix_ns, gaze_x_original, gaze_y_original, gaze_x_transformed, gaze_y_transformed):
         """Packs and sends gaze data via UDP."""
+        if self.protocol == "v2":
+            self.send_gaze_batch(np.array([timestamp_unix_ns], dtype=np.int64),
+                                 np.array([[gaze_x_original, gaze_y_original]], dtype=np.float32),
+                                 np.array([[gaze_x_transformed, gaze_y_transformed]], dtype=np.float32))
+            return
         try:
-            # <dffff means: little-endian, double, float, float, float, float
-            packet = struct.pack('<dffff', 
-                                 timestamp_unix_ns, 
-                                 gaze_x_original, 
-                                 gaze_y_original, 
-                                 float(gaze_x_transformed), 
+            packet = struct.pack(LEGACY_FORMAT,
+                                 timestamp_unix_ns,
+                                 gaze_x_original,
+                                 gaze_y_original,
+                                 float(gaze_x_transformed),
                                  float(gaze_y_transformed))
             self.sock.sendto(packet, (self.udp_ip, self.udp_port))
-            print(f"Sent: px={gaze_x_transformed:.2f}, py={gaze_y_transformed:.2f}") # Optional: for debugging
+            PACKETS_SENT.inc()
+            SAMPLES_SENT.inc()
+            self._sent_log(logging.DEBUG, "Sent: px=%.2f, py=%.2f", gaze_x_transformed, gaze_y_transformed)
         except Exception as e:
-            print(f"Error sending gaze data: {e}")
+            SEND_ERRORS.inc()
+            self._error_log(logging.WARNING, "Error sending gaze data: %s", e)
+
+    def send_gaze_batch(self, timestamps_ns, gaze_xy, screen_xy, worn=None):
+        """
+        Sends a batch of mapped gaze samples.
+        timestamps_ns: (N,) array, gaze_xy / screen_xy: (N, 2) arrays, worn: optional (N,) bools.
+        With the v2 protocol the batch is split into as few datagrams as the MTU allows.
+        """
+        if self.protocol == "legacy":
+            if worn is not None:  # The legacy format has no flags: not-worn samples are not sent
+                timestamps_ns, gaze_xy, screen_xy = timestamps_ns[worn], gaze_xy[worn], screen_xy[worn]
+            for ts, (gx, gy), (px, py) in zip(timestamps_ns.tolist(), gaze_xy.tolist(), screen_xy.tolist()):
+                self.send_gaze_data(ts, gx, gy, px, py)
+            return
+
+        step = self.max_samples_per_packet
+        for start in range(0, len(timestamps_ns), step):
+            chunk = slice(start, start + step)
+            packet = encode_v2_packet(self.sequence, timestamps_ns[chunk], gaze_xy[chunk], screen_xy[chunk],
+                                      None if worn is None else worn[chunk], self.compact)
+            self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+            try:
+                self.sock.sendto(packet, (self.udp_ip, self.udp_port))
+                PACKETS_SENT.inc()
+                SAMPLES_SENT.inc(len(timestamps_ns[chunk]))
+            except Exception as e:
+                SEND_ERRORS.inc()
+                self._error_log(logging.WARNING, "Error sending gaze data: %s", e)
+        if len(timestamps_ns):
+            self._sent_log(logging.DEBUG, "Sent %d samples, last: px=%.2f, py=%.2f",
+                           len(timestamps_ns), screen_xy[-1, 0], screen_xy[-1, 1])
 
     def close(self):
         """Closes the UDP socket."""
         if self.sock:
             self.sock.close()
             print("GazeDataSender socket closed.")
+
+
+# --- Shared-memory ring buffer, for consumers on the same host ---
+# A 64-byte header followed by `capacity` slots. Sample k (0-based, counting
+# every sample ever written) lives in slot k % capacity with sequence k + 1.
+# The writer raises reserve_sequence before overwriting slots and
+# write_sequence once they are complete, so a reader knows a copy is intact
+# if the slot was not reserved again by the time the copy finished (seqlock).
+RING_MAGIC = b'GZRB'
+RING_VERSION = 1
+RING_HEADER_DTYPE = np.dtype([('magic', 'S4'), ('version', '<u4'), ('capacity', '<u8'),
+                              ('write_sequence', '<u8'), ('reserve_sequence', '<u8'), ('owner_pid', '<i8'),
+                              ('_pad', 'V24')])
+RING_SAMPLE_DTYPE = np.dtype([('sequence', '<u8'), ('timestamp_ns', '<i8'), ('gaze_x', '<f4'), ('gaze_y', '<f4'),
+                              ('screen_x', '<f4'), ('screen_y', '<f4'), ('flags', 'u1'), ('_pad', 'V7')])
+DEFAULT_RING_NAME = "gaze_ring"
+
+
+_owned_rings = set()  # Rings created by writers in this process
+
+
+def _process_alive(pid):
+    if os.name != "posix":
+        # Windows frees a named segment with its last handle, so an existing ring is always in use
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by another user
+    return True
+
+
+def _attach_untracked(name):
+    """
+    Attaches to an existing segment without handing it to this process's
+    resource tracker, which would otherwise remove it when the process exits.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    shm = shared_memory.SharedMemory(name)
+    if os.name == "posix" and shm.name not in _owned_rings:
+        resource_tracker.unregister("/" + shm.name, "shared_memory")  # Registered under its POSIX name
+    return shm
+
+
+def _ring_views(buf, capacity=None):
+    header = np.ndarray(1, dtype=RING_HEADER_DTYPE, buffer=buf)
+    capacity = capacity or int(header['capacity'][0])
+    slots = np.ndarray(capacity, dtype=RING_SAMPLE_DTYPE, buffer=buf, offset=RING_HEADER_DTYPE.itemsize)
+    return header, slots
+
+
+class SharedMemoryGazeWriter:
+    """
+    Single-producer ring buffer of mapped gaze in multiprocessing.shared_memory.
+    Same send_gaze_data / send_gaze_batch / close interface as GazeDataSender.
+    Lock-free: slot contents are written before their sequence number, and the
+    header's write_sequence is published last. There must be only one writer.
+    """
+    def __init__(self, name=DEFAULT_RING_NAME, capacity=4096):
+        self.name = name
+        self.capacity = capacity
+        size = RING_HEADER_DTYPE.itemsize + capacity * RING_SAMPLE_DTYPE.itemsize
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            self._remove_stale_ring(name)
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.header, self.slots = _ring_views(self.shm.buf, capacity)
+        self.slots[:] = np.zeros(capacity, dtype=RING_SAMPLE_DTYPE)
+        self.header[0] = (RING_MAGIC, RING_VERSION, capacity, 0, 0, os.getpid(), b'')
+        _owned_rings.add(self.shm.name)
+        self.write_sequence = 0
+        print(f"SharedMemoryGazeWriter initialized: ring '{name}' with {capacity} samples")
+
+    @staticmethod
+    def _remove_stale_ring(name):
+        """
+        Removes a ring left over by a writer that did not shut down cleanly.
+        Raises FileExistsError if the segment is not a gaze ring or its writer is still running.
+        """
+        existing = _attach_untracked(name)
+        try:
+            magic, owner_pid = None, 0
+            if existing.size >= RING_HEADER_DTYPE.itemsize:
+                header = np.frombuffer(existing.buf, dtype=RING_HEADER_DTYPE, count=1)
+                magic, owner_pid = header['magic'][0], int(header['owner_pid'][0])
+                del header  # The view must go before the buffer can be released
+        finally:
+            existing.close()
+        if magic != RING_MAGIC:
+            raise FileExistsError(f"Shared memory '{name}' exists and is not a gaze ring; choose another name")
+        if owner_pid and _process_alive(owner_pid):
+            raise FileExistsError(f"Gaze ring '{name}' is in use by writer process {owner_pid}")
+        print(f"Removing stale gaze ring '{name}' (writer process {owner_pid} is gone)")
+        shared_memory.SharedMemory(name).unlink()
+
+    def send_gaze_data(self, timestamp_unix_ns, gaze_x_original, gaze_y_original, gaze_x_transformed, gaze_y_transformed):
+        self.send_gaze_batch(np.array([timestamp_unix_ns], dtype=np.int64),
+                             np.array([[gaze_x_original, gaze_y_original]], dtype=np.float32),
+                             np.array([[gaze_x_transformed, gaze_y_transformed]], dtype=np.float32))
+
+    def send_gaze_batch(self, timestamps_ns, gaze_xy, screen_xy, worn=None):
+        """Appends a batch; beyond `capacity` samples only the newest are kept."""
+        n = len(timestamps_ns)
+        if n == 0:
+            return
+        keep = slice(max(0, n - self.capacity), n)
+        sequences = self.write_sequence + np.arange(n, dtype=np.uint64)[keep]
+        index = sequences % self.capacity
+        slots = self.slots
+        self.header['reserve_sequence'] = self.write_sequence + n  # Readers discard copies of these slots
+        slots['timestamp_ns'][index] = timestamps_ns[keep]
+        slots['gaze_x'][index], slots['gaze_y'][index] = gaze_xy[keep, 0], gaze_xy[keep, 1]
+        slots['screen_x'][index], slots['screen_y'][index] = screen_xy[keep, 0], screen_xy[keep, 1]
+        slots['flags'][index] = SAMPLE_FLAG_WORN if worn is None else np.where(worn[keep], SAMPLE_FLAG_WORN, 0)
+        slots['sequence'][index] = sequences + 1  # Marks the slots complete
+        self.write_sequence += n
+        self.header['write_sequence'] = self.write_sequence  # Publishes the batch
+        RING_SAMPLES_WRITTEN.inc(n)
+
+    def close(self):
+        """Releases and removes the ring; attached readers keep their mapping until they close."""
+        del self.header, self.slots  # Views must go before the buffer can be released
+        self.shm.close()
+        self.shm.unlink()
+        _owned_rings.discard(self.shm.name)
+        print(f"SharedMemoryGazeWriter ring '{self.name}' closed.")
+
+
+class SharedMemoryGazeReader:
+    """
+    Reads the ring written by SharedMemoryGazeWriter, from any process on the host.
+    read() returns NumPy views into shared memory where possible (no copy);
+    a view stays valid until the writer laps it, i.e. `capacity` samples later.
+    """
+    def __init__(self, name=DEFAULT_RING_NAME):
+        self.name = name
+        self.shm = _attach_untracked(name)  # Only the writer owns the segment
+        self.header, self.slots = _ring_views(self.shm.buf)
+        if self.header['magic'][0] != RING_MAGIC or self.header['version'][0] != RING_VERSION:
+            raise ValueError(f"Shared memory '{name}' is not a gaze ring buffer")
+        self.capacity = len(self.slots)
+
+    @property
+    def write_sequence(self):
+        """Number of samples written so far."""
+        return int(self.header['write_sequence'][0])
+
+    def _oldest_intact(self):
+        """Index of the oldest sample the writer has not started overwriting."""
+        return int(self.header['reserve_sequence'][0]) - self.capacity
+
+    def latest(self):
+        """Returns a copy of the newest sample (a RING_SAMPLE_DTYPE record), or None."""
+        for _ in range(3):  # Retry if the writer lapped the slot while we copied it
+            sequence = self.write_sequence
+            if sequence == 0:
+                return None
+            sample = self.slots[(sequence - 1) % self.capacity].copy()
+            if sample['sequence'] == sequence and self._oldest_intact() < sequence:
+                return sample
+        return None
+
+    def read(self, since_sequence):
+        """
+        Returns (samples, next_sequence, lost) for every sample written after
+        `since_sequence` (a previous next_sequence, or 0). samples is a view
+        unless the range wraps around the end of the ring; lost counts samples
+        overwritten before they could be read.
+        """
+        end = self.write_sequence
+        start = max(since_sequence, end - self.capacity)
+        first = start % self.capacity
+        count = end - start
+        if first + count <= self.capacity:
+            samples = self.slots[first:first + count]
+        else:
+            samples = np.concatenate([self.slots[first:], self.slots[:first + count - self.capacity]])
+        # Samples the writer may have overwritten while we sliced are dropped from the front
+        overrun = min(count, max(0, self._oldest_intact() - start))
+        return samples[overrun:], end, start - since_sequence + overrun
+
+    def close(self):
+        del self.header, self.slots
+        self.shm.close()
+
+
+class SenderGroup:
+    """Sends every sample through several senders, e.g. UDP and the shared-memory ring."""
+    def __init__(self, senders):
+        self.senders = list(senders)
+
+    def send_gaze_data(self, *args):
+        for sender in self.senders:
+            sender.send_gaze_data(*args)
+
+    def send_gaze_batch(self, timestamps_ns, gaze_xy, screen_xy, worn=None):
+        for sender in self.senders:
+            sender.send_gaze_batch(timestamps_ns, gaze_xy, screen_xy, worn)
+
+    def close(self):
+        for sender in self.senders:
+            sender.close()
@@ -1,8 +1,8 @@
 import ctypes
 import ctypes.wintypes as wintypes
-import socket
-import struct
-import time
+
+import gaze_receiver
+import gaze_sender_network
 
 # --- Configuration ---
 UDP_IP = "127.0.0.1"
@@ -10,6 +10,7 @@ UDP_PORT = 5005
 CIRCLE_RADIUS = 30
 CIRCLE_COLOR_RGB = (255, 0, 0)  # Red
 CIRCLE_STROKE_WIDTH = 3
+FRAME_INTERVAL = 1.0 / 60  # Longest wait for gaze before pumping window messages again
 TRANSPARENT_COLOR_RGB = (1, 2, 3) # A specific, unlikely color to be transparent
                                   # Using pure black (0,0,0) can sometimes conflict if other UI elements use it.
 
@@ -176,11 +177,9 @@ def draw_gaze_circle():
 def main_loop():
     global last_gaze_px, last_gaze_py, running, hwnd, hdc, h_instance_global, class_name_global
 
-    # --- UDP Socket Setup ---
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # --- UDP Receiver Setup ---
     try:
-        sock.bind((UDP_IP, UDP_PORT))
-        sock.setblocking(False)
+        receiver = gaze_receiver.GazeReceiver(UDP_IP, UDP_PORT)
         print(f"Listening for gaze data on UDP {UDP_IP}:{UDP_PORT}")
     except OSError as e:
         print(f"Error binding UDP socket: {e}. Is another instance running or port in use?")
@@ -188,7 +187,7 @@ def main_loop():
 
     if not create_overlay_window():
         print("Could not create overlay window. Exiting.")
-        sock.close()
+        receiver.close()
         return
 
     print("Overlay active. Press Ctrl+C in the console to quit.")
@@ -205,22 +204,17 @@ def main_loop():
                 user32.DispatchMessageW(pMsg)
             if not running: break
 
-            try:
-                data, addr = sock.recvfrom(1024)
-                if len(data) == 24: # ts (double), gx, gy, px, py (floats)
-                    unpacked_data = struct.unpack('<dffff', data)
-                    px, py = unpacked_data[3], unpacked_data[4]
-                    
-                    new_gaze_px = max(0, min(screen_width - 1, int(px)))
-                    new_gaze_py = max(0, min(screen_height - 1, int(py)))
-
-                    if new_gaze_px != last_gaze_px or new_gaze_py != last_gaze_py:
-                        last_gaze_px, last_gaze_py = new_gaze_px, new_gaze_py
-                        draw_gaze_circle()
-            except BlockingIOError: pass
-            except socket.error: pass # Other socket errors
-            
-            time.sleep(0.005) # Small delay to yield CPU
+            # Sleeps until gaze arrives (or the next message pump), then drains the whole queue;
+            # only the newest sample is drawn, and only while the glasses are worn
+            if receiver.poll(FRAME_INTERVAL) and receiver.latest['flags'] & gaze_sender_network.SAMPLE_FLAG_WORN:
+                px, py = receiver.latest['screen_x'], receiver.latest['screen_y']
+
+                new_gaze_px = max(0, min(screen_width - 1, int(px)))
+                new_gaze_py = max(0, min(screen_height - 1, int(py)))
+
+                if new_gaze_px != last_gaze_px or new_gaze_py != last_gaze_py:
+                    last_gaze_px, last_gaze_py = new_gaze_px, new_gaze_py
+                    draw_gaze_circle()
 
     except KeyboardInterrupt:
         print("\nCtrl+C detected. Exiting.")
@@ -248,7 +242,7 @@ def main_loop():
             else:
                 print("Window class unregistered.")
         
-        sock.close()
+        receiver.close()
         print("Cleanup complete.")
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+import cv2
+import numpy as np
+
+# Target screen coordinates the detected corners are mapped onto (TL, TR, BR, BL)
+SCREEN_COORDINATES = np.array([[0, 0], [1920, 0], [1920, 1080], [0, 1080]], dtype=np.float32)
+
+
+def solve_homography_4pt(src_corners, dst_corners=SCREEN_COORDINATES):
+    """
+    Direct solve of the homography from exactly four correspondences.
+    With four points RANSAC has nothing to reject, so this is both exact and cheaper
+    than cv2.findHomography.
+    """
+    return cv2.getPerspectiveTransform(np.asarray(src_corners, dtype=np.float32),
+                                       np.asarray(dst_corners, dtype=np.float32))
+
+
+def solve_homography_4pt_batch(src_corners, dst_corners=SCREEN_COORDINATES):
+    """
+    solve_homography_4pt for (N, 4, 2) corner sets at once, as one batched 8x8
+    linear solve. Returns (N, 3, 3); quads without a solution get NaN matrices.
+    """
+    src = np.asarray(src_corners, dtype=np.float64).reshape(-1, 4, 2)
+    dst = np.asarray(dst_corners, dtype=np.float64).reshape(4, 2)
+    n = len(src)
+    x, y = src[:, :, 0], src[:, :, 1]
+    u, v = np.broadcast_to(dst[:, 0], x.shape), np.broadcast_to(dst[:, 1], x.shape)
+    zeros, ones = np.zeros_like(x), np.ones_like(x)
+    # Same system as cv2.getPerspectiveTransform, with h33 = 1
+    A = np.concatenate([np.stack([x, y, ones, zeros, zeros, zeros, -x * u, -y * u], axis=2),
+                        np.stack([zeros, zeros, zeros, x, y, ones, -x * v, -y * v], axis=2)], axis=1)
+    b = np.concatenate([u, v], axis=1)
+    H_matrices = np.full((n, 3, 3), np.nan)
+    solvable = np.abs(np.linalg.det(A)) > 1e-12
+    if solvable.any():
+        H_matrices.reshape(n, 9)[solvable, :8] = np.linalg.solve(A[solvable], b[solvable, :, None])[..., 0]
+        H_matrices[solvable, 2, 2] = 1.0
+    return H_matrices
+
+
+def corners_from_homography(H_matrix, dst_corners=SCREEN_COORDINATES):
+    """Scene-camera corners that H maps onto dst_corners, i.e. the inverse mapping of the screen corners."""
+    return cv2.perspectiveTransform(np.asarray(dst_corners, dtype=np.float64).reshape(-1, 1, 2),
+                                    np.linalg.inv(H_matrix)).reshape(-1, 2)
+
+
+def geometry_score(corners):
+    """
+    Corner-geometry sanity in [0, 1]: the smallest |sin| of the four interior
+    angles, 0 for non-convex or degenerate quads, 1 for a perfect rectangle.
+    """
+    quad = np.asarray(corners, dtype=np.float64)
+    if not cv2.isContourConvex(quad.astype(np.float32).reshape(-1, 1, 2)):
+        return 0.0
+    prev_edges = quad - np.roll(quad, 1, axis=0)
+    next_edges = np.roll(quad, -1, axis=0) - quad
+    lengths = np.linalg.norm(prev_edges, axis=1) * np.linalg.norm(next_edges, axis=1)
+    if np.any(lengths == 0):
+        return 0.0
+    cross = prev_edges[:, 0] * next_edges[:, 1] - prev_edges[:, 1] * next_edges[:, 0]
+    return float(np.min(np.abs(cross) / lengths))
+
+
+def conditioning_score(H_matrix, corners):
+    """
+    Local conditioning in [0, 1]: ratio of the smallest to the largest singular
+    value of the homography's Jacobian at the quad centroid. Strongly anisotropic
+    mappings amplify gaze errors along one axis and score low.
+    """
+    cx, cy = np.asarray(corners, dtype=np.float64).mean(axis=0)
+    h = H_matrix
+    w = h[2, 0] * cx + h[2, 1] * cy + h[2, 2]
+    if abs(w) < 1e-12:
+        return 0.0
+    u = (h[0, 0] * cx + h[0, 1] * cy + h[0, 2]) / w
+    v = (h[1, 0] * cx + h[1, 1] * cy + h[1, 2]) / w
+    jacobian = np.array([[h[0, 0] - u * h[2, 0], h[0, 1] - u * h[2, 1]],
+                         [h[1, 0] - v * h[2, 0], h[1, 1] - v * h[2, 1]]]) / w
+    singular_values = np.linalg.svd(jacobian, compute_uv=False)
+    if singular_values[0] == 0:
+        return 0.0
+    return float(singular_values[1] / singular_values[0])
+
+
+def agreement_score(corners, prev_H, dst_corners=SCREEN_COORDINATES, scale_px=200.0):
+    """
+    Agreement with the previous homography in [0, 1]: how far the previous H
+    maps the new corners from their screen targets, in screen pixels.
+    """
+    if prev_H is None:
+        return 1.0
+    projected = cv2.perspectiveTransform(np.asarray(corners, dtype=np.float32).reshape(-1, 1, 2), prev_H)
+    distance = np.mean(np.linalg.norm(projected.reshape(-1, 2) - dst_corners, axis=1))
+    return float(np.exp(-distance / scale_px))
+
+
+class HomographyEstimator:
+    """
+    Homography stage: solves H directly from the four detected corners and
+    gates it with a cheap quality score combining corner geometry, local
+    conditioning and agreement with the previous H.
+      - score >= accept_threshold: the new H is used as is.
+      - reject_threshold <= score < accept_threshold: the corners are blended
+        with the previous ones, weighted by the score.
+      - score < reject_threshold: the solution is rejected and the previous H
+        is held for at most `max_hold` frames.
+    """
+    def __init__(self, accept_threshold=0.5, reject_threshold=0.2, max_hold=3,
+                 dst_corners=SCREEN_COORDINATES):
+        self.accept_threshold = accept_threshold
+        self.reject_threshold = reject_threshold
+        self.max_hold = max_hold
+        self.dst_corners = dst_corners
+        self.prev_H = None
+        self.prev_corners = None
+        self.held_frames = 0
+        self.last_score = None
+        self.rejections = 0
+
+    def reset(self):
+        self.prev_H = None
+        self.prev_corners = None
+        self.held_frames = 0
+
+    def score(self, corners, H_matrix):
+        agreement = agreement_score(corners, self.prev_H, self.dst_corners)
+        # Agreement only halves the score at most, so genuine head motion is not rejected
+        return geometry_score(corners) * conditioning_score(H_matrix, corners) * (0.5 + 0.5 * agreement)
+
+    def update(self, corners):
+        """Returns (H_matrix or None, quality score or None) for the detected corners."""
+        if corners is None:
+            self.reset()
+            self.last_score = None
+            return None, None
+
+        H_matrix = solve_homography_4pt(corners, self.dst_corners)
+        score = self.score(corners, H_matrix)
+        self.last_score = score
+
+        if score < self.reject_threshold:
+            self.rejections += 1
+            self.held_frames += 1
+            if self.prev_H is None or self.held_frames > self.max_hold:
+                self.reset()
+                return None, score
+            return self.prev_H, score
+
+        if score < self.accept_threshold and self.prev_corners is not None:
+            weight = (score - self.reject_threshold) / (self.accept_threshold - self.reject_threshold)
+            corners = weight * corners + (1.0 - weight) * self.prev_corners
+            H_matrix = solve_homography_4pt(corners, self.dst_corners)
+
+        self.prev_H = H_matrix
+        self.prev_corners = np.asarray(corners, dtype=np.float32)
+        self.held_frames = 0
+        return H_matrix, score
@@ -0,0 +1,90 @@
+import collections
+import json
+import threading
+import time
+
+import numpy as np
+
+# Stages, in pipeline order, at which frames and gaze samples are stamped
+FRAME_STAGES = ("received", "detected", "homography")
+GAZE_STAGES = ("received", "mapped", "sent")
+
+
+def device_timestamp_ns(datum):
+    """Device timestamp of a frame or gaze datum in unix nanoseconds."""
+    ts = getattr(datum, "timestamp_unix_ns", None)
+    if ts is None:
+        ts = int(datum.timestamp_unix_seconds * 1e9)
+    return ts
+
+
+class LatencyTracer:
+    """
+    Collects per-stage latencies, measured from the device timestamp
+    (timestamp_unix_ns) to the host time each stage finished, and reports
+    rolling p50/p95/p99 per stage every `report_interval` seconds.
+    clock_offset_ns: device clock minus host clock, e.g. from
+    device.estimate_time_offset(), so ages are not skewed by clock drift.
+    dump_path: optional file that gets one JSON line per report.
+    """
+    def __init__(self, window=2000, report_interval=10.0, dump_path=None, clock_offset_ns=0):
+        self.window = window
+        self.report_interval = report_interval
+        self.dump_path = dump_path
+        self.clock_offset_ns = clock_offset_ns
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._next_report = time.monotonic() + report_interval
+
+    @staticmethod
+    def now_ns():
+        return time.time_ns()
+
+    def record(self, kind, stage, device_ts_ns, stage_ns=None):
+        """Records the age of one frame/sample (`kind`) when it finished `stage`."""
+        self.record_batch(kind, stage, [device_ts_ns], stage_ns)
+
+    def record_batch(self, kind, stage, device_ts_ns, stage_ns=None):
+        """Records the ages of several samples that finished `stage` at the same time."""
+        if stage_ns is None:
+            stage_ns = self.now_ns()
+        ages_ms = (stage_ns - (np.asarray(device_ts_ns, dtype=np.int64) - self.clock_offset_ns)) / 1e6
+        with self._lock:
+            samples = self._samples.get((kind, stage))
+            if samples is None:
+                samples = self._samples[(kind, stage)] = collections.deque(maxlen=self.window)
+            samples.extend(ages_ms.tolist())
+        self.maybe_report()
+
+    def summary(self):
+        """Returns {"kind/stage": {"count", "p50_ms", "p95_ms", "p99_ms"}} over the rolling window."""
+        with self._lock:
+            snapshot = {key: np.array(values) for key, values in self._samples.items() if values}
+        result = {}
+        for (kind, stage), values in sorted(snapshot.items()):
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            result[f"{kind}/{stage}"] = {"count": len(values), "p50_ms": round(float(p50), 3),
+                                         "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3)}
+        return result
+
+    def maybe_report(self):
+        if not self.report_interval:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_report:
+                return
+            self._next_report = now + self.report_interval
+        self.report()
+
+    def report(self):
+        summary = self.summary()
+        if not summary:
+            return
+        print("Latency since device timestamp (ms):")
+        for key, stats in summary.items():
+            print(f"  {key:<20} p50={stats['p50_ms']:8.2f}  p95={stats['p95_ms']:8.2f}  "
+                  f"p99={stats['p99_ms']:8.2f}  (n={stats['count']})")
+        if self.dump_path:
+            with open(self.dump_path, "a") as f:
+                f.write(json.dumps({"time_unix": time.time(), "stages": summary}) + "\n")
@@ -0,0 +1,196 @@
+import bisect
+import http.server
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _label_text(labels):
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+class Counter:
+    """
+    Monotonically increasing value.
+    labels(key=value) returns a child counter exported as a separate labelled
+    series of the same metric, e.g. one per subscriber.
+    """
+    type_name = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self.value = 0
+        self._children = {}
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def labels(self, **labels):
+        key = _label_text(dict(sorted(labels.items())))
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = Counter(self.name + key, self.help_text)
+            return child
+
+    def samples(self):
+        with self._lock:
+            children = list(self._children.values())
+        return [(self.name, self.value)] + [(child.name, child.value) for child in children]
+
+
+class Gauge:
+    """Value that can go up and down."""
+    type_name = "gauge"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value  # A single assignment is atomic, no lock needed
+
+    def samples(self):
+        return [(self.name, self.value)]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values."""
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self):
+        with self._lock:
+            counts, total, count = list(self._counts), self.sum, self.count
+        result = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            result.append((f'{self.name}_bucket{{le="{le}"}}', cumulative))
+        result.append((f"{self.name}_sum", total))
+        result.append((f"{self.name}_count", count))
+        return result
+
+
+class MetricsRegistry:
+    """In-process collection of metrics, rendered in the Prometheus text format."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get_or_create(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.type_name}")
+            return metric
+
+    def counter(self, name, help_text):
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name, help_text):
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for sample_name, value in metric.samples():
+                lines.append(f"{sample_name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry used by the pipeline and the sender
+registry = MetricsRegistry()
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the console
+
+
+class MetricsServer:
+    """Serves a registry at http://<host>:<port>/metrics on a background thread."""
+    def __init__(self, port, host="127.0.0.1", metrics_registry=None):
+        self.httpd = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.registry = metrics_registry or registry
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="MetricsServer", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        host, port = self.httpd.server_address[:2]
+        print(f"Metrics available at http://{host}:{port}/metrics")
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class RateLimitedLog:
+    """
+    Logs at most one message per `interval_seconds` and reports how many were
+    suppressed in between. Meant for per-packet paths where logging every event
+    would cost more than the work itself.
+    """
+    def __init__(self, logger, interval_seconds=5.0):
+        self.logger = logger
+        self.interval_seconds = interval_seconds
+        self._last_time = 0.0
+        self._suppressed = 0
+
+    def __call__(self, level, msg, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        if now - self._last_time < self.interval_seconds:
+            self._suppressed += 1
+            return
+        if self._suppressed:
+            msg = f"{msg} ({self._suppressed} similar messages suppressed)"
+        self._last_time = now
+        self._suppressed = 0
+        self.logger.log(level, msg, *args)
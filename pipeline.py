@@ -0,0 +1,537 @@
+import collections
+import queue
+import threading
+import time
+
+import numpy as np
+
+import gaze_mapping
+import homography
+import latency
+import metrics
+import screen_processing
+
+# --- Pipeline metrics ---
+FRAMES_RECEIVED = metrics.registry.counter("gaze_frames_received_total", "Scene frames received from the device.")
+FRAMES_DROPPED = metrics.registry.counter("gaze_frames_dropped_total", "Scene frames dropped before detection.")
+DETECTION_RUNS = metrics.registry.counter("gaze_detection_runs_total", "Frames the screen detector ran on.")
+DETECTION_HITS = metrics.registry.counter("gaze_detection_hits_total", "Detector runs that found the screen.")
+DETECTION_HIT_RATE = metrics.registry.gauge("gaze_detection_hit_ratio", "Fraction of detector runs that found the screen.")
+DETECTION_REUSED = metrics.registry.counter("gaze_detection_reused_total", "Frames that reused the previous result (static scene).")
+DETECTION_SECONDS = metrics.registry.histogram("gaze_detection_seconds", "Screen detection and homography time per frame.")
+DETECTION_COASTED = metrics.registry.counter("gaze_detection_coasted_total", "Missed detections bridged by the corner filter.")
+HOMOGRAPHY_FAILURES = metrics.registry.counter("gaze_homography_failures_total", "Detected screens whose homography was rejected.")
+GAZE_RECEIVED = metrics.registry.counter("gaze_samples_received_total", "Gaze samples received from the device.")
+GAZE_MAPPED = metrics.registry.counter("gaze_samples_mapped_total", "Gaze samples mapped to screen coordinates.")
+GAZE_DROPPED = metrics.registry.counter("gaze_samples_dropped_total", "Gaze samples dropped (no valid homography or pending buffer full).")
+GAZE_OVERFLOWED = metrics.registry.counter("gaze_samples_overflowed_total", "Gaze samples dropped because an intake buffer was full.")
+
+class LatestValueQueue:
+    """
+    Bounded queue that never blocks the producer.
+    When full, putting a new item drops the oldest one, so consumers always
+    work on the most recent data instead of a growing backlog.
+    """
+    def __init__(self, maxsize=1):
+        self._items = collections.deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        """Queues an item. Returns True if an older item had to be dropped for it."""
+        with self._cond:
+            dropped = len(self._items) == self._items.maxlen
+            if dropped:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+        return dropped
+
+    def get(self, timeout=None):
+        """Returns the oldest queued item, or None on timeout / close."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def close(self):
+        """Wakes up all waiting consumers."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class HomographyState:
+    """Thread-safe holder for the most recent valid homography."""
+    aligned = False  # Whether samples are mapped by their own timestamp (see HomographyHistory)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._H = None
+
+    def set(self, H):
+        with self._lock:
+            self._H = H
+
+    def get(self):
+        with self._lock:
+            return self._H
+
+    def update(self, timestamp_ns, H):
+        """Records the homography of the frame at timestamp_ns (None: screen not found)."""
+        self.set(H)
+
+    def homographies_at(self, timestamps_ns):
+        """Returns ((N, 3, 3) homographies, (N,) valid mask): the latest H for every sample."""
+        H = self.get()
+        if H is None:
+            return np.full((len(timestamps_ns), 3, 3), np.nan), np.zeros(len(timestamps_ns), dtype=bool)
+        return np.broadcast_to(H, (len(timestamps_ns), 3, 3)), np.ones(len(timestamps_ns), dtype=bool)
+
+
+class HomographyHistory(HomographyState):
+    """
+    Bounded, thread-safe history of (frame timestamp, homography), so each gaze
+    sample is mapped with the screen position at its own timestamp:
+      - between two frames where the screen was found, the corners are
+        interpolated linearly in time and H is solved for every sample;
+      - next to a frame where it was not found, the nearest frame decides;
+      - after the newest frame, its H is held for at most max_hold_ns (about
+        two frame periods). GazeWorker holds samples back until a later frame
+        arrives, so this only applies when that wait times out.
+    Samples older than the history or beyond the hold are rejected.
+    """
+    aligned = True
+
+    def __init__(self, maxlen=64, max_hold_ns=70_000_000):
+        super().__init__()
+        self.max_hold_ns = max_hold_ns
+        self._entries = collections.deque(maxlen=maxlen)  # (timestamp_ns, H or None, corners or None)
+
+    def update(self, timestamp_ns, H):
+        corners = None if H is None else homography.corners_from_homography(H)
+        with self._lock:
+            if self._entries and timestamp_ns <= self._entries[-1][0]:
+                return  # Out of order or duplicate frame
+            self._entries.append((timestamp_ns, H, corners))
+            self._H = H
+
+    def newest_timestamp(self):
+        """Timestamp of the newest frame, or None."""
+        with self._lock:
+            return self._entries[-1][0] if self._entries else None
+
+    def homographies_at(self, timestamps_ns):
+        with self._lock:
+            entries = list(self._entries)
+        n = len(timestamps_ns)
+        H_matrices = np.full((n, 3, 3), np.nan)
+        if not entries or n == 0:
+            return H_matrices, np.zeros(n, dtype=bool)
+
+        frame_ts = np.array([e[0] for e in entries], dtype=np.int64)
+        found = np.array([e[1] is not None for e in entries])
+        after = np.searchsorted(frame_ts, timestamps_ns, side="right")  # First frame later than the sample
+        before = after - 1
+
+        # After the newest frame: hold its homography
+        held = (after == len(entries)) & (timestamps_ns - frame_ts[-1] <= self.max_hold_ns) & found[-1]
+        if held.any():
+            H_matrices[held] = entries[-1][1]
+
+        inside = (before >= 0) & (after < len(entries))
+        prev, next_ = before[inside], after[inside]
+        both = found[prev] & found[next_]
+        # One side without a screen: use the nearest frame, if it has one
+        ts_inside = timestamps_ns[inside]
+        nearest = np.where(ts_inside - frame_ts[prev] <= frame_ts[next_] - ts_inside, prev, next_)
+        single = ~both & found[nearest]
+        rows = np.flatnonzero(inside)
+        for row, index in zip(rows[single], nearest[single]):
+            H_matrices[row] = entries[index][1]
+        if both.any():
+            prev, next_ = prev[both], next_[both]
+            corners = np.stack([e[2] if e[2] is not None else np.zeros((4, 2)) for e in entries])
+            alpha = ((ts_inside[both] - frame_ts[prev]) / (frame_ts[next_] - frame_ts[prev]))[:, None, None]
+            H_matrices[rows[both]] = homography.solve_homography_4pt_batch(
+                corners[prev] + alpha * (corners[next_] - corners[prev]))
+
+        return H_matrices, np.isfinite(H_matrices[:, 0, 0])
+
+
+class DetectionResult:
+    """
+    Output of the detection stage for one scene frame.
+    timestamps: host time (unix ns) at which each stage finished, plus the
+    frame's device timestamp under "device".
+    corner_std: standard deviation of the filtered corners in pixels (see
+    corner_filter.CornerKalmanFilter), None without a filter or screen.
+    """
+    def __init__(self, frame, corners, H_matrix, homography_valid, homography_score=None, timestamps=None,
+                 corner_std=None):
+        self.frame = frame
+        self.image = frame.bgr_pixels
+        self.corners = corners
+        self.H_matrix = H_matrix
+        self.homography_valid = homography_valid
+        self.homography_score = homography_score
+        self.timestamps = timestamps or {}
+        self.corner_std = corner_std
+
+
+class _Worker(threading.Thread):
+    """Base class for pipeline stages. Any uncaught error stops the whole pipeline."""
+    def __init__(self, name, stop_event):
+        super().__init__(name=name, daemon=True)
+        self.stop_event = stop_event
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                self.step()
+        except Exception as e:
+            print(f"An error occurred in {self.name}: {e}")
+            self.stop_event.set()
+
+    def step(self):
+        raise NotImplementedError
+
+
+class CaptureWorker(_Worker):
+    """Pulls scene frames from the device into the frame queue, stamped with their host receive time."""
+    def __init__(self, device, frame_queue, stop_event, timeout_seconds=0.5):
+        super().__init__("CaptureWorker", stop_event)
+        self.device = device
+        self.frame_queue = frame_queue
+        self.timeout_seconds = timeout_seconds
+
+    def step(self):
+        frame = self.device.receive_scene_video_frame(timeout_seconds=self.timeout_seconds)
+        if frame is not None:
+            FRAMES_RECEIVED.inc()
+            if self.frame_queue.put((frame, latency.LatencyTracer.now_ns())):
+                FRAMES_DROPPED.inc()
+        elif getattr(self.device, "finished", False):
+            print("Device stream ended.")  # e.g. a replayed recording ran out
+            self.stop_event.set()
+
+
+class DetectionWorker(_Worker):
+    """
+    Detects the screen in the latest frame and publishes the resulting homography.
+    With a scene_gate, frames that barely differ from the last processed one
+    reuse the previous corners and homography instead of running detection.
+    With a corner_filter (corner_filter.CornerKalmanFilter), the detected
+    corners are smoothed over time and short misses are bridged by its prediction.
+    on_frame_done: optional callable getting each frame's device timestamp once
+    its homography is published (e.g. recording.ReplayDevice.frame_processed).
+    """
+    def __init__(self, frame_queue, homography_state, result_queue, stop_event,
+                 detector=screen_processing.detect_screen_corners, scene_gate=None,
+                 homography_estimator=None, tracer=None, corner_filter=None, on_frame_done=None):
+        super().__init__("DetectionWorker", stop_event)
+        self.tracer = tracer
+        self.frame_queue = frame_queue
+        self.homography_state = homography_state
+        self.result_queue = result_queue
+        self.detector = detector
+        self.scene_gate = scene_gate
+        self.homography_estimator = homography_estimator or homography.HomographyEstimator()
+        self.corner_filter = corner_filter
+        self.on_frame_done = on_frame_done
+        self.last_corners = None
+        self.last_H = None
+        self.last_score = None
+        self.last_corner_std = None
+
+    def step(self):
+        item = self.frame_queue.get(timeout=0.5)
+        if item is not None:
+            self.process(*item)
+
+    def process(self, frame, received_ns):
+        """Runs detection (or reuses the last result) for one frame and publishes the homography."""
+        timestamps = {"device": latency.device_timestamp_ns(frame), "received": received_ns}
+
+        if self.scene_gate is not None and not self.scene_gate.has_changed(frame.bgr_pixels, self.last_corners):
+            detected_corners, H_matrix, score = self.last_corners, self.last_H, self.last_score
+            corner_std = self.last_corner_std
+            DETECTION_REUSED.inc()
+            timestamps["detected"] = timestamps["homography"] = latency.LatencyTracer.now_ns()
+        else:
+            start = time.perf_counter()
+            raw_corners = self.detector(frame.bgr_pixels)
+            detected_corners, corner_std = raw_corners, None
+            if self.corner_filter is not None:
+                detected_corners = self.corner_filter.update(raw_corners, timestamps["device"])
+                corner_std = self.corner_filter.position_std if detected_corners is not None else None
+            timestamps["detected"] = latency.LatencyTracer.now_ns()
+            H_matrix, score = self.homography_estimator.update(detected_corners)
+            timestamps["homography"] = latency.LatencyTracer.now_ns()
+            DETECTION_SECONDS.observe(time.perf_counter() - start)
+            self.last_corners, self.last_H, self.last_score = detected_corners, H_matrix, score
+            self.last_corner_std = corner_std
+
+            DETECTION_RUNS.inc()
+            if raw_corners is None and detected_corners is not None:
+                DETECTION_COASTED.inc()
+            if raw_corners is not None:
+                DETECTION_HITS.inc()
+                if H_matrix is None:
+                    HOMOGRAPHY_FAILURES.inc()
+            DETECTION_HIT_RATE.set(DETECTION_HITS.value / DETECTION_RUNS.value)
+
+        # Gaze is only sent while the screen is visible, so record misses too
+        self.homography_state.update(timestamps["device"], H_matrix)
+        if self.tracer is not None:
+            for stage in latency.FRAME_STAGES:
+                self.tracer.record("frame", stage, timestamps["device"], timestamps[stage])
+        self.result_queue.put(DetectionResult(frame, detected_corners, H_matrix, H_matrix is not None, score,
+                                              timestamps, corner_std))
+        if self.on_frame_done is not None:
+            self.on_frame_done(timestamps["device"])
+
+
+class GazeIntakeWorker(_Worker):
+    """
+    Polls the device's gaze stream as fast as it delivers into a bounded queue
+    (oldest samples are dropped when full). The realtime API's simple device
+    only keeps the newest datum, so this is what lets GazeWorker drain real
+    batches. Each datum is stamped with its host receive time here, so the
+    latency trace includes the time it spent queued.
+    """
+    def __init__(self, device, stop_event, timeout_seconds=0.5, maxsize=4096):
+        super().__init__("GazeIntakeWorker", stop_event)
+        self.device = device
+        self.timeout_seconds = timeout_seconds
+        self.queue = queue.Queue(maxsize)
+
+    def step(self):
+        gaze = self.device.receive_gaze_datum(timeout_seconds=self.timeout_seconds)
+        if gaze is None:
+            return
+        item = (gaze, latency.LatencyTracer.now_ns())
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    GAZE_OVERFLOWED.inc()
+                except queue.Empty:
+                    pass
+
+    def _get(self, timeout_seconds):
+        try:
+            if timeout_seconds == 0:
+                return self.queue.get_nowait()
+            return self.queue.get(timeout=timeout_seconds)
+        except queue.Empty:
+            return None
+
+    def receive_gaze_datum(self, timeout_seconds=None):
+        """Same surface as a device: the next datum, without its receive time."""
+        item = self._get(timeout_seconds)
+        return None if item is None else item[0]
+
+    def drain(self, timeout_seconds=0.5, max_samples=256):
+        """
+        Blocks for the first datum, then takes every queued one without waiting.
+        Returns (samples, (N,) int64 host receive times in ns).
+        """
+        items = []
+        item = self._get(timeout_seconds)
+        while item is not None:
+            items.append(item)
+            if len(items) == max_samples:
+                break
+            item = self._get(0)
+        return [gaze for gaze, _ in items], np.array([ns for _, ns in items], dtype=np.int64)
+
+    def drain_nowait(self):
+        """Returns (samples, receive times) of every queued datum without waiting."""
+        return self.drain(timeout_seconds=0, max_samples=self.queue.maxsize or 1 << 30)
+
+
+class GazeWorker(_Worker):
+    """
+    Drains every pending gaze datum, maps the batch in one vectorized call and
+    hands it to the sender, so the full device gaze rate reaches consumers.
+    With a HomographyHistory each sample is mapped with the homography at its
+    own timestamp. Gaze arrives ahead of the frames that bracket it, so
+    samples wait in a bounded buffer until a frame at or after their timestamp
+    has been processed, or for at most max_delay_ns (host time), after which
+    the history's hold applies. With a HomographyState samples are mapped at
+    once with the latest homography.
+    """
+    def __init__(self, device, homography_state, gaze_sender, stop_event, timeout_seconds=0.5, tracer=None,
+                 max_delay_ns=50_000_000, max_pending=1024):
+        super().__init__("GazeWorker", stop_event)
+        self.tracer = tracer
+        self.device = device
+        self.homography_state = homography_state
+        self.gaze_sender = gaze_sender
+        self.timeout_seconds = timeout_seconds
+        self.max_delay_ns = max_delay_ns
+        self.max_pending = max_pending
+        # Samples waiting for a bracketing frame: timestamps, gaze points, worn flags, host receive times
+        self._pending_ts = np.empty(0, dtype=np.int64)
+        self._pending_xy = np.empty((0, 2), dtype=np.float32)
+        self._pending_worn = np.empty(0, dtype=bool)
+        self._pending_received = np.empty(0, dtype=np.int64)
+
+    def step(self):
+        timeout = self.timeout_seconds if not len(self._pending_ts) else self.max_delay_ns / 1e9
+        drain = getattr(self.device, "drain", None)  # GazeIntakeWorker: samples stamped on arrival
+        if drain is not None:
+            samples, received_ns = drain(timeout_seconds=timeout)
+        else:
+            samples, received_ns = gaze_mapping.drain_gaze_data(self.device, timeout_seconds=timeout), None
+        if samples:
+            self.process(samples, received_ns)
+        else:
+            self.flush()
+
+    @property
+    def pending(self):
+        """Number of samples waiting for a bracketing frame."""
+        return len(self._pending_ts)
+
+    def process(self, samples, received_ns=None):
+        """
+        Adds a batch of gaze datums and maps every sample that is ready.
+        received_ns: host receive time of the batch, or an (N,) array with one per sample (default: now).
+        """
+        if received_ns is None:
+            received_ns = latency.LatencyTracer.now_ns()
+        GAZE_RECEIVED.inc(len(samples))
+
+        # Not-worn samples are mapped and sent with their worn flag cleared; senders without flags skip them
+        timestamps_ns, gaze_xy, worn = gaze_mapping.gaze_to_arrays(samples)
+        self._pending_ts = np.concatenate([self._pending_ts, timestamps_ns])
+        self._pending_xy = np.concatenate([self._pending_xy, gaze_xy])
+        self._pending_worn = np.concatenate([self._pending_worn, worn])
+        self._pending_received = np.concatenate([self._pending_received,
+                                                 np.broadcast_to(np.asarray(received_ns, dtype=np.int64),
+                                                                 len(timestamps_ns))])
+        overflow = len(self._pending_ts) - self.max_pending
+        if overflow > 0:
+            GAZE_DROPPED.inc(overflow)
+            self._take(overflow)
+        self.flush(int(np.max(received_ns)))  # The newest arrival is "now"
+
+    def _take(self, count):
+        taken = (self._pending_ts[:count], self._pending_xy[:count], self._pending_worn[:count],
+                 self._pending_received[:count])
+        self._pending_ts = self._pending_ts[count:]
+        self._pending_xy = self._pending_xy[count:]
+        self._pending_worn = self._pending_worn[count:]
+        self._pending_received = self._pending_received[count:]
+        return taken
+
+    def flush_all(self):
+        """Maps every pending sample without waiting any longer, e.g. once the streams have ended."""
+        self.flush(np.iinfo(np.int64).max)
+
+    def flush(self, now_ns=None):
+        """Maps and sends the pending samples that have a bracketing frame or waited max_delay_ns."""
+        if not len(self._pending_ts):
+            return
+        if now_ns is None:
+            now_ns = latency.LatencyTracer.now_ns()
+        ready = np.ones(len(self._pending_ts), dtype=bool)
+        if self.homography_state.aligned:
+            newest = self.homography_state.newest_timestamp()
+            ready = now_ns - self._pending_received >= self.max_delay_ns
+            if newest is not None:
+                ready |= self._pending_ts <= newest
+        # Samples are in time order, so everything up to the last ready one goes
+        count = int(np.flatnonzero(ready)[-1]) + 1 if ready.any() else 0
+        if count == 0:
+            return
+        timestamps_ns, gaze_xy, worn, received_ns = self._take(count)
+
+        H_matrices, valid = self.homography_state.homographies_at(timestamps_ns)
+        screen_xy, mappable = gaze_mapping.map_gaze_points_batch(H_matrices, gaze_xy)
+        valid &= mappable
+        if not valid.all():
+            GAZE_DROPPED.inc(int(len(valid) - valid.sum()))
+            timestamps_ns, gaze_xy, screen_xy = timestamps_ns[valid], gaze_xy[valid], screen_xy[valid]
+            worn, received_ns = worn[valid], received_ns[valid]
+        if len(timestamps_ns) == 0:
+            return
+        mapped_ns = latency.LatencyTracer.now_ns()
+        GAZE_MAPPED.inc(len(timestamps_ns))
+        self.gaze_sender.send_gaze_batch(timestamps_ns, gaze_xy, screen_xy, worn)
+
+        if self.tracer is not None:
+            sent_ns = latency.LatencyTracer.now_ns()
+            for stage, stage_ns in zip(latency.GAZE_STAGES, (received_ns, mapped_ns, sent_ns)):
+                self.tracer.record_batch("gaze", stage, timestamps_ns, stage_ns)
+
+
+class Pipeline:
+    """
+    Staged capture -> detect -> map/send pipeline.
+    Each stage runs on its own thread and hands data over through latest-value
+    queues, so a slow stage drops stale frames instead of delaying the others.
+    OpenCV releases the GIL, so detection runs in parallel with capture and gaze mapping.
+    tracer: optional latency.LatencyTracer that gets every stage of every frame and sample.
+    homography_state: HomographyHistory (default) or HomographyState.
+    corner_filter: optional corner_filter.CornerKalmanFilter for the detection stage.
+    max_gaze_delay_ns: how long gaze may wait for a bracketing frame (see GazeWorker).
+    """
+    def __init__(self, device, gaze_sender, detector=screen_processing.detect_screen_corners,
+                 scene_gate=None, tracer=None, homography_state=None, corner_filter=None,
+                 max_gaze_delay_ns=50_000_000):
+        self.stop_event = threading.Event()
+        self.frame_queue = LatestValueQueue(maxsize=1)
+        self.results = LatestValueQueue(maxsize=1)
+        self.homography_state = homography_state or HomographyHistory()
+        self.scene_gate = scene_gate
+        self.tracer = tracer
+
+        self.gaze_intake = GazeIntakeWorker(device, self.stop_event)
+        self.workers = [
+            CaptureWorker(device, self.frame_queue, self.stop_event),
+            self.gaze_intake,
+            DetectionWorker(self.frame_queue, self.homography_state, self.results,
+                            self.stop_event, detector=detector, scene_gate=scene_gate, tracer=tracer,
+                            corner_filter=corner_filter, on_frame_done=getattr(device, "frame_processed", None)),
+            GazeWorker(self.gaze_intake, self.homography_state, gaze_sender, self.stop_event, tracer=tracer,
+                       max_delay_ns=max_gaze_delay_ns),
+        ]
+
+    @property
+    def running(self):
+        return not self.stop_event.is_set()
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        print("Pipeline started: " + ", ".join(w.name for w in self.workers))
+
+    def stop(self, timeout=2.0):
+        self.stop_event.set()
+        self.frame_queue.close()
+        self.results.close()
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.join(timeout)
+        gaze_worker = self.workers[-1]
+        if not gaze_worker.is_alive() and not self.gaze_intake.is_alive():
+            # Map what was received but not processed yet, e.g. the end of a replay
+            remaining, received_ns = self.gaze_intake.drain_nowait()
+            if remaining:
+                gaze_worker.process(remaining, received_ns)
+            gaze_worker.flush_all()
+        print(f"Pipeline stopped. Dropped frames: {self.frame_queue.dropped}")
+        if self.scene_gate is not None:
+            print(f"Scene-change gate: {self.scene_gate.hits} frames reused, "
+                  f"{self.scene_gate.misses} processed ({self.scene_gate.hit_rate:.0%} saved)")
+        if self.tracer is not None:
+            self.tracer.report()
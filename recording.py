@@ -0,0 +1,275 @@
+"""
+Record-and-replay stand-in for a Neon device.
+
+A recording is a directory with:
+  meta.json             frame shape and format version
+  frames.raw            scene frames, uint8 BGR, back to back (memory-mappable)
+  frame_timestamps.bin  int64 device timestamps (unix ns), one per frame
+  gaze.bin              GAZE_DTYPE records, one per gaze datum
+
+Usage:
+  python recording.py record OUT_DIR [--duration SECONDS]
+  python recording.py info REC_DIR
+"""
+import argparse
+import collections
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import latency
+
+FORMAT_VERSION = 1
+GAZE_DTYPE = np.dtype([('timestamp_ns', '<i8'), ('x', '<f4'), ('y', '<f4'), ('worn', 'u1')])
+
+ReplayVideoFrame = collections.namedtuple('ReplayVideoFrame', 'bgr_pixels timestamp_unix_seconds timestamp_unix_ns')
+ReplayGazeDatum = collections.namedtuple('ReplayGazeDatum', 'x y worn timestamp_unix_seconds timestamp_unix_ns')
+
+
+class RecordingDevice:
+    """
+    Wraps a device and writes every scene frame and gaze datum received
+    through it to `path`, so recording can run alongside the live pipeline.
+    """
+    def __init__(self, device, path):
+        self.device = device
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._frames_file = open(os.path.join(path, "frames.raw"), "wb")
+        self._frame_ts_file = open(os.path.join(path, "frame_timestamps.bin"), "wb")
+        self._gaze_file = open(os.path.join(path, "gaze.bin"), "wb")
+        self.frame_shape = None
+        self.frame_count = 0
+        self.gaze_count = 0
+        print(f"Recording scene video and gaze to {path}")
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)  # Anything not recorded is passed through
+
+    def receive_scene_video_frame(self, timeout_seconds=None):
+        frame = self.device.receive_scene_video_frame(timeout_seconds=timeout_seconds)
+        if frame is not None:
+            pixels = np.ascontiguousarray(frame.bgr_pixels)
+            if self.frame_shape is None:
+                self.frame_shape = pixels.shape
+                self._write_meta()
+            elif pixels.shape != self.frame_shape:
+                raise ValueError(f"Frame shape changed during recording: {pixels.shape} != {self.frame_shape}")
+            self._frames_file.write(memoryview(pixels))
+            self._frame_ts_file.write(np.int64(latency.device_timestamp_ns(frame)).tobytes())
+            self.frame_count += 1
+        return frame
+
+    def receive_gaze_datum(self, timeout_seconds=None):
+        gaze = self.device.receive_gaze_datum(timeout_seconds=timeout_seconds)
+        if gaze is not None:
+            record = np.array((latency.device_timestamp_ns(gaze), gaze.x, gaze.y, gaze.worn), dtype=GAZE_DTYPE)
+            self._gaze_file.write(record.tobytes())
+            self.gaze_count += 1
+        return gaze
+
+    def _write_meta(self):
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({"version": FORMAT_VERSION, "frame_shape": list(self.frame_shape)}, f)
+
+    def close(self):
+        for f in (self._frames_file, self._frame_ts_file, self._gaze_file):
+            f.close()
+        print(f"Recording closed: {self.frame_count} frames, {self.gaze_count} gaze samples in {self.path}")
+        self.device.close()
+
+
+def load_recording(path):
+    """
+    Returns (frames, frame_timestamps_ns, gaze) for a recording directory.
+    frames is a read-only (N, H, W, 3) memmap, so nothing is loaded up front.
+    """
+    frames, frame_timestamps = load_frames(path)
+    return frames, frame_timestamps, np.fromfile(os.path.join(path, "gaze.bin"), dtype=GAZE_DTYPE)
+
+
+def load_frames(path):
+    """Returns (frames memmap, frame_timestamps_ns) of a recording directory, without its gaze."""
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported recording format version: {meta.get('version')}")
+
+    frame_timestamps = np.fromfile(os.path.join(path, "frame_timestamps.bin"), dtype=np.int64)
+    frame_shape = tuple(meta["frame_shape"])
+    frame_count = min(len(frame_timestamps),
+                      os.path.getsize(os.path.join(path, "frames.raw")) // int(np.prod(frame_shape)))
+    frames = np.memmap(os.path.join(path, "frames.raw"), dtype=np.uint8, mode="r",
+                       shape=(frame_count,) + frame_shape) if frame_count else np.empty((0,) + frame_shape, np.uint8)
+    return frames, frame_timestamps[:frame_count]
+
+
+class ReplayDevice:
+    """
+    Replays a recording through the same receive_scene_video_frame /
+    receive_gaze_datum / close surface as the realtime API's simple device.
+    speed: 1.0 replays in real time (items are released when their recorded
+    time is due), 2.0 twice as fast, 0 as fast as possible.
+    lockstep: the next frame is only released once the consumer has called
+    frame_processed() for the previous one, and gaze only up to the timestamp
+    of the last processed frame (all of it once every frame was processed).
+    With speed 0 this replays as fast as the pipeline goes, with a
+    deterministic result, e.g. for regression runs.
+    Frames are zero-copy views of the memory-mapped recording.
+    """
+    def __init__(self, path, speed=1.0, lockstep=False):
+        self.path = path
+        self.full_name = f"Replay of {path}"
+        self.speed = speed
+        self.lockstep = lockstep
+        self.frames, self.frame_timestamps, self.gaze = load_recording(path)
+        self._frame_index = 0
+        self._gaze_index = 0
+        self._closed = threading.Event()
+        self._progress = threading.Condition()  # Signalled by frame_processed() and close()
+        self._frames_processed = 0
+        self._processed_ts = None
+        starts = [ts[0] for ts in (self.frame_timestamps, self.gaze['timestamp_ns']) if len(ts)]
+        self._start_ts = int(min(starts)) if starts else 0
+        # The replay clock starts now; recorded time _start_ts maps to _start_time
+        self._start_time = time.monotonic()
+        # Recorded clock minus host clock, for latency tracing of real-time replays
+        self.clock_offset_ns = self._start_ts - time.time_ns()
+        print(f"Replaying {len(self.frames)} frames and {len(self.gaze)} gaze samples from {path}")
+
+    @property
+    def finished(self):
+        """True once every frame and gaze datum has been returned."""
+        return self._frame_index >= len(self.frames) and self._gaze_index >= len(self.gaze)
+
+    def _wait_until_due(self, ts, timeout_seconds):
+        """Waits until the item recorded at `ts` is due. Returns False on timeout or close."""
+        if self.speed <= 0:
+            return not self._closed.is_set()
+        delay = self._start_time + (ts - self._start_ts) / 1e9 / self.speed - time.monotonic()
+        if delay <= 0:
+            return True
+        if timeout_seconds is not None and delay > timeout_seconds:
+            self._closed.wait(timeout_seconds)
+            return False
+        return not self._closed.wait(delay)
+
+    def _wait_for_progress(self, predicate, timeout_seconds):
+        """Lockstep: waits until predicate() holds. Returns False on timeout or close."""
+        with self._progress:
+            self._progress.wait_for(lambda: predicate() or self._closed.is_set(), timeout_seconds)
+            return predicate() and not self._closed.is_set()
+
+    def frame_processed(self, timestamp_ns):
+        """Lockstep: acknowledges that the consumer is done with the frame at timestamp_ns."""
+        with self._progress:
+            self._frames_processed += 1
+            self._processed_ts = timestamp_ns
+            self._progress.notify_all()
+
+    def receive_scene_video_frame(self, timeout_seconds=None):
+        index = self._frame_index
+        if index >= len(self.frames):
+            self._closed.wait(timeout_seconds or 0)
+            return None
+        if self.lockstep and not self._wait_for_progress(lambda: self._frames_processed >= index, timeout_seconds):
+            return None
+        ts = int(self.frame_timestamps[index])
+        if not self._wait_until_due(ts, timeout_seconds):
+            return None
+        self._frame_index = index + 1
+        return ReplayVideoFrame(self.frames[index], ts / 1e9, ts)
+
+    def receive_gaze_datum(self, timeout_seconds=None):
+        index = self._gaze_index
+        if index >= len(self.gaze):
+            self._closed.wait(timeout_seconds or 0)
+            return None
+        ts = int(self.gaze['timestamp_ns'][index])
+        if self.lockstep and not self._wait_for_progress(
+                lambda: self._frames_processed >= len(self.frames) or
+                (self._processed_ts is not None and ts <= self._processed_ts), timeout_seconds):
+            return None
+        if not self._wait_until_due(ts, timeout_seconds):
+            return None
+        self._gaze_index = index + 1
+        return self._gaze_datum(index)
+
+    def _gaze_datum(self, index):
+        record = self.gaze[index]
+        ts = int(record['timestamp_ns'])
+        return ReplayGazeDatum(float(record['x']), float(record['y']), bool(record['worn']), ts / 1e9, ts)
+
+    def receive_matched_scene_video_frame_and_gaze(self, timeout_seconds=None):
+        """Next frame paired with the recorded gaze datum closest to it in time."""
+        frame = self.receive_scene_video_frame(timeout_seconds)
+        if frame is None or len(self.gaze) == 0:
+            return None
+        gaze_ts = self.gaze['timestamp_ns']
+        i = min(int(np.searchsorted(gaze_ts, frame.timestamp_unix_ns)), len(gaze_ts) - 1)
+        if i > 0 and frame.timestamp_unix_ns - gaze_ts[i - 1] <= gaze_ts[i] - frame.timestamp_unix_ns:
+            i -= 1
+        return frame, self._gaze_datum(i)
+
+    def close(self):
+        self._closed.set()
+        with self._progress:
+            self._progress.notify_all()
+
+
+def record(path, duration_seconds=None):
+    """Records from the first discovered Neon until `duration_seconds` or Ctrl+C."""
+    from pupil_labs.realtime_api.simple import discover_one_device
+
+    print("Attempting to discover Pupil Labs Neon device...")
+    device = discover_one_device(max_search_duration_seconds=5)
+    if device is None:
+        print("Error: Could not find Pupil Labs Neon device. Exiting.")
+        return
+    recorder = RecordingDevice(device, path)
+    stop_event = threading.Event()
+
+    def pull(receive):
+        while not stop_event.is_set():
+            receive(timeout_seconds=0.5)
+
+    # Video and gaze are pulled concurrently so neither stream waits on the other
+    threads = [threading.Thread(target=pull, args=(receive,), daemon=True)
+               for receive in (recorder.receive_scene_video_frame, recorder.receive_gaze_datum)]
+    for t in threads:
+        t.start()
+    try:
+        stop_event.wait(duration_seconds)
+    except KeyboardInterrupt:
+        print("\nCtrl+C detected. Stopping recording.")
+    finally:
+        stop_event.set()
+        for t in threads:
+            t.join(2.0)
+        recorder.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record Neon scene video and gaze for offline replay.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="Record from a live device.")
+    record_parser.add_argument("path", help="Output recording directory.")
+    record_parser.add_argument("--duration", type=float, help="Seconds to record (default: until Ctrl+C).")
+    info_parser = subparsers.add_parser("info", help="Summarize a recording.")
+    info_parser.add_argument("path", help="Recording directory.")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        record(args.path, args.duration)
+    else:
+        frames, frame_timestamps, gaze = load_recording(args.path)
+        duration = (frame_timestamps[-1] - frame_timestamps[0]) / 1e9 if len(frame_timestamps) > 1 else 0.0
+        print(f"{args.path}: {len(frames)} frames of {frames.shape[1:]}, {len(gaze)} gaze samples, "
+              f"{duration:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import cv2
+import numpy as np
+
+
+class SceneChangeGate:
+    """
+    Cheap change detector placed in front of screen detection.
+    Once the screen has been found, each frame is compared with the last frame
+    that was actually processed in small gray patches around the four corners
+    of the quad detected on it: the screen edges run through those patches,
+    so a pixel or two of drift already changes them, while changes elsewhere
+    in the frame say nothing about the corners. Without a quad, a tiny
+    whole-frame thumbnail is compared instead. If the mean absolute difference
+    of every patch stays below `threshold` (in 0-255 gray levels), the
+    previous detection result can be reused.
+    `max_reuse` forces a refresh after that many consecutive reuses, so
+    slow drift and parameter changes are still picked up.
+    """
+    def __init__(self, threshold=4.0, patch_radius=16, thumbnail_size=(32, 24), max_reuse=3):
+        self.threshold = threshold
+        self.patch_radius = patch_radius
+        self.thumbnail_size = thumbnail_size
+        self.max_reuse = max_reuse
+        self.reference = None  # Last processed frame
+        self._reference_thumbnail = None
+        self.consecutive_hits = 0
+        self.last_difference = None
+        # hits: frames where the previous result was reused, misses: frames that were processed
+        self.hits = 0
+        self.misses = 0
+
+    def thumbnail(self, image):
+        small = cv2.resize(image, self.thumbnail_size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small.astype(np.int16)
+
+    def _patch(self, image, x0, y0, x1, y1):
+        patch = image[y0:y1, x0:x1]
+        return cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY) if patch.ndim == 3 else patch
+
+    def difference(self, image, corners=None):
+        """
+        Mean absolute gray difference to the reference frame: the largest over
+        the corner patches, or over the whole thumbnail without corners.
+        """
+        if corners is None:
+            if self._reference_thumbnail is None:
+                self._reference_thumbnail = self.thumbnail(self.reference)
+            return float(np.mean(np.abs(self.thumbnail(image) - self._reference_thumbnail)))
+
+        h, w = image.shape[:2]
+        r = self.patch_radius
+        largest = 0.0
+        for cx, cy in np.asarray(corners):
+            x0, y0 = max(0, int(cx) - r), max(0, int(cy) - r)
+            x1, y1 = min(w, int(cx) + r + 1), min(h, int(cy) + r + 1)
+            if x1 - x0 < r or y1 - y0 < r:
+                return float("inf")  # Corner at or beyond the frame border: always re-detect
+            diff = cv2.absdiff(self._patch(image, x0, y0, x1, y1), self._patch(self.reference, x0, y0, x1, y1))
+            largest = max(largest, float(np.mean(diff)))
+        return largest
+
+    def has_changed(self, image, corners=None):
+        """
+        Returns True if the frame must be processed, False if the last result can be reused.
+        corners: the quad detected on the last processed frame, if any.
+        """
+        if self.reference is not None and self.consecutive_hits < self.max_reuse \
+                and self.reference.shape == image.shape:
+            self.last_difference = self.difference(image, corners)
+            if self.last_difference < self.threshold:
+                self.hits += 1
+                self.consecutive_hits += 1
+                return False
+
+        # Only processed frames become the reference, so slow drift accumulates
+        self.reference = image
+        self._reference_thumbnail = None
+        self.misses += 1
+        self.consecutive_hits = 0
+        return True
+
+    def invalidate(self):
+        """Forces the next frame to be processed."""
+        self.reference = None
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -1,40 +1,23 @@
 \
+import collections
+import json
+import time
+
 import cv2
 import numpy as np
 
-# --- Tunable Parameters (Global) ---
-# Initial values from data_sender.py, meant to be updated by trackbars
-canny_thr_1 = 5
-canny_thr_2 = 25
-blur_kernel_trackbar = 4  # Represents kernel size: 2*val + 1
-approx_poly_epsilon_trackbar = 14 # Represents epsilon factor: val / 100.0
-aspect_ratio_tolerance_trackbar = 26 # Represents tolerance factor: val / 100.0
-min_area_percent_trackbar = 17 # Represents min area factor: val / 1000.0
-
-# --- Callback functions for trackbars (to be called by UI in data_sender.py) ---
-def on_canny_thr1_change(val):
-    global canny_thr_1
-    canny_thr_1 = val
-
-def on_canny_thr2_change(val):
-    global canny_thr_2
-    canny_thr_2 = val
-
-def on_blur_kernel_change(val):
-    global blur_kernel_trackbar
-    blur_kernel_trackbar = val
-
-def on_approx_poly_epsilon_change(val):
-    global approx_poly_epsilon_trackbar
-    approx_poly_epsilon_trackbar = val
-
-def on_aspect_ratio_tolerance_change(val):
-    global aspect_ratio_tolerance_trackbar
-    aspect_ratio_tolerance_trackbar = val
+# --- Default tunable parameters ---
+# Trackbar-scale values, converted to actual parameters in DetectorContext.current_params()
+DEFAULT_PARAMS = {
+    "canny_thr_1": 5,
+    "canny_thr_2": 25,
+    "blur_kernel_trackbar": 4,  # Represents kernel size: 2*val + 1
+    "approx_poly_epsilon_trackbar": 14,  # Represents epsilon factor: val / 100.0
+    "aspect_ratio_tolerance_trackbar": 26,  # Represents tolerance factor: val / 100.0
+    "min_area_percent_trackbar": 17,  # Represents min area factor: val / 1000.0
+}
 
-def on_min_area_percent_change(val):
-    global min_area_percent_trackbar
-    min_area_percent_trackbar = val
+TARGET_ASPECT_RATIO = 1920.0 / 1080.0  # Standard 16:9 screen
 
 def order_points(pts):
     """Sorts contour points to [top-left, top-right, bottom-right, bottom-left]."""
@@ -51,75 +34,468 @@ def order_points(pts):
     rect[3] = pts[np.argmax(diff_yx)] # Bottom-left
     return rect
 
-def detect_screen_corners(image):
+def refine_corners(image, corners, window=5):
+    """
+    Refines corner positions to sub-pixel accuracy with cv2.cornerSubPix.
+    Only small patches around each corner are converted to grayscale, so the
+    cost does not depend on the image resolution. Corners that would move by
+    more than the search window are left untouched.
+    """
+    img_h, img_w = image.shape[:2]
+    radius = window + 3  # cornerSubPix needs a margin around its search window
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.01)
+    refined = corners.astype(np.float32).copy()
+
+    for i, (cx, cy) in enumerate(corners):
+        x0, y0 = int(round(cx)) - radius, int(round(cy)) - radius
+        x1, y1 = x0 + 2 * radius + 1, y0 + 2 * radius + 1
+        if x0 < 0 or y0 < 0 or x1 > img_w or y1 > img_h:
+            continue  # Too close to the image border to refine safely
+
+        patch = cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        pt = np.array([[[cx - x0, cy - y0]]], dtype=np.float32)
+        cv2.cornerSubPix(patch, pt, (window, window), (-1, -1), criteria)
+        new_pt = pt[0, 0] + (x0, y0)
+        if np.all(np.abs(new_pt - (cx, cy)) <= window):
+            refined[i] = new_pt
+    return refined
+
+def order_points_batch(quads):
+    """Vectorized order_points for an (N, 4, 2) array of quads."""
+    s = quads.sum(axis=2)
+    diff_yx = quads[:, :, 1] - quads[:, :, 0]
+    order = np.stack([np.argmin(s, axis=1),         # Top-left has smallest sum
+                      np.argmin(diff_yx, axis=1),   # Top-right has smallest y-x
+                      np.argmax(s, axis=1),         # Bottom-right has largest sum
+                      np.argmax(diff_yx, axis=1)],  # Bottom-left has largest y-x
+                     axis=1)
+    return np.take_along_axis(quads, order[:, :, None], axis=1), order
+
+
+def score_quad_candidates(quads, aspect_ratio_tolerance, min_area_val):
+    """
+    Scores an (N, 4, 2) array of quad candidates at once.
+    Returns (ordered quads, scores). Candidates that are degenerate, not convex,
+    too small or outside the aspect ratio tolerance score 0. Valid candidates
+    score in (0, 1]: their area relative to the largest valid candidate,
+    weighted by how close their aspect ratio is to the target.
+    """
+    ordered, order = order_points_batch(quads.astype(np.float32))
+
+    # The four ordering rules must pick four distinct vertices
+    distinct = np.sort(order, axis=1)
+    distinct = np.all(distinct == np.arange(4), axis=1)
+
+    # Side lengths: top, right, bottom, left
+    edges = np.roll(ordered, -1, axis=1) - ordered
+    sides = np.linalg.norm(edges, axis=2)
+    avg_width = (sides[:, 0] + sides[:, 2]) / 2.0
+    avg_height = (sides[:, 1] + sides[:, 3]) / 2.0
+
+    # Convex (and clockwise in image coordinates) if all consecutive edge cross products are positive
+    next_edges = np.roll(edges, -1, axis=1)
+    cross = edges[:, :, 0] * next_edges[:, :, 1] - edges[:, :, 1] * next_edges[:, :, 0]
+    convex = np.all(cross > 0, axis=1)
+
+    # Shoelace area
+    x, y = ordered[:, :, 0], ordered[:, :, 1]
+    area = 0.5 * np.abs(np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        aspect_ratio = np.where(avg_height > 0, avg_width / avg_height, 0.0)
+    aspect_error = np.abs(aspect_ratio - TARGET_ASPECT_RATIO) / (aspect_ratio_tolerance * TARGET_ASPECT_RATIO)
+
+    valid = distinct & convex & (avg_width > 0) & (avg_height > 0) & (aspect_error <= 1.0) & (area >= min_area_val)
+    scores = np.zeros(len(quads), dtype=np.float64)
+    if np.any(valid):
+        area_term = area / area[valid].max()
+        scores[valid] = (area_term * (0.5 + 0.5 * (1.0 - aspect_error)))[valid]
+    return ordered, scores
+
+
+def find_screen_quad(contours, approx_poly_epsilon, aspect_ratio_tolerance, min_area_val, max_candidates=8):
     """
-    Detects the four corners of a screen in an image using tunable parameters.
-    Accesses global parameters defined in this module.
+    Returns (ordered corners, score) of the best screen-like quad among the
+    contours, or (None, 0.0).
+    Contours are first pruned by their bounding-rect area (an upper bound of
+    their area), only the `max_candidates` largest are approximated, and the
+    surviving quads are scored together in score_quad_candidates.
     """
-    global canny_thr_1, canny_thr_2, blur_kernel_trackbar, \
-           approx_poly_epsilon_trackbar, aspect_ratio_tolerance_trackbar, \
-           min_area_percent_trackbar
+    rects = np.array([cv2.boundingRect(c) for c in contours], dtype=np.float64).reshape(-1, 4)
+    rect_areas = rects[:, 2] * rects[:, 3]
+    keep = np.flatnonzero(rect_areas >= min_area_val)
+    keep = keep[np.argsort(rect_areas[keep])[::-1][:max_candidates]]
 
-    # Calculate current parameter values based on trackbar settings
-    current_blur_kernel_size = 2 * blur_kernel_trackbar + 1
-    if current_blur_kernel_size < 1: current_blur_kernel_size = 1 # Ensure kernel is at least 1x1
+    quads = []
+    for i in keep:
+        c = contours[i]
+        approx = cv2.approxPolyDP(c, approx_poly_epsilon * cv2.arcLength(c, True), True)
+        if len(approx) == 4:
+            quads.append(approx.reshape(4, 2))
+    if not quads:
+        return None, 0.0
 
-    current_approx_poly_epsilon = (approx_poly_epsilon_trackbar / 100.0)
-    if current_approx_poly_epsilon < 0.01: current_approx_poly_epsilon = 0.01
+    ordered, scores = score_quad_candidates(np.array(quads), aspect_ratio_tolerance, min_area_val)
+    best = int(np.argmax(scores))
+    if scores[best] <= 0:
+        return None, 0.0
+    return ordered[best], float(scores[best])
 
-    current_aspect_ratio_tolerance = aspect_ratio_tolerance_trackbar / 100.0
-    if current_aspect_ratio_tolerance < 0.01: current_aspect_ratio_tolerance = 0.01
-    
-    current_min_area_factor = min_area_percent_trackbar / 1000.0 # e.g., 17 -> 0.017 (1.7%)
-    if current_min_area_factor < 0.0001: current_min_area_factor = 0.0001
 
-    target_aspect_ratio = 1920.0 / 1080.0 # Standard 16:9 screen
+# --- Detection stages ---
+# Shared by DetectorContext (live frames, preallocated dst= buffers) and
+# FrozenFrame (one held frame, memoized per stage), so both run the same code.
 
-    # Image processing steps
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    blurred = cv2.GaussianBlur(gray, (current_blur_kernel_size, current_blur_kernel_size), 0)
-    edged = cv2.Canny(blurred, canny_thr_1, canny_thr_2) # Uses global canny_thr_1, canny_thr_2
-    
-    contours, _ = cv2.findContours(edged.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+def search_scale(image_shape, scale):
+    """Returns (width, height, scale_x, scale_y) of the image searched in pyramid mode."""
+    src_h, src_w = image_shape[:2]
+    dst_w, dst_h = max(1, int(round(src_w * scale))), max(1, int(round(src_h * scale)))
+    return dst_w, dst_h, dst_w / src_w, dst_h / src_h
 
+
+def scaled_blur_kernel(blur_kernel_size, scale):
+    """Blur kernel size on the searched image, keeping its footprint constant relative to the scene."""
+    return blur_kernel_size if scale == 1.0 else max(1, int(blur_kernel_size * scale) | 1)
+
+
+def default_refine_window(scale):
+    """Sub-pixel refinement window covering the coarse-level error, None at native scale."""
+    return None if scale == 1.0 else max(5, int(round(3.0 / scale)))
+
+
+def gray_stage(search_img, dst=None):
+    return cv2.cvtColor(search_img, cv2.COLOR_BGR2GRAY, dst=dst)
+
+
+def blur_stage(gray, blur_kernel_size, dst=None):
+    return cv2.GaussianBlur(gray, (blur_kernel_size, blur_kernel_size), 0, dst=dst)
+
+
+def edge_stage(blurred, canny_thr_1, canny_thr_2, dst=None):
+    """Returns (edges, external contours)."""
+    edges = cv2.Canny(blurred, canny_thr_1, canny_thr_2, edges=dst)
+    # findContours no longer modifies its input, so no copy of the edge map is needed
+    return edges, cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]
+
+
+def quad_stage(contours, image_shape, scale_x, scale_y, approx_poly_epsilon, aspect_ratio_tolerance,
+               min_area_factor, max_candidates=8):
+    """
+    Returns (corners, score) of the best quad in searched-image coordinates, or (None, 0.0).
+    The minimum area stays relative to the full image of `image_shape`.
+    """
     if not contours:
-        return None 
-
-    contours = sorted(contours, key=cv2.contourArea, reverse=True) # Process largest contours first
-    found_corners = None
-
-    for c in contours:
-        peri = cv2.arcLength(c, True)
-        approx = cv2.approxPolyDP(c, current_approx_poly_epsilon * peri, True)
-
-        if len(approx) == 4 and cv2.isContourConvex(approx):
-            points = approx.reshape(4, 2)
-            ordered_corners = order_points(points.astype(np.float32)) # Use order_points from this module
-            
-            tl, tr, br, bl = ordered_corners
-            
-            # Calculate width and height of the detected quadrilateral
-            width_top = np.linalg.norm(tr - tl)
-            width_bottom = np.linalg.norm(br - bl)
-            avg_width = (width_top + width_bottom) / 2.0
-
-            height_left = np.linalg.norm(bl - tl)
-            height_right = np.linalg.norm(br - tr)
-            avg_height = (height_left + height_right) / 2.0
-
-            if avg_height == 0 or avg_width == 0: # Prevent division by zero
-                continue
-            
-            aspect_ratio_detected = avg_width / avg_height
-            
-            # Check aspect ratio against target, within tolerance
-            if abs(aspect_ratio_detected - target_aspect_ratio) <= current_aspect_ratio_tolerance * target_aspect_ratio:
-                # Check minimum area to filter out small noise
-                min_area_val = current_min_area_factor * image.shape[0] * image.shape[1]
-                if cv2.contourArea(approx) < min_area_val:
-                    continue # Contour is too small
-                
-                found_corners = ordered_corners.astype(np.float32)
-                break # Found a suitable contour
-    
-    return found_corners
+        return None, 0.0
+    min_area_val = min_area_factor * image_shape[0] * image_shape[1] * scale_x * scale_y
+    return find_screen_quad(contours, approx_poly_epsilon, aspect_ratio_tolerance, min_area_val, max_candidates)
+
+
+def full_resolution_corners(image, corners, scale_x=1.0, scale_y=1.0, offset=None, refine_window=None):
+    """Maps corners found on the searched image back to `image` and optionally refines them."""
+    if scale_x != 1.0 or scale_y != 1.0:
+        # Map pixel centres of the downscaled image back to the full resolution
+        corners = (corners + 0.5) / (scale_x, scale_y) - 0.5
+    if offset is not None:
+        corners = corners + offset
+    if refine_window:
+        corners = refine_corners(image, corners, refine_window)
+    return corners.astype(np.float32)
+
+
+class DetectorContext:
+    """
+    Screen detection state: the six tunable parameters plus preallocated work
+    buffers per input resolution, which are passed as dst= to the OpenCV calls
+    so steady-state frames do not allocate full-size images.
+    A context is not thread-safe; create one per device or per thread.
+    """
+    def __init__(self, **params):
+        unknown = set(params) - set(DEFAULT_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown detector parameters: {sorted(unknown)}")
+        for name, default in DEFAULT_PARAMS.items():
+            setattr(self, name, int(params.get(name, default)))
+        self.max_candidates = 8  # Quads scored per frame after bounding-rect pruning
+        self.last_score = None  # Score of the last quad found by detect_screen_corners
+        self._buffers = {}
+
+    def get_params(self):
+        """Returns the six tunable parameters as a dict (trackbar-scale values)."""
+        return {name: getattr(self, name) for name in DEFAULT_PARAMS}
+
+    def set_params(self, params):
+        for name, value in params.items():
+            if name not in DEFAULT_PARAMS:
+                raise ValueError(f"Unknown detector parameter: {name}")
+            setattr(self, name, int(value))
+
+    def load_params(self, path):
+        """
+        Loads parameters from a JSON file, either a flat {name: value} dict or a
+        profile with the values under a "params" key.
+        """
+        with open(path) as f:
+            data = json.load(f)
+        self.set_params(data.get("params", data))
+        print(f"Detector parameters loaded from {path}: {self.get_params()}")
+
+    def save_params(self, path, **metadata):
+        """Writes the parameters as a JSON profile, with optional extra metadata."""
+        with open(path, "w") as f:
+            json.dump({"params": self.get_params(), **metadata}, f, indent=2)
+
+    # --- Callback functions for trackbars ---
+    def on_canny_thr1_change(self, val):
+        self.canny_thr_1 = val
+
+    def on_canny_thr2_change(self, val):
+        self.canny_thr_2 = val
+
+    def on_blur_kernel_change(self, val):
+        self.blur_kernel_trackbar = val
+
+    def on_approx_poly_epsilon_change(self, val):
+        self.approx_poly_epsilon_trackbar = val
+
+    def on_aspect_ratio_tolerance_change(self, val):
+        self.aspect_ratio_tolerance_trackbar = val
+
+    def on_min_area_percent_change(self, val):
+        self.min_area_percent_trackbar = val
+
+    def current_params(self):
+        """
+        Converts the trackbar-scale values into
+        (blur kernel size, approxPoly epsilon, aspect ratio tolerance, min area factor).
+        """
+        current_blur_kernel_size = 2 * self.blur_kernel_trackbar + 1
+        if current_blur_kernel_size < 1: current_blur_kernel_size = 1 # Ensure kernel is at least 1x1
+
+        current_approx_poly_epsilon = (self.approx_poly_epsilon_trackbar / 100.0)
+        if current_approx_poly_epsilon < 0.01: current_approx_poly_epsilon = 0.01
+
+        current_aspect_ratio_tolerance = self.aspect_ratio_tolerance_trackbar / 100.0
+        if current_aspect_ratio_tolerance < 0.01: current_aspect_ratio_tolerance = 0.01
+
+        current_min_area_factor = self.min_area_percent_trackbar / 1000.0 # e.g., 17 -> 0.017 (1.7%)
+        if current_min_area_factor < 0.0001: current_min_area_factor = 0.0001
+
+        return (current_blur_kernel_size, current_approx_poly_epsilon,
+                current_aspect_ratio_tolerance, current_min_area_factor)
+
+    def _work_buffers(self, image_shape, scale):
+        """Returns the buffers for a full image of `image_shape`, allocating them on first use."""
+        key = (image_shape[0], image_shape[1], scale)
+        buffers = self._buffers.get(key)
+        if buffers is None:
+            h, w = image_shape[:2]
+            buffers = {}
+            if scale != 1.0:
+                h, w = int(np.ceil(h * scale)), int(np.ceil(w * scale))
+                buffers["small"] = np.empty((h, w, 3), dtype=np.uint8)
+            buffers["gray"] = np.empty((h, w), dtype=np.uint8)
+            buffers["blurred"] = np.empty((h, w), dtype=np.uint8)
+            buffers["edged"] = np.empty((h, w), dtype=np.uint8)
+            self._buffers[key] = buffers
+        return buffers
+
+    def detect_screen_corners(self, image, roi=None, scale=1.0, refine_window=None):
+        """
+        Detects the four corners of a screen in an image using this context's parameters.
+        roi: optional (x, y, w, h) region of the image to search. Returned corners
+        are always in full-image coordinates and the minimum area stays relative
+        to the full image.
+        scale: pyramid mode. With e.g. 0.5 or 0.25 the quad is searched on a
+        downscaled image and its corners are then refined at full resolution
+        with sub-pixel accuracy.
+        refine_window: half-size of the sub-pixel refinement window. Defaults to
+        a size covering the coarse-level error when scale < 1, and to no
+        refinement at native scale.
+        """
+        (current_blur_kernel_size, current_approx_poly_epsilon,
+         current_aspect_ratio_tolerance, current_min_area_factor) = self.current_params()
+        buffers = self._work_buffers(image.shape, scale)
+        self.last_score = None
+
+        search_img = image
+        offset = None
+        if roi is not None:
+            x, y, w, h = roi
+            search_img = image[y:y + h, x:x + w]  # A view, no pixel copy
+            offset = np.array([x, y], dtype=np.float32)
+
+        scale_x = scale_y = 1.0
+        if scale != 1.0:
+            dst_w, dst_h, scale_x, scale_y = search_scale(search_img.shape, scale)
+            search_img = cv2.resize(search_img, (dst_w, dst_h), dst=buffers["small"][:dst_h, :dst_w],
+                                    interpolation=cv2.INTER_AREA)
+            current_blur_kernel_size = scaled_blur_kernel(current_blur_kernel_size, scale)
+            if refine_window is None:
+                refine_window = default_refine_window(scale)
+
+        # Image processing steps, written into views of the preallocated buffers
+        h, w = search_img.shape[:2]
+        gray = gray_stage(search_img, dst=buffers["gray"][:h, :w])
+        blurred = blur_stage(gray, current_blur_kernel_size, dst=buffers["blurred"][:h, :w])
+        _, contours = edge_stage(blurred, self.canny_thr_1, self.canny_thr_2, dst=buffers["edged"][:h, :w])
+        if not contours:
+            return None
+
+        found_corners, self.last_score = quad_stage(contours, image.shape, scale_x, scale_y,
+                                                    current_approx_poly_epsilon, current_aspect_ratio_tolerance,
+                                                    current_min_area_factor, self.max_candidates)
+        if found_corners is None:
+            return None
+        return full_resolution_corners(image, found_corners, scale_x, scale_y, offset, refine_window)
+
+
+# Shared context for callers that don't manage their own. Like any context,
+# it must not be used from several threads at once.
+default_context = DetectorContext()
+
+
+def detect_screen_corners(image, roi=None, scale=1.0, refine_window=None, context=None):
+    """
+    Detects the four corners of a screen in an image.
+    Uses `context` (default: the module's default_context), see
+    DetectorContext.detect_screen_corners for the arguments.
+    """
+    context = context or default_context
+    return context.detect_screen_corners(image, roi, scale, refine_window)
+
+
+class FrozenFrame:
+    """
+    Screen detection on one held frame with every stage memoized, for tuning.
+    Each stage result is cached under the parameters it depends on:
+      gray      -> (nothing, computed once)
+      blurred   -> blur kernel size
+      edges and contours -> blur kernel size, Canny thresholds
+    so a slider change only recomputes the stages downstream of it. The quad
+    search and corner refinement are cheap and always rerun. The stages are
+    the same functions DetectorContext runs, so the corners match live detection.
+    cache_size bounds the number of cached blur and edge results each.
+    """
+    def __init__(self, image, scale=1.0, refine_window=None, cache_size=16):
+        self.image = image
+        self.scale = scale
+        self.refine_window = refine_window
+        self.cache_size = cache_size
+        self.scale_x = self.scale_y = 1.0
+        search_img = image
+        if scale != 1.0:
+            dst_w, dst_h, self.scale_x, self.scale_y = search_scale(image.shape, scale)
+            search_img = cv2.resize(image, (dst_w, dst_h), interpolation=cv2.INTER_AREA)
+            if refine_window is None:
+                self.refine_window = default_refine_window(scale)
+        self.gray = gray_stage(search_img)
+        self._blurred = collections.OrderedDict()
+        self._contours = collections.OrderedDict()  # key -> (edges, contours)
+        self.last_recomputed = []  # Stages recomputed by the last detect() call
+        self.last_duration = 0.0
+
+    def _cached(self, cache, key, compute, stage):
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        value = cache[key] = compute()
+        self.last_recomputed.append(stage)
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return value
+
+    def _stages(self, context):
+        """Returns (edges, contours) for the context's blur and Canny parameters."""
+        blur_kernel_size = scaled_blur_kernel(context.current_params()[0], self.scale)
+        blurred = self._cached(self._blurred, blur_kernel_size,
+                               lambda: blur_stage(self.gray, blur_kernel_size), "blur")
+        key = (blur_kernel_size, context.canny_thr_1, context.canny_thr_2)
+        return self._cached(self._contours, key,
+                            lambda: edge_stage(blurred, context.canny_thr_1, context.canny_thr_2), "edges")
+
+    def detect(self, context):
+        """Returns (corners, score) for the context's current parameters, like find_screen_quad."""
+        start = time.perf_counter()
+        self.last_recomputed = []
+        _, approx_poly_epsilon, aspect_ratio_tolerance, min_area_factor = context.current_params()
+        _, contours = self._stages(context)
+        corners, score = quad_stage(contours, self.image.shape, self.scale_x, self.scale_y, approx_poly_epsilon,
+                                    aspect_ratio_tolerance, min_area_factor, context.max_candidates)
+        if corners is not None:
+            corners = full_resolution_corners(self.image, corners, self.scale_x, self.scale_y,
+                                              refine_window=self.refine_window)
+        self.last_duration = time.perf_counter() - start
+        return corners, score
+
+
+def padded_roi(corners, image_shape, pad_fraction=0.1, min_pad_px=24):
+    """
+    Returns the (x, y, w, h) bounding box of `corners`, grown by `pad_fraction`
+    of its larger side (at least `min_pad_px`) and clipped to the image.
+    """
+    img_h, img_w = image_shape[:2]
+    x_min, y_min = corners.min(axis=0)
+    x_max, y_max = corners.max(axis=0)
+    pad = max(min_pad_px, pad_fraction * max(x_max - x_min, y_max - y_min))
+
+    x0 = max(0, int(x_min - pad))
+    y0 = max(0, int(y_min - pad))
+    x1 = min(img_w, int(np.ceil(x_max + pad)))
+    y1 = min(img_h, int(np.ceil(y_max + pad)))
+    return x0, y0, x1 - x0, y1 - y0
+
+
+class IncrementalScreenDetector:
+    """
+    Stateful wrapper around detect_screen_corners.
+    Once a screen is found, later frames are only searched inside a padded
+    bounding box around the previous quad. After `max_misses` consecutive
+    misses inside the ROI, it falls back to a full-frame search.
+    Instances are callable, so they can be used wherever detect_screen_corners is.
+    Each instance owns its DetectorContext unless one is passed in.
+    """
+    def __init__(self, pad_fraction=0.1, min_pad_px=24, max_misses=3, scale=1.0, context=None):
+        self.context = context or DetectorContext()
+        self.scale = scale  # < 1 enables the coarse-to-fine pyramid mode
+        self.pad_fraction = pad_fraction
+        self.min_pad_px = min_pad_px
+        self.max_misses = max_misses
+        self.last_corners = None
+        self.misses = 0
+        # Counters to see how much work the ROI saves
+        self.roi_searches = 0
+        self.full_searches = 0
+
+    def reset(self):
+        """Forgets the previous quad; the next frame gets a full-frame search."""
+        self.last_corners = None
+        self.misses = 0
+
+    def seed(self, corners):
+        """Centres the next ROI search on `corners`, e.g. a quad tracked by other means."""
+        self.last_corners = corners
+        self.misses = 0
+
+    def detect(self, image):
+        if self.last_corners is not None:
+            roi = padded_roi(self.last_corners, image.shape, self.pad_fraction, self.min_pad_px)
+            self.roi_searches += 1
+            corners = self.context.detect_screen_corners(image, roi, scale=self.scale)
+            if corners is not None:
+                self.last_corners = corners
+                self.misses = 0
+                return corners
+
+            self.misses += 1
+            if self.misses < self.max_misses:
+                return None
+            self.reset()  # Screen lost, search the whole frame again
+
+        self.full_searches += 1
+        corners = self.context.detect_screen_corners(image, scale=self.scale)
+        if corners is not None:
+            self.last_corners = corners
+            self.misses = 0
+        return corners
+
+    __call__ = detect
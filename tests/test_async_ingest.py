@@ -0,0 +1,54 @@
+import time
+
+import numpy as np
+
+import async_ingest
+import recording
+from test_recording import CollectingSender, make_recording
+
+
+def run_until_stopped(runner, seconds=30):
+    runner.start()
+    deadline = time.monotonic() + seconds
+    while runner.running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return runner.running
+
+
+def test_async_replay_maps_every_sample(tmp_path, capsys):
+    gaze_count = make_recording(tmp_path)
+    device = recording.ReplayDevice(str(tmp_path), speed=0, lockstep=True)
+    sender = CollectingSender()
+    runner = async_ingest.AsyncPipeline(sender, device=device)
+    assert not run_until_stopped(runner)
+    runner.stop()
+    device.close()
+    assert len(sender.timestamps) == gaze_count
+    assert "never retrieved" not in capsys.readouterr().err
+
+
+def test_detector_error_stops_the_async_pipeline(tmp_path, capsys):
+    make_recording(tmp_path)
+    device = recording.ReplayDevice(str(tmp_path), speed=0)
+
+    def failing_detector(image):
+        raise RuntimeError("detector exploded")
+
+    runner = async_ingest.AsyncPipeline(CollectingSender(), detector=failing_detector, device=device)
+    assert not run_until_stopped(runner, seconds=5)
+    runner.stop()
+    device.close()
+    assert "detector exploded" in capsys.readouterr().out
+
+
+def test_stop_before_the_streams_end_is_clean(tmp_path, capsys):
+    make_recording(tmp_path)
+    device = recording.ReplayDevice(str(tmp_path), speed=0.05)  # Runs for several seconds
+    runner = async_ingest.AsyncPipeline(CollectingSender(), device=device)
+    runner.start()
+    time.sleep(0.3)
+    runner.stop()
+    runner._thread.join(5)
+    device.close()
+    assert not runner._thread.is_alive()
+    assert "never retrieved" not in capsys.readouterr().err
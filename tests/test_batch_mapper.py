@@ -0,0 +1,84 @@
+import cv2
+import numpy as np
+import pytest
+
+import batch_mapper
+
+
+@pytest.mark.parametrize("value, worn", [("1", True), ("1.0", True), ("0", False), ("0.0", False),
+                                         ("True", True), ("false", False), ("", False)])
+def test_parse_worn(value, worn):
+    assert batch_mapper.parse_worn(value) is worn
+
+
+def test_workers_decode_their_own_video_chunk(tmp_path):
+    path = str(tmp_path / "scene.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (64, 48))
+    if not writer.isOpened():
+        pytest.skip("no MJPG encoder in this OpenCV build")
+    for i in range(10):
+        writer.write(np.full((48, 64, 3), i * 20, dtype=np.uint8))
+    writer.release()
+
+    chunks = list(batch_mapper.iter_chunks(path, 10, 4))
+    assert chunks == [(path, 0, 4), (path, 4, 8), (path, 8, 10)]
+    frames = [frame for chunk in chunks for frame in batch_mapper._read_chunk(*chunk)]
+    assert [int(round(frame.mean() / 20)) for frame in frames] == list(range(10))
+    assert len(list(batch_mapper._read_chunk(path, 8, 12))) == 2  # Stops at the end of the video
+
+
+class SeekIgnoringCapture:
+    """A capture whose seek is accepted but lands elsewhere, like some H.264 streams."""
+    def __init__(self, path):
+        self.position = 0
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        self.position = max(0, int(value) - 3)  # Lands a few frames early
+        return True
+
+    def get(self, prop):
+        return self.position
+
+    def grab(self):
+        self.position += 1
+        return True
+
+    def read(self):
+        self.position += 1
+        return True, np.full((2, 2, 3), self.position - 1, dtype=np.uint8)
+
+    def release(self):
+        pass
+
+
+def test_inexact_seek_falls_back_to_sequential_decoding(monkeypatch):
+    monkeypatch.setattr(batch_mapper.cv2, "VideoCapture", SeekIgnoringCapture)
+    frames = list(batch_mapper._read_chunk("scene.mp4", 10, 13))
+    assert [int(frame[0, 0, 0]) for frame in frames] == [10, 11, 12]
+
+
+def test_recording_frames_are_opened_once_per_worker(monkeypatch, tmp_path):
+    calls = []
+
+    def load_frames(path):
+        calls.append(path)
+        return np.zeros((8, 2, 2, 3), dtype=np.uint8), np.arange(8)
+
+    monkeypatch.setattr(batch_mapper.recording, "load_frames", load_frames)
+    monkeypatch.setattr(batch_mapper, "_worker_recordings", {})
+    for start in (0, 4):
+        assert len(list(batch_mapper._read_chunk(str(tmp_path), start, start + 4))) == 4
+    assert calls == [str(tmp_path)]
+
+
+def test_gaze_beyond_the_hold_is_invalid():
+    frame_timestamps = np.array([1_000_000_000, 1_033_000_000], dtype=np.int64)
+    H_matrices = np.stack([np.eye(3)] * 2)
+    offsets_ms = [-100, -60, 0, 20, 100, 140]
+    gaze = np.zeros(len(offsets_ms), dtype=batch_mapper.recording.GAZE_DTYPE)
+    gaze['timestamp_ns'] = frame_timestamps[0] + np.array(offsets_ms, dtype=np.int64) * 1_000_000
+    records = batch_mapper.map_chunk_gaze(gaze, H_matrices, frame_timestamps, first_frame=0)
+    assert records['valid'].tolist() == [0, 1, 1, 1, 1, 0]
@@ -0,0 +1,66 @@
+import numpy as np
+
+import corner_filter
+
+FRAME_NS = 33_000_000
+CORNERS = np.array([[100, 120], [900, 100], [880, 560], [120, 540]], dtype=np.float64)
+
+
+def _static_errors(kf, frames=120):
+    """Mean absolute error of the raw and the filtered corners once the filter has converged."""
+    rng = np.random.default_rng(0)
+    errors_raw, errors_filtered = [], []
+    for i in range(frames):
+        measured = CORNERS + rng.normal(0, 2.0, CORNERS.shape)
+        filtered = kf.update(measured, i * FRAME_NS)
+        if i >= 30:
+            errors_raw.append(np.abs(measured - CORNERS).mean())
+            errors_filtered.append(np.abs(filtered - CORNERS).mean())
+    return np.mean(errors_raw), np.mean(errors_filtered)
+
+
+def test_static_screen_noise_is_smoothed():
+    # The default process noise follows head motion, so it smooths less than a filter tuned for a still camera
+    raw, filtered = _static_errors(corner_filter.CornerKalmanFilter())
+    assert filtered < 0.9 * raw
+    kf = corner_filter.CornerKalmanFilter(acceleration_std=50.0)
+    raw, filtered = _static_errors(kf)
+    assert filtered < 0.5 * raw
+    assert kf.updates == 120 and kf.resets == 0
+
+
+def test_coasts_for_at_most_max_coast_ns():
+    kf = corner_filter.CornerKalmanFilter(max_coast_ns=100_000_000)
+    for i in range(10):
+        kf.update(CORNERS, i * FRAME_NS)
+    last_ns = 9 * FRAME_NS
+    # 33, 66 and 99 ms after the last detection: predicted corners
+    for k in (1, 2, 3):
+        coasted = kf.update(None, last_ns + k * FRAME_NS)
+        np.testing.assert_allclose(coasted, CORNERS, atol=0.5)
+    assert kf.coasted == 3
+    assert kf.update(None, last_ns + 4 * FRAME_NS) is None  # 132 ms: track dropped
+    assert not kf.tracking
+    assert kf.update(None, last_ns + 5 * FRAME_NS) is None
+
+
+def test_jump_beyond_the_gate_restarts_the_filter():
+    kf = corner_filter.CornerKalmanFilter(gate_sigma=6.0)
+    for i in range(10):
+        kf.update(CORNERS, i * FRAME_NS)
+    moved = CORNERS + (300.0, 0.0)
+    np.testing.assert_allclose(kf.update(moved, 10 * FRAME_NS), moved)  # Restarted on the new corners
+    assert kf.resets == 1
+    assert kf.position_std == 2.0  # Fresh covariance: the measurement noise
+
+
+def test_covariance_is_the_full_state_covariance():
+    kf = corner_filter.CornerKalmanFilter()
+    assert kf.covariance is None and kf.corners is None
+    kf.update(CORNERS, 0)
+    kf.update(CORNERS, FRAME_NS)
+    covariance = kf.covariance
+    assert covariance.shape == (16, 16)
+    np.testing.assert_allclose(covariance, covariance.T)
+    np.testing.assert_allclose(np.diag(covariance)[:8], kf.position_std ** 2)
+    assert kf.corners.shape == (4, 2) and kf.corners.dtype == np.float32
@@ -0,0 +1,126 @@
+import asyncio
+import socket
+import time
+
+import numpy as np
+import pytest
+
+import gaze_broker
+import gaze_sender_network
+
+
+def test_broker_raises_when_tcp_port_is_in_use():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as busy:
+        busy.bind(("127.0.0.1", 0))
+        busy.listen()
+        port = busy.getsockname()[1]
+        with pytest.raises(OSError):
+            gaze_broker.GazeBroker([f"tcp://127.0.0.1:{port}"])
+
+
+def test_broker_raises_on_invalid_protocol():
+    with pytest.raises(ValueError):
+        gaze_broker.GazeBroker(["udp://127.0.0.1:5005?protocol=nope"])
+
+
+def test_parse_subscriber_spec_accepts_port_zero():
+    scheme, host, port, options = gaze_broker.parse_subscriber_spec("tcp://127.0.0.1:0?rate=30")
+    assert (scheme, host, port, options["rate"]) == ("tcp", "127.0.0.1", 0, 30.0)
+    with pytest.raises(ValueError):
+        gaze_broker.parse_subscriber_spec("udp://127.0.0.1")
+
+
+def _batch(start, count):
+    timestamps_ns = np.arange(start, start + count, dtype=np.int64) * 1_000_000
+    xy = np.ones((count, 2), dtype=np.float32)
+    return timestamps_ns, xy, xy
+
+
+def _receive_samples(sock, timeout=1.0):
+    """Timestamps of every v2 sample that arrives until the socket has been idle for `timeout`."""
+    sock.settimeout(timeout)
+    timestamps, packets = [], 0
+    try:
+        while True:
+            _, samples = gaze_sender_network.decode_packet(sock.recv(65536))
+            timestamps.extend(samples['timestamp_ns'].tolist())
+            packets += 1
+            sock.settimeout(0.3)
+    except socket.timeout:
+        pass
+    return timestamps, packets
+
+
+def _udp_sink():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    return sock
+
+
+def test_broker_fans_out_to_every_subscriber():
+    sinks = [_udp_sink(), _udp_sink()]
+    names = [f"udp://127.0.0.1:{sink.getsockname()[1]}" for sink in sinks]
+    broker = gaze_broker.GazeBroker(names)
+    try:
+        broker.send_gaze_batch(*_batch(0, 50))
+        received = [_receive_samples(sink)[0] for sink in sinks]
+    finally:
+        broker.close()
+        for sink in sinks:
+            sink.close()
+    expected = (np.arange(50) * 1_000_000).tolist()
+    assert received == [expected, expected]
+    sent = dict(gaze_sender_network.SAMPLES_SENT.samples())
+    for name in names:
+        assert sent[f'gaze_samples_sent_total{{subscriber="{name}"}}'] == 50
+
+
+def test_rate_cap_batches_samples_into_fewer_sends():
+    sink = _udp_sink()
+    broker = gaze_broker.GazeBroker([f"udp://127.0.0.1:{sink.getsockname()[1]}?rate=10"])
+    try:
+        for i in range(50):  # 50 batches over 0.5 s
+            broker.send_gaze_batch(*_batch(i * 4, 4))
+            time.sleep(0.01)
+        timestamps, packets = _receive_samples(sink)
+    finally:
+        broker.close()
+        sink.close()
+    assert len(timestamps) == 200  # Nothing lost, only sent less often
+    assert packets <= 8  # About 10 sends per second
+
+
+class SlowSubscriber(gaze_broker.Subscriber):
+    def __init__(self, delay, **kwargs):
+        super().__init__(f"slow-{delay}", **kwargs)
+        self.delay = delay
+        self.received = []
+
+    async def send(self, packets):
+        await asyncio.sleep(self.delay)
+        for packet in packets:
+            self.received.extend(gaze_sender_network.decode_packet(packet)[1]['timestamp_ns'].tolist())
+
+
+def test_slow_subscriber_drops_its_oldest_samples_only():
+    async def scenario():
+        slow, fast = SlowSubscriber(0.2, buffer=10), SlowSubscriber(0.0)
+        tasks = [asyncio.create_task(s.run()) for s in (slow, fast)]
+        for i in range(10):
+            samples = gaze_broker.to_samples(*_batch(i * 5, 5))
+            slow.push(samples)
+            fast.push(samples)
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.5)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return slow, fast
+
+    slow, fast = asyncio.run(scenario())
+    all_timestamps = (np.arange(50) * 1_000_000).tolist()
+    assert fast.received == all_timestamps and fast.dropped == 0
+    assert slow.dropped > 0 and slow.dropped + len(slow.received) == 50
+    assert slow.received[-10:] == all_timestamps[-10:]  # The newest samples always get through
+    assert dict(gaze_sender_network.SAMPLES_SENT.samples())['gaze_samples_sent_total{subscriber="slow-0.2"}'] \
+        == len(slow.received)
@@ -0,0 +1,24 @@
+import numpy as np
+
+import gaze_mapping
+import homography
+
+
+def test_batch_mapping_matches_single_homography():
+    corners = np.array([[100, 120], [900, 100], [880, 560], [120, 540]], dtype=np.float32)
+    H = homography.solve_homography_4pt(corners)
+    gaze_xy = np.array([[500, 300], [100, 120], [880, 560]], dtype=np.float32)
+    screen_xy, valid = gaze_mapping.map_gaze_points_batch(np.broadcast_to(H, (3, 3, 3)), gaze_xy)
+    assert valid.all()
+    np.testing.assert_allclose(screen_xy, gaze_mapping.map_gaze_points(H, gaze_xy), atol=1e-2)
+
+
+def test_batch_mapping_marks_points_at_infinity_invalid():
+    # w = 1 - x / 1000 vanishes on the line x = 1000
+    H = np.array([[1, 0, 0], [0, 1, 0], [-1e-3, 0, 1]], dtype=np.float64)
+    gaze_xy = np.array([[1000, 50], [500, 50]], dtype=np.float32)
+    H_matrices = np.stack([H, H, np.full((3, 3), np.nan)])
+    screen_xy, valid = gaze_mapping.map_gaze_points_batch(H_matrices, np.vstack([gaze_xy, [[1, 1]]]))
+    assert list(valid) == [False, True, False]
+    assert np.isfinite(screen_xy).all()
+    np.testing.assert_allclose(screen_xy[1], [1000, 100])
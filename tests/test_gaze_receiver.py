@@ -0,0 +1,51 @@
+import socket
+import struct
+import time
+
+import numpy as np
+
+import gaze_receiver
+import gaze_sender_network as gsn
+
+
+def _v2_packet(sequence, first_ms, count=3):
+    timestamps_ns = (first_ms + np.arange(count, dtype=np.int64)) * 1_000_000
+    xy = np.full((count, 2), 10.0, dtype=np.float32)
+    return gsn.encode_v2_packet(sequence, timestamps_ns, xy, xy)
+
+
+def test_loopback_batches_legacy_and_v2_and_drops_late_packets():
+    batches = []
+    receiver = gaze_receiver.GazeReceiver("127.0.0.1", 0, on_batch=batches.append)
+    address = receiver.sock.getsockname()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sender.sendto(struct.pack(gsn.LEGACY_FORMAT, 1_000_000, 1.0, 2.0, 3.0, 4.0), address)
+        sender.sendto(_v2_packet(5, 2), address)
+        sender.sendto(_v2_packet(6, 5), address)
+        sender.sendto(_v2_packet(4, 0), address)  # Late: older than the packets already received
+        time.sleep(0.1)  # Every datagram is queued before the wakeup
+        assert receiver.poll(1.0) == 7
+        assert len(batches) == 1
+        assert batches[0]['timestamp_ns'].tolist() == [ms * 1_000_000 for ms in (1, 2, 3, 4, 5, 6, 7)]
+        assert receiver.latest['timestamp_ns'] == 7_000_000
+        assert receiver.sequence_tracker.reordered == 1
+
+        sender.sendto(_v2_packet(7, 8, count=1), address)
+        assert receiver.poll(1.0) == 1
+        assert len(batches) == 2  # One callback per wakeup
+        assert receiver.latest['timestamp_ns'] == 8_000_000
+        assert receiver.samples_received == 8
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def test_drain_without_data_returns_nothing():
+    batches = []
+    receiver = gaze_receiver.GazeReceiver("127.0.0.1", 0, on_batch=batches.append)
+    try:
+        assert receiver.poll(0.05) == 0 and receiver.drain() == 0
+        assert batches == [] and receiver.latest is None
+    finally:
+        receiver.close()
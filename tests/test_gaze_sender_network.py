@@ -0,0 +1,36 @@
+import numpy as np
+
+import gaze_sender_network as gsn
+
+
+def _batch(n=32):
+    rng = np.random.default_rng(0)
+    timestamps_ns = 1_700_000_000_000_000_000 + np.arange(n, dtype=np.int64) * 5_000_000
+    gaze_xy = rng.uniform(0, 1600, (n, 2)).astype(np.float32)
+    screen_xy = rng.uniform(0, 1920, (n, 2)).astype(np.float32)
+    return timestamps_ns, gaze_xy, screen_xy
+
+
+def test_compact_round_trip():
+    timestamps_ns, gaze_xy, screen_xy = _batch()
+    worn = np.arange(len(timestamps_ns)) % 3 != 0
+    header, samples = gsn.decode_packet(gsn.encode_v2_packet(7, timestamps_ns, gaze_xy, screen_xy, worn, compact=True))
+    assert header.sequence == 7 and header.flags & gsn.FLAG_COMPACT
+    np.testing.assert_array_equal(samples['timestamp_ns'], timestamps_ns)
+    np.testing.assert_allclose(samples['gaze_x'], gaze_xy[:, 0], atol=0.5 / gsn.COMPACT_SCALE)
+    np.testing.assert_allclose(samples['screen_y'], screen_xy[:, 1], atol=0.5 / gsn.COMPACT_SCALE)
+    np.testing.assert_array_equal(samples['flags'], np.where(worn, gsn.SAMPLE_FLAG_WORN, 0))
+
+
+def test_compact_flags_clipped_samples():
+    timestamps_ns, gaze_xy, screen_xy = _batch(4)
+    screen_xy[1] = (5000.0, -5000.0)
+    screen_xy[2, 0] = np.nan
+    before = gsn.COMPACT_CLIPPED.value
+    _, samples = gsn.decode_packet(gsn.encode_v2_packet(0, timestamps_ns, gaze_xy, screen_xy, compact=True))
+    clipped = (samples['flags'] & gsn.SAMPLE_FLAG_CLIPPED) != 0
+    assert clipped.tolist() == [False, True, True, False]
+    assert gsn.COMPACT_CLIPPED.value - before == 2
+    assert samples['screen_x'][1] == 32767 / gsn.COMPACT_SCALE and samples['screen_y'][1] == -32767 / gsn.COMPACT_SCALE
+    assert samples['screen_x'][2] == 0
+    assert (samples['flags'] & gsn.SAMPLE_FLAG_WORN).all()
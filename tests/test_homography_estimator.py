@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import homography
+
+GOOD = np.array([[100, 120], [900, 100], [880, 560], [120, 540]], dtype=np.float32)
+BOWTIE = GOOD[[0, 2, 1, 3]]  # Self-intersecting, not convex
+COLLINEAR = np.array([[0, 0], [100, 0], [200, 0], [300, 1]], dtype=np.float32)
+
+
+@pytest.mark.parametrize("corners", [BOWTIE, COLLINEAR])
+def test_degenerate_quads_are_rejected(corners):
+    estimator = homography.HomographyEstimator()
+    H_matrix, score = estimator.update(corners)
+    assert H_matrix is None and score < estimator.reject_threshold
+    assert estimator.rejections == 1
+
+
+def test_previous_homography_is_held_for_max_hold_frames():
+    estimator = homography.HomographyEstimator(max_hold=3)
+    good_H, score = estimator.update(GOOD)
+    assert score >= estimator.accept_threshold
+    for _ in range(3):
+        H_matrix, _ = estimator.update(BOWTIE)
+        assert H_matrix is good_H
+    assert estimator.update(BOWTIE)[0] is None  # Fourth rejected frame: the hold is over
+    assert estimator.prev_H is None
+    # A good detection is accepted again straight away
+    np.testing.assert_allclose(estimator.update(GOOD)[0], good_H)
+
+
+def test_accepted_frame_ends_the_hold():
+    estimator = homography.HomographyEstimator(max_hold=2)
+    estimator.update(GOOD)
+    estimator.update(BOWTIE)
+    estimator.update(GOOD)
+    assert estimator.held_frames == 0
+    assert estimator.update(BOWTIE)[0] is not None
+    assert estimator.update(BOWTIE)[0] is not None
+
+
+def test_intermediate_score_blends_with_the_previous_corners(monkeypatch):
+    estimator = homography.HomographyEstimator(accept_threshold=0.5, reject_threshold=0.2)
+    estimator.update(GOOD)
+    moved = GOOD + 20.0
+    # Halfway between the thresholds: the corners are averaged with the previous ones
+    monkeypatch.setattr(estimator, "score", lambda corners, H_matrix: 0.35)
+    H_matrix, score = estimator.update(moved)
+    assert score == 0.35
+    np.testing.assert_allclose(H_matrix, homography.solve_homography_4pt(GOOD + 10.0), rtol=1e-4, atol=1e-6)
+    np.testing.assert_allclose(estimator.prev_corners, GOOD + 10.0, atol=1e-4)
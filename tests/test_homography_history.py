@@ -0,0 +1,97 @@
+import collections
+import threading
+
+import numpy as np
+
+import homography
+import pipeline
+
+Gaze = collections.namedtuple("Gaze", "x y worn timestamp_unix_ns")
+
+FRAME_NS = 33_000_000
+GAZE_NS = 5_000_000
+GAZE_LATENCY_NS = 5_000_000  # Gaze reaches the host shortly after it was captured...
+FRAME_LATENCY_NS = 20_000_000  # ...frames only once decoded and detected
+
+
+class CollectingSender:
+    def __init__(self):
+        self.batches = []
+
+    def send_gaze_batch(self, timestamps_ns, gaze_xy, screen_xy, worn=None):
+        self.batches.append((timestamps_ns, screen_xy))
+
+
+def corners_at(t_ns):
+    """A screen sliding right at 1 px/ms."""
+    return np.array([[100, 100], [900, 100], [900, 550], [100, 550]], dtype=np.float64) + [t_ns / 1e6, 0]
+
+
+def gaze_at(t_ns):
+    """Gaze fixed on the screen's centre-left point (960, 480 in screen coordinates)."""
+    return 500 + t_ns / 1e6, 300
+
+
+def run_live(duration_ns=1_000_000_000):
+    """Feeds frames and gaze to a HomographyHistory and GazeWorker in host arrival order."""
+    history = pipeline.HomographyHistory()
+    sender = CollectingSender()
+    worker = pipeline.GazeWorker(None, history, sender, threading.Event())
+    events = [(t + FRAME_LATENCY_NS, "frame", t) for t in range(0, duration_ns, FRAME_NS)]
+    events += [(t + GAZE_LATENCY_NS, "gaze", t) for t in range(0, duration_ns, GAZE_NS)]
+    for host_ns, kind, t in sorted(events):
+        if kind == "frame":
+            history.update(t, homography.solve_homography_4pt(corners_at(t)))
+        else:
+            worker.process([Gaze(*gaze_at(t), True, t)], received_ns=host_ns)
+    return worker, sender
+
+
+def test_live_order_gaze_is_interpolated():
+    worker, sender = run_live()
+    timestamps = np.concatenate([b[0] for b in sender.batches])
+    screen_xy = np.concatenate([b[1] for b in sender.batches])
+    # Everything but the samples still waiting for the next frame is mapped, in order
+    assert len(timestamps) + worker.pending == 200
+    assert worker.pending <= (FRAME_NS + FRAME_LATENCY_NS) // GAZE_NS + 1
+    assert np.all(np.diff(timestamps) > 0)
+    # Interpolated between bracketing frames, so the moving screen costs no error
+    errors = np.linalg.norm(screen_xy - [960, 1080 * 200 / 450], axis=1)
+    assert errors.max() < 0.5
+
+
+def test_samples_past_the_newest_frame_are_held_then_rejected():
+    history = pipeline.HomographyHistory(max_hold_ns=70_000_000)
+    sender = CollectingSender()
+    worker = pipeline.GazeWorker(None, history, sender, threading.Event(), max_delay_ns=50_000_000)
+    history.update(0, homography.solve_homography_4pt(corners_at(0)))
+    worker.process([Gaze(500, 300, True, t) for t in (10_000_000, 60_000_000, 200_000_000)], received_ns=0)
+    assert not sender.batches and worker.pending == 3  # Waiting for a later frame
+    worker.flush(now_ns=50_000_000)  # No frame came within max_delay_ns: the hold applies
+    assert worker.pending == 0
+    (timestamps, _), = sender.batches
+    assert list(timestamps) == [10_000_000, 60_000_000]  # 200 ms is beyond the hold
+
+
+class QueueDevice:
+    def __init__(self, items):
+        self.items = collections.deque(items)
+
+    def receive_gaze_datum(self, timeout_seconds=None):
+        return self.items.popleft() if self.items else None
+
+
+def test_gaze_is_stamped_when_the_intake_receives_it(monkeypatch):
+    clock = iter([1_000, 2_000])
+    monkeypatch.setattr(pipeline.latency.LatencyTracer, "now_ns", staticmethod(lambda: next(clock)))
+    intake = pipeline.GazeIntakeWorker(QueueDevice([Gaze(1, 2, True, 10), Gaze(3, 4, True, 20)]), threading.Event())
+    intake.step()
+    intake.step()
+    samples, received_ns = intake.drain(timeout_seconds=0)
+    assert [g.timestamp_unix_ns for g in samples] == [10, 20]
+    assert received_ns.tolist() == [1_000, 2_000]  # Arrival times, not the time the batch was drained
+
+    worker = pipeline.GazeWorker(intake, pipeline.HomographyHistory(), CollectingSender(), threading.Event())
+    worker.max_delay_ns = 10 ** 12  # Keep the samples pending
+    worker.process(samples, received_ns)
+    assert worker._pending_received.tolist() == [1_000, 2_000]
@@ -0,0 +1,41 @@
+import cv2
+import numpy as np
+
+import benchmarks
+import scene_change
+
+
+def _scene(shift=0.0, noise=0):
+    """Synthetic 800x600 scene, optionally translated by `shift` px and with uniform pixel noise."""
+    image, corners = benchmarks.make_synthetic_scene(800, 600, clutter=20, rng=np.random.default_rng(0))
+    if shift:
+        matrix = np.float32([[1, 0, shift], [0, 1, 0]])
+        image = cv2.warpAffine(image, matrix, (800, 600), borderMode=cv2.BORDER_REPLICATE)
+    if noise:
+        noisy = image.astype(np.int16) + np.random.default_rng(1).integers(-noise, noise + 1, image.shape)
+        image = np.clip(noisy, 0, 255).astype(np.uint8)
+    return image, corners
+
+
+def test_identical_frame_is_reused():
+    image, corners = _scene()
+    gate = scene_change.SceneChangeGate()
+    assert gate.has_changed(image, None)
+    assert not gate.has_changed(image.copy(), corners)
+    assert not gate.has_changed(_scene(noise=2)[0], corners)
+
+
+def test_small_quad_translation_is_not_reused():
+    image, corners = _scene()
+    gate = scene_change.SceneChangeGate()
+    assert gate.has_changed(image, None)
+    for shift in (2.0, 5.0, 10.0):
+        gate.reference = image
+        assert gate.has_changed(_scene(shift=shift)[0], corners), f"{shift} px shift was reused"
+
+
+def test_reuse_is_bounded():
+    image, corners = _scene()
+    gate = scene_change.SceneChangeGate(max_reuse=3)
+    results = [gate.has_changed(image, corners) for _ in range(9)]
+    assert results == [True, False, False, False] * 2 + [True]
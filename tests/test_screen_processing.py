@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+import benchmarks
+import screen_processing
+
+
+@pytest.mark.parametrize("scale", [1.0, 0.5])
+@pytest.mark.parametrize("params", [{}, {"blur_kernel_trackbar": 2, "canny_thr_1": 10, "canny_thr_2": 40}])
+def test_frozen_frame_matches_live_detector(scale, params):
+    image, _ = benchmarks.make_synthetic_scene(960, 720, clutter=10, rng=np.random.default_rng(1))
+    context = screen_processing.DetectorContext(**params)
+    live = context.detect_screen_corners(image, scale=scale)
+    frozen, score = screen_processing.FrozenFrame(image, scale=scale).detect(context)
+    assert live is not None and frozen is not None
+    np.testing.assert_array_equal(frozen, live)
+    assert score == context.last_score
+
+
+def test_frozen_frame_recomputes_only_downstream_stages():
+    image, _ = benchmarks.make_synthetic_scene(640, 480, rng=np.random.default_rng(2))
+    context = screen_processing.DetectorContext()
+    frozen = screen_processing.FrozenFrame(image)
+    frozen.detect(context)
+    assert frozen.last_recomputed == ["blur", "edges"]
+    context.canny_thr_2 += 5
+    frozen.detect(context)
+    assert frozen.last_recomputed == ["edges"]
+    context.approx_poly_epsilon_trackbar += 1
+    frozen.detect(context)
+    assert frozen.last_recomputed == []
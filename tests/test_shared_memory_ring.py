@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+import uuid
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+import gaze_sender_network as gsn
+
+
+def _ring_name():
+    return f"gaze_ring_test_{uuid.uuid4().hex[:8]}"
+
+
+def _send(writer, count):
+    timestamps_ns = np.arange(count, dtype=np.int64)
+    xy = np.ones((count, 2), dtype=np.float32)
+    writer.send_gaze_batch(timestamps_ns, xy, xy)
+
+
+def test_second_writer_fails_while_the_first_is_running():
+    name = _ring_name()
+    writer = gsn.SharedMemoryGazeWriter(name, capacity=16)
+    try:
+        _send(writer, 5)
+        with pytest.raises(FileExistsError, match=str(os.getpid())):
+            gsn.SharedMemoryGazeWriter(name, capacity=16)
+        reader = gsn.SharedMemoryGazeReader(name)
+        assert reader.write_sequence == 5  # The live ring was left alone
+        reader.close()
+    finally:
+        writer.close()
+
+
+def test_foreign_segment_is_not_removed():
+    name = _ring_name()
+    foreign = shared_memory.SharedMemory(name, create=True, size=256)
+    try:
+        with pytest.raises(FileExistsError, match="not a gaze ring"):
+            gsn.SharedMemoryGazeWriter(name, capacity=16)
+    finally:
+        foreign.close()
+        foreign.unlink()
+
+
+@pytest.mark.skipif(os.name != "posix", reason="Windows removes a segment with its last handle")
+def test_ring_of_a_dead_writer_is_replaced():
+    name = _ring_name()
+    # A writer process that exits without closing its ring (and without its resource tracker cleaning up)
+    code = ("import os, gaze_sender_network as g; from multiprocessing import resource_tracker;"
+            f"w = g.SharedMemoryGazeWriter({name!r}, capacity=16);"
+            "resource_tracker.unregister('/' + w.shm.name, 'shared_memory'); os._exit(0)")
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+    writer = gsn.SharedMemoryGazeWriter(name, capacity=32)
+    try:
+        reader = gsn.SharedMemoryGazeReader(name)
+        assert reader.capacity == 32 and reader.write_sequence == 0
+        reader.close()
+    finally:
+        writer.close()
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import tuner
+
+SQUARE = np.array([[0, 0], [100, 0], [100, 100], [0, 100]], dtype=np.float32)
+
+
+class ScriptedContext:
+    """Stands in for DetectorContext: each "image" is the offset of the quad to report, or None."""
+
+    def __init__(self, **params):
+        pass
+
+    def detect_screen_corners(self, image, scale):
+        return None if image is None else SQUARE + image
+
+
+def _evaluate(monkeypatch, clips):
+    monkeypatch.setattr(tuner.screen_processing, "DetectorContext", ScriptedContext)
+    monkeypatch.setattr(tuner, "_labeled", False)
+    monkeypatch.setattr(tuner, "_clips", [[(offset, None) for offset in clip] for clip in clips])
+    return tuner.evaluate({})[1]
+
+
+def test_jitter_is_measured_within_clips_only(monkeypatch):
+    # Each clip is steady, but the screen moved 500 px between the clips
+    stats = _evaluate(monkeypatch, [[0, 1, 2], [500, 501, 502]])
+    assert stats["error_px"] == pytest.approx(np.sqrt(2))  # Offsets move x and y
+    assert stats["detection_rate"] == 1.0
+
+
+def test_unstable_quads_do_not_count_as_detections(monkeypatch):
+    # A flickering false positive: a quad every frame, but never in the same place
+    stats = _evaluate(monkeypatch, [[0, 300, 0, 300], [None, 0, 200, None]])
+    assert stats["detection_rate"] == 0.0
+
+    # One stable pair plus an outlier and a miss
+    stats = _evaluate(monkeypatch, [[0, 2, 400, None]])
+    assert stats["detection_rate"] == 0.5
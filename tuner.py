@@ -0,0 +1,269 @@
+"""
+Offline tuner for the six screen-detection parameters.
+
+Evaluates parameter sets on recorded frames (a recording.py directory) or on
+labeled frames, in parallel, and writes the best one as a profile that
+data_sender loads with --params.
+
+Each candidate is scored from:
+  - detection rate (labeled frames: fraction of frames with the right answer),
+  - corner error against the labels, or for unlabeled recordings corner
+    jitter between consecutive frames of the same clip,
+  - median detection time per frame.
+The search samples the parameter space at random, then refines the best
+candidates by stepping each parameter up and down.
+
+Unlabeled recordings have no ground truth, so any quad could be a false
+positive. There a detection only counts when its quad stays within
+ERROR_SCALE_PX of the quad in a neighbouring frame of the same clip; this
+penalises flickering false positives, but a false positive that sits still
+(a door, a picture frame) still counts as a hit. Prefer labeled frames when
+they are available.
+
+Labels file: a JSON list of {"image": "frame.png", "corners": [[x, y] x4] or null},
+image paths relative to the labels file, corners ordered TL, TR, BR, BL.
+
+Usage:
+  python tuner.py REC_DIR -o profile.json
+  python tuner.py --labels labels.json -o profile.json
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+import recording
+import screen_processing
+
+# Trackbar ranges of the parameters (see UIManager.setup_trackbars)
+PARAM_RANGES = {
+    "canny_thr_1": (0, 255),
+    "canny_thr_2": (0, 255),
+    "blur_kernel_trackbar": (0, 4),
+    "approx_poly_epsilon_trackbar": (1, 50),
+    "aspect_ratio_tolerance_trackbar": (1, 30),
+    "min_area_percent_trackbar": (1, 50),
+}
+# Steps used by the refinement stage
+PARAM_STEPS = {
+    "canny_thr_1": 5,
+    "canny_thr_2": 10,
+    "blur_kernel_trackbar": 1,
+    "approx_poly_epsilon_trackbar": 2,
+    "aspect_ratio_tolerance_trackbar": 2,
+    "min_area_percent_trackbar": 2,
+}
+ERROR_SCALE_PX = 10.0  # Corner error or jitter at which the error penalty saturates
+COST_SCALE_MS = 10.0
+
+
+# --- Worker side ---
+_clips = None  # Lists of (image, label corners or None); recordings give runs of consecutive frames
+_labeled = False
+_scale = 0.5
+
+
+def _init_worker(source, scale):
+    global _clips, _labeled, _scale
+    cv2.setNumThreads(1)  # The pool already uses every core
+    _scale = scale
+    kind, value = source
+    if kind == "recording":
+        path, clips = value
+        frames = recording.load_recording(path)[0]  # A memmap: workers share the page cache
+        _clips = [[(frames[i], None) for i in clip] for clip in clips]
+        _labeled = False
+    else:
+        _clips = [[(cv2.imread(image_path), corners) for image_path, corners in value]]
+        _labeled = True
+
+
+def _motion(a, b):
+    """Mean corner motion between two quads in pixels, or None if either is missing."""
+    if a is None or b is None:
+        return None
+    return float(np.linalg.norm(b - a, axis=1).mean())
+
+
+def evaluate(params):
+    """Runs detection with `params` on every frame; returns the raw statistics."""
+    context = screen_processing.DetectorContext(**params)
+    durations = []
+    found = []  # Detected corners per clip
+    for clip in _clips:
+        found.append([])
+        for image, _ in clip:
+            start = time.perf_counter()
+            found[-1].append(context.detect_screen_corners(image, scale=_scale))
+            durations.append(time.perf_counter() - start)
+
+    frame_count = sum(len(clip) for clip in _clips)
+    stats = {"cost_ms": float(np.median(durations) * 1e3)}
+    if _labeled:
+        correct = 0
+        errors = []
+        for clip_found, clip in zip(found, _clips):
+            for corners, (_, truth) in zip(clip_found, clip):
+                if truth is None:
+                    correct += corners is None
+                elif corners is not None:
+                    error = float(np.linalg.norm(corners - truth, axis=1).max())
+                    errors.append(error)
+                    correct += error <= ERROR_SCALE_PX
+        stats["detection_rate"] = correct / frame_count
+        stats["error_px"] = float(np.mean(errors)) if errors else ERROR_SCALE_PX
+    else:
+        stable = 0
+        jitter = []
+        for clip_found in found:
+            # Jitter: corner motion between consecutive frames of the clip where both were detected
+            motion = [_motion(a, b) for a, b in zip(clip_found, clip_found[1:])]
+            jitter += [m for m in motion if m is not None]
+            if len(clip_found) == 1:
+                stable += clip_found[0] is not None  # Nothing to compare a lone frame with
+                continue
+            # A detection is a hit only if it agrees with a neighbouring detection
+            for i in range(len(clip_found)):
+                around = motion[max(i - 1, 0):i + 1]
+                stable += any(m is not None and m <= ERROR_SCALE_PX for m in around)
+        stats["detection_rate"] = stable / frame_count
+        stats["error_px"] = float(np.median(jitter)) if jitter else ERROR_SCALE_PX
+    return params, stats
+
+
+def score(stats, cost_weight):
+    """Higher is better: detection rate minus error and cost penalties."""
+    error_penalty = 0.5 * min(stats["error_px"] / ERROR_SCALE_PX, 1.0)
+    return stats["detection_rate"] - error_penalty - cost_weight * stats["cost_ms"] / COST_SCALE_MS
+
+
+# --- Search ---
+def random_params(rng):
+    params = {name: int(rng.integers(lo, hi + 1)) for name, (lo, hi) in PARAM_RANGES.items()}
+    if params["canny_thr_1"] > params["canny_thr_2"]:
+        params["canny_thr_1"], params["canny_thr_2"] = params["canny_thr_2"], params["canny_thr_1"]
+    return params
+
+
+def neighbours(params):
+    """Parameter sets one step away from `params` in a single parameter."""
+    for name, step in PARAM_STEPS.items():
+        lo, hi = PARAM_RANGES[name]
+        for delta in (-step, step):
+            value = min(hi, max(lo, params[name] + delta))
+            if value != params[name]:
+                yield {**params, name: value}
+
+
+def _key(params):
+    return tuple(params[name] for name in screen_processing.DEFAULT_PARAMS)
+
+
+def tune(source, samples=200, refine_rounds=3, top_k=4, cost_weight=0.05, scale=0.5, workers=None,
+         start_params=None, seed=0):
+    """Returns (best params, best stats, best score)."""
+    rng = np.random.default_rng(seed)
+    evaluated = {}  # params key -> (params, stats, score)
+
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                initargs=(source, scale)) as pool:
+        def run(candidates):
+            candidates = [c for c in {_key(c): c for c in candidates}.values() if _key(c) not in evaluated]
+            for params, stats in pool.map(evaluate, candidates):
+                evaluated[_key(params)] = (params, stats, score(stats, cost_weight))
+
+        baseline = start_params or dict(screen_processing.DEFAULT_PARAMS)
+        run([baseline] + [random_params(rng) for _ in range(samples)])
+        print(f"Random search: {len(evaluated)} candidates evaluated, "
+              f"best score {max(s for _, _, s in evaluated.values()):.3f}")
+
+        for round_index in range(refine_rounds):
+            best = sorted(evaluated.values(), key=lambda e: e[2], reverse=True)[:top_k]
+            before = len(evaluated)
+            run([n for params, _, _ in best for n in neighbours(params)])
+            top_score = max(s for _, _, s in evaluated.values())
+            print(f"Refinement round {round_index + 1}: {len(evaluated) - before} new candidates, "
+                  f"best score {top_score:.3f}")
+            if len(evaluated) == before:
+                break
+
+    best_params, best_stats, best_score = max(evaluated.values(), key=lambda e: e[2])
+    _, baseline_stats, baseline_score = evaluated[_key(baseline)]
+    print(f"Starting parameters: score {baseline_score:.3f} {_format_stats(baseline_stats)}")
+    print(f"Best parameters:     score {best_score:.3f} {_format_stats(best_stats)}")
+    return best_params, best_stats, best_score
+
+
+def _format_stats(stats):
+    return (f"(detection rate {stats['detection_rate']:.2f}, error {stats['error_px']:.2f} px, "
+            f"{stats['cost_ms']:.2f} ms/frame)")
+
+
+def recording_source(path, clips=12, clip_length=5):
+    """
+    Samples `clips` runs of `clip_length` consecutive frames spread over the
+    recording, so jitter is measured between neighbouring frames.
+    """
+    frame_count = len(recording.load_recording(path)[0])
+    if frame_count == 0:
+        raise ValueError(f"No frames in {path}")
+    clip_length = min(clip_length, frame_count)
+    starts = np.linspace(0, frame_count - clip_length, min(clips, frame_count // clip_length)).astype(int)
+    clips = [list(range(int(s), int(s) + clip_length)) for s in starts]
+    return ("recording", (path, clips)), sum(len(clip) for clip in clips)
+
+
+def labels_source(path):
+    with open(path) as f:
+        labels = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    entries = [(os.path.join(base, entry["image"]),
+                None if entry.get("corners") is None else np.array(entry["corners"], dtype=np.float32))
+               for entry in labels]
+    return ("labels", entries), len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune the screen detection parameters offline.")
+    parser.add_argument("recording", nargs="?", help="Recording directory from recording.py.")
+    parser.add_argument("--labels", help="JSON labels file (see module docstring) instead of a recording.")
+    parser.add_argument("-o", "--output", required=True, help="Profile to write, loadable with data_sender --params.")
+    parser.add_argument("--params", help="Starting parameters/profile to compare against (default: built-in defaults).")
+    parser.add_argument("--samples", type=int, default=200, help="Random candidates to evaluate (default 200).")
+    parser.add_argument("--refine-rounds", dest="refine_rounds", type=int, default=3,
+                        help="Local refinement rounds around the best candidates (default 3).")
+    parser.add_argument("--cost-weight", dest="cost_weight", type=float, default=0.05,
+                        help=f"Score penalty per {COST_SCALE_MS:g} ms of detection time (default 0.05).")
+    parser.add_argument("--scale", type=float, default=0.5,
+                        help="Detection pyramid scale, as used by data_sender (default 0.5).")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: all cores).")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the search.")
+    args = parser.parse_args(argv)
+    if bool(args.recording) == bool(args.labels):
+        parser.error("give either a recording directory or --labels")
+
+    source, frame_count = labels_source(args.labels) if args.labels else recording_source(args.recording)
+    print(f"Tuning on {frame_count} frames from {args.labels or args.recording}")
+
+    start_params = None
+    if args.params:
+        context = screen_processing.DetectorContext()
+        context.load_params(args.params)
+        start_params = context.get_params()
+
+    best_params, best_stats, best_score = tune(source, args.samples, args.refine_rounds,
+                                               cost_weight=args.cost_weight, scale=args.scale,
+                                               workers=args.workers, start_params=start_params, seed=args.seed)
+    screen_processing.DetectorContext(**best_params).save_params(
+        args.output, score=round(best_score, 4), stats={k: round(v, 4) for k, v in best_stats.items()},
+        source=args.labels or args.recording, frames=frame_count, scale=args.scale,
+        tuned_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+    print(f"Profile written to {args.output}: {best_params}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
 \
+import threading
+import time
+
 import cv2
 import numpy as np
 
+import screen_processing
+
 class UIManager:
     def __init__(self, window_name="Live Video Feed + Gaze Sender"):
         self.window_name = window_name
@@ -28,8 +33,9 @@ class UIManager:
         """Displays the image in the OpenCV window."""
         cv2.imshow(self.window_name, image)
 
-    def draw_detection_info(self, display_img, detected_corners, homography_valid):
-        """Draws screen detection status, corners, and labels on the image."""
+    def draw_detection_info(self, display_img, detected_corners, homography_valid, homography_score=None,
+                            corner_std=None):
+        """Draws screen detection status, corners, labels and homography quality on the image."""
         if detected_corners is not None:
             cv2.polylines(display_img, [detected_corners.astype(np.int32)], True, (0, 255, 0), 2)
             corner_labels = ["TL", "TR", "BR", "BL"]
@@ -45,6 +51,10 @@ class UIManager:
             else:
                 cv2.putText(display_img, "Screen Detected. Homography Failed.", (10, 30), 
                             cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 165, 255), 2) # orange
+            if homography_score is not None:
+                std_text = f"  corner std: {corner_std:.1f} px" if corner_std is not None else ""
+                cv2.putText(display_img, f"H quality: {homography_score:.2f}{std_text}", (10, 60),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
         else:
             cv2.putText(display_img, "No screen detected. Adjust parameters.", (10, 30), 
                         cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
@@ -61,6 +71,128 @@ class UIManager:
 
     def show_instructions(self):
         print("\nPress 'q' to quit.")
+        print("Press 'f' to freeze/unfreeze the current frame while tuning.")
         print("Adjust trackbars to tune detection parameters.")
         print("Gaze data will be sent only when the screen is detected and homography is computed.")
 
+
+class PreviewRenderer(threading.Thread):
+    """
+    Renders the preview on its own thread from the latest detection result.
+    The window, trackbars and key handling all live on this thread (HighGUI
+    needs them on the thread that calls waitKey), so the detection and gaze
+    path never waits on drawing or imshow.
+    result_source: object with get(timeout) returning the latest result,
+    e.g. the pipeline's results queue.
+    preview_fps: maximum preview rate; frames arriving faster are skipped.
+    downscale: factor applied to the frame before drawing (1.0 = full resolution).
+    on_quit: called when 'q' is pressed.
+    detector_context / detection_scale: enable the freeze-frame mode ('f'),
+    which holds the current frame and reruns detection on it with the
+    context's parameters whenever a trackbar moves, reusing the cached
+    stages that the change does not affect (see FrozenFrame).
+    """
+    def __init__(self, result_source, window_name="Live Video Feed + Gaze Sender",
+                 trackbar_params=None, trackbar_callbacks=None,
+                 preview_fps=15.0, downscale=0.5, on_quit=None,
+                 detector_context=None, detection_scale=1.0):
+        super().__init__(name="PreviewRenderer", daemon=True)
+        self.result_source = result_source
+        self.window_name = window_name
+        self.trackbar_params = trackbar_params
+        self.trackbar_callbacks = trackbar_callbacks
+        self.period = 1.0 / preview_fps
+        self.downscale = downscale
+        self.on_quit = on_quit
+        self.stop_event = threading.Event()
+        self.detector_context = detector_context
+        self.detection_scale = detection_scale
+        self._preview_img = None  # Reused preview buffer
+        self._last_result = None
+        self._frozen = None  # FrozenFrame while the freeze-frame mode is on
+        self._frozen_params = None  # Parameters the frozen frame was last rendered with
+
+    def stop(self, timeout=2.0):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def render(self, result):
+        """Downscales the frame into the preview buffer and draws the detection overlay."""
+        return self._draw(result.image, result.corners, result.homography_valid, result.homography_score,
+                          result.corner_std)
+
+    def _draw(self, image, corners, homography_valid, homography_score, corner_std=None):
+        h, w = image.shape[:2]
+        size = (max(1, int(w * self.downscale)), max(1, int(h * self.downscale)))
+        if self._preview_img is None or self._preview_img.shape[:2] != (size[1], size[0]):
+            self._preview_img = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        # Resizing writes into our own buffer, so the original frame is never drawn on
+        cv2.resize(image, size, dst=self._preview_img, interpolation=cv2.INTER_NEAREST)
+
+        if corners is not None:
+            corners = corners * self.downscale
+        return self.ui.draw_detection_info(self._preview_img, corners, homography_valid, homography_score,
+                                           corner_std)
+
+    def toggle_freeze(self):
+        if self._frozen is not None:
+            self._frozen = None
+            print("Frame unfrozen.")
+        elif self.detector_context is not None and self._last_result is not None:
+            self._frozen = screen_processing.FrozenFrame(self._last_result.image, scale=self.detection_scale)
+            self._frozen_params = None
+            print("Frame frozen. Trackbar changes now rerun detection on this frame only.")
+
+    def render_frozen(self):
+        """Reruns detection on the frozen frame if a parameter changed; returns None otherwise."""
+        params = self.detector_context.get_params()
+        if params == self._frozen_params:
+            return None
+        self._frozen_params = params
+        corners, score = self._frozen.detect(self.detector_context)
+        image = self._draw(self._frozen.image, corners, corners is not None, None)
+        recomputed = ", ".join(self._frozen.last_recomputed) or "nothing"
+        cv2.putText(image, f"FROZEN ('f' to resume)  quad score {score:.2f}  recomputed: {recomputed} "
+                           f"({self._frozen.last_duration * 1000:.1f} ms)",
+                    (10, image.shape[0] - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
+        return image
+
+    def run(self):
+        self.ui = UIManager(self.window_name)
+        try:
+            if self.trackbar_params:
+                self.ui.setup_trackbars(self.trackbar_params, self.trackbar_callbacks)
+            self.ui.show_instructions()
+
+            next_render = time.monotonic()
+            while not self.stop_event.is_set():
+                now = time.monotonic()
+                if now >= next_render:
+                    next_render = now + self.period
+                    if self._frozen is not None:
+                        image = self.render_frozen()
+                        if image is not None:
+                            self.ui.display_image(image)
+                    else:
+                        result = self.result_source.get(timeout=0)
+                        if result is not None:
+                            self._last_result = result
+                            self.ui.display_image(self.render(result))
+
+                # waitKey both pumps window events and paces the loop until the next render
+                delay_ms = max(1, int((next_render - time.monotonic()) * 1000))
+                key = self.ui.get_keypress(delay_ms)
+                if key == ord('q'):
+                    print("Quitting...")
+                    if self.on_quit:
+                        self.on_quit()
+                    break
+                if key == ord('f'):
+                    self.toggle_freeze()
+        except Exception as e:
+            print(f"An error occurred in preview renderer: {e}")
+            if self.on_quit:
+                self.on_quit()
+        finally:
+            self.ui.destroy_windows()